@@ -1,4 +1,9 @@
 import inspect
+import re
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Iterable, List, Optional, Tuple
 
 import pyparsing as pp
 from pyparsing import pyparsing_common as ppc
@@ -6,6 +11,10 @@ from pyparsing import pyparsing_common as ppc
 from ast_nodes import *
 
 
+# пробелы и комментарии перед лексемой
+_SKIP = re.compile(r'(?:\s|/\*[\s\S]*?\*/|//[^\n]*)*')
+
+
 # создает и настраивает парсер
 def make_parser():
     IF = pp.Keyword('if')
@@ -24,12 +33,11 @@ def make_parser():
     SEMI, COMMA = pp.Literal(';').suppress(), pp.Literal(',').suppress()
     ASSIGN = pp.Literal('=')
 
-    ADD, SUB = pp.Literal('+'), pp.Literal('-')
-    MULT, DIV, MOD = pp.Literal('*'), pp.Literal('/'), pp.Literal('%')
-    AND = pp.Literal('&&')
-    OR = pp.Literal('||')
-    GE, LE, GT, LT = pp.Literal('>='), pp.Literal('<='), pp.Literal('>'), pp.Literal('<')
-    NOTEQUALS, EQUALS = pp.Literal('!='), pp.Literal('==')
+    # все бинарные операции одной лексемой (более длинные операции раньше их префиксов)
+    # (операция, приоритет и позиция за ней - с нее начинается правый операнд)
+    BINARY_OP = pp.Regex('&&|\\|\\||>=|<=|!=|==|[><*/%+-]').setParseAction(
+        lambda s, loc, tocs: (*_OPERATIONS[tocs[0]], loc + len(tocs[0]))
+    )
 
     expr = pp.Forward()
     stmt = pp.Forward()
@@ -44,14 +52,11 @@ def make_parser():
             LPAR + expr + RPAR
     )
 
-    mult = pp.Group(group + pp.ZeroOrMore((MULT | DIV | MOD) + group)).setName('binary_operation')
-    add = pp.Group(mult + pp.ZeroOrMore((ADD | SUB) + mult)).setName('binary_operation')
-    compare1 = pp.Group(add + pp.Optional((GE | LE | GT | LT) + add)).setName('binary_operation')
-    compare2 = pp.Group(compare1 + pp.Optional((EQUALS | NOTEQUALS) + compare1)).setName('binary_operation')
-    logical_and = pp.Group(compare2 + pp.ZeroOrMore(AND + compare2)).setName('binary_operation')
-    logical_or = pp.Group(logical_and + pp.ZeroOrMore(OR + logical_and)).setName('binary_operation')
+    # операнды и операции выражения разбираются одним правилом без вложенных групп,
+    # дерево с учетом приоритетов строится в действии разбора (см. _climb)
+    binary_operation = group + pp.ZeroOrMore(BINARY_OP + group)
 
-    expr << logical_or
+    expr << binary_operation
 
     simple_assign = (ident + ASSIGN.suppress() + expr).setName('assign')
     var_inner = simple_assign | ident
@@ -98,15 +103,17 @@ def make_parser():
             rule_name = parser_element.name
         if rule_name in ('binary_operation',):
             def binary_operation_parse_action(s, loc, tocs):
-                node = tocs[0]
-                if not isinstance(node, AstNode):
-                    node = binary_operation_parse_action(s, loc, node)
-                for i in range(1, len(tocs) - 1, 2):
-                    second_node = tocs[i + 1]
-                    if not isinstance(second_node, AstNode):
-                        second_node = binary_operation_parse_action(s, loc, second_node)
-                    node = BinOpNode(BinaryOperation(tocs[i]), node, second_node, loc=loc)
-                return node
+                # выражение без операций (самый частый случай)
+                if len(tocs) == 1:
+                    return tocs[0]
+                if len(tocs) == 3:
+                    row, col = position(loc)
+                    return BinOpNode(tocs[1][0], tocs[0], tocs[2], row=row, col=col, loc=loc)
+                # операнд и позиция его начала: первого - начало выражения, остальных - конец операции перед ним
+                operands = [(tocs[0], loc)]
+                for i in range(1, len(tocs), 2):
+                    operands.append((tocs[i + 1], tocs[i][2]))
+                return _climb(s, loc, operands, tocs[1::2], 0, 0)[0]
 
             parser_element.setParseAction(binary_operation_parse_action)
         else:
@@ -115,10 +122,15 @@ def make_parser():
                 cls = eval(cls)
                 if not inspect.isabstract(cls):
                     def parse_action(s, loc, tocs):
+                        row, col = position(loc)
                         if cls is FuncNode:
-                            return FuncNode(tocs[0], tocs[1], tocs[2:-1], tocs[-1], loc=loc)
+                            return FuncNode(tocs[0], tocs[1], tocs[2:-1], tocs[-1], row=row, col=col, loc=loc)
+                        elif cls is IdentNode:
+                            # кроме позиции узла запоминается позиция первого символа имени
+                            name_row, name_col = position(_SKIP.match(s, loc).end() - 1)
+                            return IdentNode(*tocs, row=row, col=col, name_row=name_row, name_col=name_col, loc=loc)
                         else:
-                            return cls(*tocs, loc=loc)
+                            return cls(*tocs, row=row, col=col, loc=loc)
 
                     parser_element.setParseAction(parse_action)
 
@@ -126,39 +138,102 @@ def make_parser():
         if isinstance(value, pp.ParserElement):
             set_parse_action_magic(var_name, value)
 
+    # позиции считаются по исходному тексту, поэтому табуляции не раскрываются;
+    # грамматика подготавливается заранее, чтобы параллельные разборы ее не изменяли
+    start.parseWithTabs()
+    start.streamline()
+    for e in start.ignoreExprs:
+        e.streamline()
+
     return start
 
 
-parser = make_parser()
+# операция -> (BinaryOperation, приоритет); сравнения не ассоциативны
+_OPERATIONS = {
+    '*': (BinaryOperation.MULT, 6), '/': (BinaryOperation.DIV, 6), '%': (BinaryOperation.MOD, 6),
+    '+': (BinaryOperation.ADD, 5), '-': (BinaryOperation.SUB, 5),
+    '>=': (BinaryOperation.GE, 4), '<=': (BinaryOperation.LE, 4),
+    '>': (BinaryOperation.GT, 4), '<': (BinaryOperation.LT, 4),
+    '==': (BinaryOperation.EQUALS, 3), '!=': (BinaryOperation.NOTEQUALS, 3),
+    '&&': (BinaryOperation.LOGICAL_AND, 2),
+    '||': (BinaryOperation.LOGICAL_OR, 1),
+}
+_NONASSOC = (4, 3)
+
+
+# построение дерева бинарных операций методом восхождения по приоритетам, начиная с операнда i;
+# возвращает узел и индекс первой не вошедшей в него операции.
+# Узлы получают те же формы и позиции, что и при разборе вложенными группами по уровням приоритета
+def _climb(s: str, loc: int, operands: List[Tuple[AstNode, int]], ops: List[Tuple[BinaryOperation, int, int]],
+           i: int, min_prec: int) -> Tuple[AstNode, int]:
+    node, node_loc = operands[i]
+    row = col = None
+    while i < len(ops):
+        op, prec, _ = ops[i]
+        if prec < min_prec:
+            break
+        arg2, i = _climb(s, loc, operands, ops, i + 1, prec + 1)
+        if row is None:
+            row, col = position(node_loc)
+        node = BinOpNode(op, node, arg2, row=row, col=col, loc=node_loc)
+        if prec in _NONASSOC and i < len(ops) and ops[i][1] == prec:
+            raise pp.ParseException(s, loc, 'Цепочка сравнений без скобок ({} {})'.format(op, ops[i][0]))
+    return node, i
+
+
+# контекст одного вызова parse: по нему вычисляются строка и столбец узлов
+class ParseContext:
+
+    def __init__(self, prog: str, row: int = 0, col: int = 0, guard=None) -> None:
+        self.row = row
+        self.col = col
+        # бюджет разбора (limits.Guard), которому сообщается о каждом созданном узле
+        self.guard = guard
+        self.newlines = [i for i, ch in enumerate(prog) if ch == '\n'] if '\n' in prog else []
+        self.returns = [i for i, ch in enumerate(prog) if ch == '\r'] if '\r' in prog else []
+
+    # строка и столбец (с 1) символа, следующего за символом с индексом loc
+    # (действиям разбора передается позиция перед пробелами, предшествующими конструкции)
+    def position(self, loc: int) -> Tuple[int, int]:
+        line = bisect_right(self.newlines, loc)
+        if line == 0:
+            start, col = -1, self.col
+        else:
+            start, col = self.newlines[line - 1], 0
+        col += loc - start
+        if self.returns:
+            col -= bisect_right(self.returns, loc) - bisect_right(self.returns, start)
+        return self.row + line + 1, col + 1
 
 
-# разбирает переданный программный код и возвращает соответствующее AST
-def parse(prog: str):
-    locs = []
-    row, col = 0, 0
-    for ch in prog:
-        if ch == '\n':
-            row += 1
-            col = 0
-        elif ch == '\r':
-            pass
-        else:
-            col += 1
-        locs.append((row, col))
+_context: ContextVar[ParseContext] = ContextVar('parse_context')
 
-    previous_init_action = AstNode.init_action
 
-    # установка строки и столбца в узле AST
-    def init_action(node: AstNode):
-        loc = getattr(node, 'loc', None)
-        if isinstance(loc, int):
-            node.row = locs[loc][0] + 1
-            node.col = locs[loc][1] + 1
+# позиция вычисляется для каждого создаваемого узла, поэтому здесь же учитывается бюджет разбора
+def position(loc: int) -> Tuple[int, int]:
+    context = _context.get()
+    if context.guard is not None:
+        context.guard.tick()
+    return context.position(loc)
 
-    AstNode.init_action = init_action
+
+parser = make_parser()
+
+
+# разбирает переданный программный код и возвращает соответствующее AST,
+# row и col - строка и столбец (с 0) начала фрагмента, если разбирается часть файла,
+# guard - бюджет разбора (см. limits.parse)
+def parse(prog: str, row: int = 0, col: int = 0, guard=None):
+    token = _context.set(ParseContext(prog, row, col, guard))
     try:
-        prog: StmtListNode = parser.parseString(str(prog))[0]
+        prog: StmtListNode = parser.parseString(prog)[0]
         prog.program = True
         return prog
     finally:
-        AstNode.init_action = previous_init_action
+        _context.reset(token)
+
+
+# разбирает несколько программ параллельно в пуле потоков, результаты в порядке исходных программ
+def parse_many(progs: Iterable[str], workers: Optional[int] = None) -> List[StmtListNode]:
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(parse, progs))
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from contextlib import suppress
-from typing import Optional, Union, Tuple, Callable
+from typing import Optional, Union, Tuple
 
 from semantic import TYPE_CONVERTIBILITY, BINARY_OPERATION_TYPE_COMPATIBILITY, BinaryOperation, \
     DataType, IdentDesc, VariableScope, IdentScope, SemanticException
@@ -8,7 +8,6 @@ from semantic import TYPE_CONVERTIBILITY, BINARY_OPERATION_TYPE_COMPATIBILITY, B
 
 # абстрактный класс для узла дерева
 class AstNode(ABC):
-    init_action: Callable[['AstNode'], None] = None
 
     def __init__(self, row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__()
@@ -16,8 +15,6 @@ class AstNode(ABC):
         self.col = col
         for k, v in props.items():
             setattr(self, k, v)
-        if AstNode.init_action is not None:
-            AstNode.init_action(self)
         self.node_type: Optional[DataType] = None
         self.node_ident: Optional[IdentDesc] = None
 
@@ -58,6 +55,19 @@ class AstNode(ABC):
             r.extend(((ch0 if j == 0 else ch) + ' ' + s for j, s in enumerate(child.tree)))
         return tuple(r)
 
+    # представление дерева в виде словарей (для вывода в JSON)
+    def to_dict(self) -> dict:
+        r = {'node': self.to_str(), 'row': self.row, 'col': self.col}
+        if self.node_type:
+            r['type'] = str(self.node_type)
+        if self.node_ident:
+            r['ident'] = {'name': self.node_ident.name, 'scope': str(self.node_ident.scope),
+                          'index': self.node_ident.index, 'built_in': self.node_ident.built_in}
+        childs = self.childs
+        if childs:
+            r['childs'] = [child.to_dict() for child in childs]
+        return r
+
     def __getitem__(self, index):
         return self.childs[index] if index < len(self.childs) else None
 
@@ -93,7 +103,7 @@ class LiteralNode(ExprNode):
         super().__init__(row=row, col=col, **props)
         self.literal = literal
         if literal in ('true', 'false'):
-            self.value = bool(literal)
+            self.value = literal == 'true'
         else:
             self.value = eval(literal)
 
@@ -118,19 +128,26 @@ class LiteralNode(ExprNode):
 class IdentNode(ExprNode):
 
     def __init__(self, name: str,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
+                 row: Optional[int] = None, col: Optional[int] = None,
+                 name_row: Optional[int] = None, name_col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.name = str(name)
+        # позиция первого символа имени (row, col, как и у остальных узлов, - символ после
+        # предыдущей лексемы); используется для поиска идентификатора по позиции (xref)
+        self.name_row = name_row if name_row is not None else row
+        self.name_col = name_col if name_col is not None else col
 
     def __str__(self) -> str:
         return str(self.name)
 
     def semantic_check(self, scope: IdentScope) -> None:
         ident = scope.get_ident(self.name)
-        if ident is None:
+        if ident is None or not scope.visible(ident):
             self.semantic_error('Идентификатор {} не найден'.format(self.name))
         self.node_type = ident.type
         self.node_ident = ident
+        if scope.xref is not None:
+            scope.xref.add_reference(ident, self, scope)
 
 
 # класс для типов данных
@@ -251,6 +268,8 @@ class CallNode(ExprNode):
             self.func.node_type = func.type
             self.func.node_ident = func
             self.node_type = func.type.return_type
+            if scope.xref is not None:
+                scope.xref.add_call(func, self.func, scope)
 
 
 # конвертация типов данных
@@ -338,14 +357,27 @@ class VarsNode(StmtNode):
     def childs(self) -> Tuple[AstNode, ...]:
         return self.vars
 
+    # объявление переменных в области видимости (без проверки присваиваемых значений)
+    def declare(self, scope: IdentScope) -> None:
+        self.type.semantic_check(scope)
+        for var in self.vars:
+            self._declare_var(var.var if isinstance(var, AssignNode) else var, scope)
+
+    def _declare_var(self, var_node: IdentNode, scope: IdentScope) -> None:
+        try:
+            var_node.node_ident = scope.add_ident(IdentDesc(var_node.name, self.type.type))
+        except SemanticException as e:
+            var_node.semantic_error(e.message)
+        if scope.xref is not None:
+            scope.xref.add_declaration(var_node.node_ident, var_node, scope)
+
     def semantic_check(self, scope: IdentScope) -> None:
         self.type.semantic_check(scope)
         for var in self.vars:
             var_node: IdentNode = var.var if isinstance(var, AssignNode) else var
-            try:
-                scope.add_ident(IdentDesc(var_node.name, self.type.type))
-            except SemanticException as e:
-                var_node.semantic_error(e.message)
+            # глобальные переменные уже могли быть объявлены при поднятии объявлений
+            if var_node.node_ident is None or scope.idents.get(var_node.name) is not var_node.node_ident:
+                self._declare_var(var_node, scope)
             var.semantic_check(scope)
         self.node_type = DataType.VOID
 
@@ -454,6 +486,8 @@ class ParamNode(StmtNode):
             self.name.node_ident = scope.add_ident(IdentDesc(self.name.name, self.type.type, VariableScope.PARAM))
         except SemanticException:
             raise self.name.semantic_error('Параметр {} уже объявлен'.format(self.name.name))
+        if scope.xref is not None:
+            scope.xref.add_declaration(self.name.node_ident, self.name, scope)
         self.node_type = DataType.VOID
 
 
@@ -475,29 +509,40 @@ class FuncNode(StmtNode):
     def childs(self) -> Tuple[AstNode, ...]:
         return _GroupNode(str(self.type), self.name), _GroupNode('params', *self.params), self.body
 
-    def semantic_check(self, scope: IdentScope) -> None:
-        if scope.curr_func:
-            self.semantic_error("Объявление функции ({}) внутри другой функции не поддерживается".format(self.name.name))
-        parent_scope = scope
+    # тип функции по ее сигнатуре
+    def signature(self, scope: IdentScope) -> DataType:
         self.type.semantic_check(scope)
-        scope = IdentScope(scope)
-
-        # временно хоть какое-то значение, чтобы при добавлении параметров находить scope функции
-        scope.func = EMPTY_IDENT
         params = []
         for param in self.params:
-            # при проверке параметров происходит их добавление в scope
-            param.semantic_check(scope)
+            param.type.semantic_check(scope)
             params.append(param.type.type)
+        return DataType(None, self.type.type, tuple(params))
 
-        type_ = DataType(None, self.type.type, tuple(params))
+    # объявление функции в глобальной области видимости по ее сигнатуре (без проверки тела)
+    def declare(self, scope: IdentScope) -> IdentDesc:
+        if scope.curr_func:
+            self.semantic_error("Объявление функции ({}) внутри другой функции не поддерживается".format(self.name.name))
+        type_ = self.signature(scope)
         func_ident = IdentDesc(self.name.name, type_)
-        scope.func = func_ident
         self.name.node_type = type_
         try:
-            self.name.node_ident = parent_scope.curr_global.add_ident(func_ident)
+            self.name.node_ident = scope.curr_global.add_ident(func_ident)
         except SemanticException:
             self.name.semantic_error("Повторное объявление функции {}".format(self.name.name))
+        if scope.xref is not None:
+            scope.xref.add_function(func_ident, self, scope)
+        return func_ident
+
+    def semantic_check(self, scope: IdentScope) -> None:
+        func_ident = self.name.node_ident
+        # функции верхнего уровня объявляются заранее, при поднятии объявлений
+        if func_ident is None or scope.curr_global.idents.get(self.name.name) is not func_ident:
+            func_ident = self.declare(scope)
+        scope = IdentScope(scope)
+        scope.func = func_ident
+        for param in self.params:
+            # при проверке параметров происходит их добавление в scope
+            param.semantic_check(scope)
         self.body.semantic_check(scope)
         self.node_type = DataType.VOID
 
@@ -514,14 +559,38 @@ class StmtListNode(StmtNode):
     def __str__(self) -> str:
         return '...'
 
+    # пустой список операторов сохраняется по ссылке на EMPTY_STMT, т.к. с ним сравнивают по идентичности
+    def __reduce_ex__(self, protocol):
+        if self is EMPTY_STMT:
+            return 'EMPTY_STMT'
+        return super().__reduce_ex__(protocol)
+
     @property
     def childs(self) -> Tuple[StmtNode, ...]:
         return self.exprs
 
+    # поднятие объявлений: все функции и глобальные переменные верхнего уровня объявляются
+    # до проверки операторов. Функции можно вызывать до места их объявления, а переменные
+    # доступны только начиная с объявляющего оператора (см. IdentScope.visible)
+    def hoist(self, scope: IdentScope) -> None:
+        for i, expr in enumerate(self.exprs):
+            if isinstance(expr, FuncNode):
+                expr.declare(scope)
+            elif isinstance(expr, VarsNode):
+                expr.declare(scope)
+                for var in expr.vars:
+                    scope.declared_at[(var.var if isinstance(var, AssignNode) else var).node_ident] = i
+
     def semantic_check(self, scope: IdentScope) -> None:
-        if not self.program:
+        if self.program:
+            self.hoist(scope)
+        else:
             scope = IdentScope(scope)
-        for expr in self.exprs:
+        for i, expr in enumerate(self.exprs):
+            if scope.guard is not None:
+                scope.guard.check_time(expr)
+            if self.program:
+                scope.statement = i
             expr.semantic_check(scope)
         self.node_type = DataType.VOID
 
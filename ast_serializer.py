@@ -0,0 +1,456 @@
+import io
+import json
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Type, Union
+
+import semantic
+from ast_nodes import AstNode, IdentNode, EMPTY_STMT
+from ast_utils import NODE_FIELDS, NODE, NODES, STR, OP, TYPE, VALUE, BOOL
+from semantic import BinaryOperation, DataType, IdentDesc, PrimitiveType, VariableScope
+
+
+# Двоичный формат AST
+#
+# Файл: MAGIC, версия (varint), далее записи корневых узлов. Все целые числа - varint
+# (знаковые - в zigzag-кодировании). Строки, типы, описания идентификаторов и классы узлов
+# хранятся в таблицах, которые заполняются по мере записи: при первом использовании значение
+# записывается прямо на месте ссылки и получает следующий номер, дальше на него ссылаются по номеру.
+# Поэтому писать можно потоково, без предварительного прохода по дереву.
+#
+# Ссылка на узел: 0 - None, 1 - EMPTY_STMT, 2 - новый класс (строка с именем класса) и узел,
+# n >= 3 - узел класса с номером n - 3. Узел: флаги наличия row, col, loc, node_type, node_ident
+# и позиции имени (у IdentNode, если она отличается от row, col), присутствующие из них значения,
+# затем поля в порядке NODE_FIELDS.
+
+MAGIC = b'CSAST'
+VERSION = 1
+
+_PRIMITIVES = tuple(PrimitiveType)
+_OPS = tuple(BinaryOperation)
+_SCOPES = tuple(VariableScope)
+_PRIMITIVE_IDS = {v: i for i, v in enumerate(_PRIMITIVES)}
+_OP_IDS = {v: i for i, v in enumerate(_OPS)}
+_SCOPE_IDS = {v: i for i, v in enumerate(_SCOPES)}
+
+_HAS_ROW, _HAS_COL, _HAS_LOC, _HAS_TYPE, _HAS_IDENT, _HAS_NAME_POS = 1, 2, 4, 8, 16, 32
+_IDENT_BUILT_IN, _IDENT_NATIVE = 1, 2
+_VALUE_FALSE, _VALUE_TRUE, _VALUE_INT, _VALUE_FLOAT, _VALUE_STR = range(5)
+
+_double = struct.Struct('<d')
+
+
+class FormatError(Exception):
+    pass
+
+
+def _node_classes() -> Dict[str, Type[AstNode]]:
+    return {cls.__name__: cls for cls in NODE_FIELDS}
+
+
+# потоковая запись узлов в двоичном формате
+class AstWriter:
+
+    def __init__(self, fp: BinaryIO, buffer_size: int = 1 << 16) -> None:
+        self.fp = fp
+        self.buffer_size = buffer_size
+        self._buf = bytearray(MAGIC)
+        self._varint(VERSION)
+        self._strings: Dict[str, int] = {}
+        # простые типы сравниваются по primitive_type, функциональные - по сигнатуре
+        self._types: Dict[Any, int] = {}
+        self._idents: Dict[int, int] = {}
+        # ссылки на описания держатся, чтобы их id не переиспользовались до конца записи
+        self._ident_objs: List[IdentDesc] = []
+        self._classes: Dict[type, int] = {}
+
+    def _varint(self, n: int) -> None:
+        buf = self._buf
+        while n >= 0x80:
+            buf.append((n & 0x7f) | 0x80)
+            n >>= 7
+        buf.append(n)
+
+    def _sint(self, n: int) -> None:
+        self._varint(n << 1 if n >= 0 else (-n << 1) - 1)
+
+    def _str(self, s: str) -> None:
+        id_ = self._strings.get(s)
+        if id_ is not None:
+            self._varint(id_ + 1)
+            return
+        self._strings[s] = len(self._strings)
+        data = s.encode('utf-8')
+        self._varint(0)
+        self._varint(len(data))
+        self._buf += data
+
+    @staticmethod
+    def _type_key(type_: DataType) -> Any:
+        if type_.simple:
+            return type_.primitive_type
+        return DataType.__str__(type_)
+
+    def _type(self, type_: Optional[DataType]) -> None:
+        if type_ is None:
+            self._varint(0)
+            return
+        key = self._type_key(type_)
+        id_ = self._types.get(key)
+        if id_ is not None:
+            self._varint(id_ + 2)
+            return
+        self._varint(1)
+        if type_.simple:
+            self._varint(0)
+            self._varint(_PRIMITIVE_IDS[type_.primitive_type])
+        else:
+            self._varint(1)
+            self._type(type_.return_type)
+            self._varint(len(type_.params))
+            for param in type_.params:
+                self._type(param)
+        self._types[key] = len(self._types)
+
+    def _ident(self, ident: IdentDesc) -> None:
+        id_ = self._idents.get(id(ident))
+        if id_ is not None:
+            self._varint(id_ + 1)
+            return
+        self._varint(0)
+        self._str(ident.name)
+        self._type(ident.type)
+        self._varint(_SCOPE_IDS[ident.scope])
+        self._varint(ident.index)
+        self._varint((_IDENT_BUILT_IN if ident.built_in else 0) |
+                     (_IDENT_NATIVE if isinstance(ident, semantic.NativeIdentDesc) else 0))
+        self._idents[id(ident)] = len(self._idents)
+        self._ident_objs.append(ident)
+
+    def _value(self, value: Any) -> None:
+        if isinstance(value, bool):
+            self._varint(_VALUE_TRUE if value else _VALUE_FALSE)
+        elif isinstance(value, int):
+            self._varint(_VALUE_INT)
+            self._sint(value)
+        elif isinstance(value, float):
+            self._varint(_VALUE_FLOAT)
+            self._buf += _double.pack(value)
+        elif isinstance(value, str):
+            self._varint(_VALUE_STR)
+            self._str(value)
+        else:
+            raise FormatError('Неподдерживаемое значение литерала {!r}'.format(value))
+
+    def _node(self, node: Optional[AstNode]) -> None:
+        if node is None:
+            self._varint(0)
+            return
+        if node is EMPTY_STMT:
+            self._varint(1)
+            return
+        cls = type(node)
+        fields = NODE_FIELDS.get(cls)
+        if fields is None:
+            raise FormatError('Неизвестный вид узла {}'.format(cls.__name__))
+        id_ = self._classes.get(cls)
+        if id_ is None:
+            self._varint(2)
+            self._str(cls.__name__)
+            self._classes[cls] = len(self._classes)
+        else:
+            self._varint(id_ + 3)
+
+        attrs = node.__dict__
+        row, col, loc = node.row, node.col, attrs.get('loc')
+        name_pos = (node.name_row, node.name_col) if isinstance(node, IdentNode) else (row, col)
+        flags = ((_HAS_ROW if row is not None else 0) | (_HAS_COL if col is not None else 0) |
+                 (_HAS_LOC if loc is not None else 0) | (_HAS_TYPE if node.node_type is not None else 0) |
+                 (_HAS_IDENT if node.node_ident is not None else 0) |
+                 (_HAS_NAME_POS if name_pos != (row, col) and None not in name_pos else 0))
+        self._varint(flags)
+        if row is not None:
+            self._varint(row)
+        if col is not None:
+            self._varint(col)
+        if loc is not None:
+            self._varint(loc)
+        if node.node_type is not None:
+            self._type(node.node_type)
+        if node.node_ident is not None:
+            self._ident(node.node_ident)
+        if flags & _HAS_NAME_POS:
+            self._varint(name_pos[0])
+            self._varint(name_pos[1])
+
+        for name, kind in fields:
+            value = attrs[name]
+            if kind == NODE:
+                self._node(value)
+            elif kind == NODES:
+                self._varint(len(value))
+                for child in value:
+                    self._node(child)
+            elif kind == STR:
+                self._str(value)
+            elif kind == OP:
+                self._varint(_OP_IDS[value])
+            elif kind == TYPE:
+                self._type(value)
+            elif kind == VALUE:
+                self._value(value)
+            elif kind == BOOL:
+                self._varint(1 if value else 0)
+
+    # записывает очередной корневой узел
+    def write(self, node: AstNode) -> None:
+        self._node(node)
+        if len(self._buf) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buf:
+            self.fp.write(self._buf)
+            self._buf = bytearray()
+        if hasattr(self.fp, 'flush'):
+            self.fp.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'AstWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# чтение узлов из двоичного формата без повторного разбора исходного кода
+class AstReader:
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview, BinaryIO],
+                 prelude: Optional[semantic.IdentScope] = None) -> None:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.read()
+        self._data = bytes(data)
+        if not self._data.startswith(MAGIC):
+            raise FormatError('Данные не являются сериализованным AST')
+        self._pos = len(MAGIC)
+        version = self._varint()
+        if version != VERSION:
+            raise FormatError('Неподдерживаемая версия формата {} (ожидалась {})'.format(version, VERSION))
+        # встроенные функции связываются с общей областью видимости встроенных объектов
+        self._prelude = semantic.get_prelude() if prelude is None else prelude
+        self._strings: List[str] = []
+        self._types: List[DataType] = []
+        self._idents: List[IdentDesc] = []
+        self._classes: List[type] = []
+        self._class_names = _node_classes()
+
+    def _varint(self) -> int:
+        data, pos = self._data, self._pos
+        try:
+            b = data[pos]
+            pos += 1
+            if b < 0x80:
+                self._pos = pos
+                return b
+            n, shift = b & 0x7f, 7
+            while True:
+                b = data[pos]
+                pos += 1
+                n |= (b & 0x7f) << shift
+                if b < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise FormatError('Неожиданный конец данных') from None
+        self._pos = pos
+        return n
+
+    def _bytes(self, length: int) -> bytes:
+        end = self._pos + length
+        if end > len(self._data):
+            raise FormatError('Неожиданный конец данных')
+        data = self._data[self._pos:end]
+        self._pos = end
+        return data
+
+    def _sint(self) -> int:
+        n = self._varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def _str(self) -> str:
+        ref = self._varint()
+        if ref:
+            return self._strings[ref - 1]
+        try:
+            s = self._bytes(self._varint()).decode('utf-8')
+        except UnicodeDecodeError:
+            raise FormatError('Некорректная строка в данных') from None
+        self._strings.append(s)
+        return s
+
+    def _type(self) -> Optional[DataType]:
+        ref = self._varint()
+        if ref == 0:
+            return None
+        if ref >= 2:
+            return self._types[ref - 2]
+        if self._varint() == 0:
+            type_ = DataType.from_primitive_type(_PRIMITIVES[self._varint()])
+        else:
+            return_type = self._type()
+            params = tuple(self._type() for _ in range(self._varint()))
+            type_ = DataType(None, return_type, params)
+        self._types.append(type_)
+        return type_
+
+    def _ident(self) -> IdentDesc:
+        ref = self._varint()
+        if ref:
+            return self._idents[ref - 1]
+        name = self._str()
+        type_ = self._type()
+        scope = _SCOPES[self._varint()]
+        index = self._varint()
+        flags = self._varint()
+        ident = None
+        if flags & _IDENT_NATIVE:
+            ident = self._prelude.get_ident(name)
+            if not isinstance(ident, semantic.NativeIdentDesc):
+                ident = None
+        if ident is None:
+            ident = IdentDesc(name, type_, scope, index)
+            ident.built_in = bool(flags & _IDENT_BUILT_IN)
+        self._idents.append(ident)
+        return ident
+
+    def _value(self) -> Any:
+        tag = self._varint()
+        if tag == _VALUE_FALSE:
+            return False
+        if tag == _VALUE_TRUE:
+            return True
+        if tag == _VALUE_INT:
+            return self._sint()
+        if tag == _VALUE_FLOAT:
+            return _double.unpack(self._bytes(_double.size))[0]
+        if tag == _VALUE_STR:
+            return self._str()
+        raise FormatError('Неизвестный тег значения {}'.format(tag))
+
+    def _node(self) -> Optional[AstNode]:
+        ref = self._varint()
+        if ref == 0:
+            return None
+        if ref == 1:
+            return EMPTY_STMT
+        if ref == 2:
+            name = self._str()
+            cls = self._class_names.get(name)
+            if cls is None:
+                raise FormatError('Неизвестный вид узла {}'.format(name))
+            self._classes.append(cls)
+        else:
+            cls = self._classes[ref - 3]
+
+        # узел создается без вызова __init__: все атрибуты берутся из записи
+        node = cls.__new__(cls)
+        attrs = node.__dict__
+        flags = self._varint()
+        attrs['row'] = self._varint() if flags & _HAS_ROW else None
+        attrs['col'] = self._varint() if flags & _HAS_COL else None
+        if flags & _HAS_LOC:
+            attrs['loc'] = self._varint()
+        attrs['node_type'] = self._type() if flags & _HAS_TYPE else None
+        attrs['node_ident'] = self._ident() if flags & _HAS_IDENT else None
+        if flags & _HAS_NAME_POS:
+            attrs['name_row'] = self._varint()
+            attrs['name_col'] = self._varint()
+        elif issubclass(cls, IdentNode):
+            attrs['name_row'], attrs['name_col'] = attrs['row'], attrs['col']
+
+        for name, kind in NODE_FIELDS[cls]:
+            if kind == NODE:
+                attrs[name] = self._node()
+            elif kind == NODES:
+                attrs[name] = tuple(self._node() for _ in range(self._varint()))
+            elif kind == STR:
+                attrs[name] = self._str()
+            elif kind == OP:
+                attrs[name] = _OPS[self._varint()]
+            elif kind == TYPE:
+                attrs[name] = self._type()
+            elif kind == VALUE:
+                attrs[name] = self._value()
+            elif kind == BOOL:
+                attrs[name] = bool(self._varint())
+        return node
+
+    # последовательно читает корневые узлы; поврежденные или обрезанные данные - FormatError
+    def __iter__(self) -> Iterator[AstNode]:
+        while self._pos < len(self._data):
+            try:
+                node = self._node()
+            except (IndexError, KeyError, ValueError) as e:
+                # ссылка на несуществующую строку, тип, описание или вид узла
+                raise FormatError('Некорректные данные (позиция {}): {}'.format(self._pos, e)) from e
+            yield node
+
+
+def dump(node: AstNode, fp: BinaryIO) -> None:
+    with AstWriter(fp) as writer:
+        writer.write(node)
+
+
+def dumps(node: AstNode) -> bytes:
+    fp = io.BytesIO()
+    dump(node, fp)
+    return fp.getvalue()
+
+
+def load(fp: Union[bytes, BinaryIO], prelude: Optional[semantic.IdentScope] = None) -> AstNode:
+    nodes = iter(AstReader(fp, prelude))
+    node = next(nodes, None)
+    if node is None:
+        raise FormatError('Нет сериализованных узлов')
+    return node
+
+
+def loads(data: bytes, prelude: Optional[semantic.IdentScope] = None) -> AstNode:
+    return load(data, prelude)
+
+
+# представление узла со всеми полями для экспорта в JSON; описания идентификаторов
+# нумеруются, чтобы ссылки на один и тот же идентификатор можно было сопоставить
+def to_json_obj(node: Optional[AstNode], idents: Optional[Dict[int, int]] = None) -> Any:
+    if node is None:
+        return None
+    if idents is None:
+        idents = {}
+    r: Dict[str, Any] = {'kind': type(node).__name__, 'row': node.row, 'col': node.col}
+    if isinstance(node, IdentNode):
+        r['name_row'], r['name_col'] = node.name_row, node.name_col
+    if node.node_type is not None:
+        r['node_type'] = str(node.node_type)
+    ident = node.node_ident
+    if ident is not None:
+        r['node_ident'] = {'id': idents.setdefault(id(ident), len(idents)), 'name': ident.name,
+                           'type': str(ident.type), 'scope': str(ident.scope), 'index': ident.index,
+                           'built_in': ident.built_in}
+    for name, kind in NODE_FIELDS[type(node)]:
+        value = getattr(node, name)
+        if kind == NODE:
+            r[name] = to_json_obj(value, idents)
+        elif kind == NODES:
+            r[name] = [to_json_obj(child, idents) for child in value]
+        elif kind in (OP, TYPE):
+            r[name] = str(value) if value is not None else None
+        else:
+            r[name] = value
+    return r
+
+
+def to_json(node: AstNode, **kwargs) -> str:
+    kwargs.setdefault('ensure_ascii', False)
+    return json.dumps(to_json_obj(node), **kwargs)
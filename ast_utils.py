@@ -0,0 +1,157 @@
+import copy
+import json
+from typing import Callable, Dict, Iterator, Optional, Tuple, Type, Union
+
+from ast_nodes import AstNode, ExprNode, LiteralNode, IdentNode, TypeNode, BinOpNode, CallNode, TypeConvertNode, \
+    AssignNode, VarsNode, ReturnNode, IfNode, ForNode, ParamNode, FuncNode, StmtListNode, EMPTY_STMT
+from semantic import BinaryOperation, DataType, IdentDesc, VariableScope
+
+
+# виды полей узлов
+NODE = 'node'        # дочерний узел (может быть None или EMPTY_STMT)
+NODES = 'nodes'      # последовательность дочерних узлов
+STR = 'str'          # строка
+OP = 'op'            # BinaryOperation
+TYPE = 'type'        # DataType или None
+VALUE = 'value'      # значение литерала (bool, int, float, str)
+BOOL = 'bool'        # флаг
+
+# поля узлов в порядке их хранения (атрибуты row, col, loc, node_type и node_ident есть у всех узлов)
+NODE_FIELDS: Dict[Type[AstNode], Tuple[Tuple[str, str], ...]] = {
+    LiteralNode: (('literal', STR), ('value', VALUE)),
+    IdentNode: (('name', STR),),
+    TypeNode: (('name', STR), ('type', TYPE)),
+    BinOpNode: (('op', OP), ('arg1', NODE), ('arg2', NODE)),
+    CallNode: (('func', NODE), ('params', NODES)),
+    TypeConvertNode: (('expr', NODE), ('type', TYPE)),
+    AssignNode: (('var', NODE), ('val', NODE)),
+    VarsNode: (('type', NODE), ('vars', NODES)),
+    ReturnNode: (('val', NODE),),
+    IfNode: (('cond', NODE), ('then_stmt', NODE), ('else_stmt', NODE)),
+    ForNode: (('init', NODE), ('cond', NODE), ('step', NODE), ('body', NODE)),
+    ParamNode: (('type', NODE), ('name', NODE)),
+    FuncNode: (('type', NODE), ('name', NODE), ('params', NODES), ('body', NODE)),
+    StmtListNode: (('exprs', NODES), ('program', BOOL)),
+}
+
+
+# регистрирует поля нового вида узлов (например, добавленного оптимизирующим проходом)
+def register_node(cls: Type[AstNode], fields: Tuple[Tuple[str, str], ...]) -> None:
+    NODE_FIELDS[cls] = tuple(fields)
+
+
+def node_fields(node: AstNode) -> Tuple[Tuple[str, str], ...]:
+    return NODE_FIELDS[type(node)]
+
+
+# непосредственные дочерние узлы (без служебных узлов группировки, которые строит childs)
+def child_nodes(node: AstNode) -> Iterator[AstNode]:
+    for name, kind in NODE_FIELDS[type(node)]:
+        if kind == NODE:
+            child = getattr(node, name)
+            if child is not None:
+                yield child
+        elif kind == NODES:
+            yield from getattr(node, name)
+
+
+# обход поддерева в прямом порядке
+def walk(node: AstNode) -> Iterator[AstNode]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        children = list(child_nodes(node))
+        children.reverse()
+        stack.extend(children)
+
+
+def count_nodes(node: AstNode) -> int:
+    return sum(1 for _ in walk(node))
+
+
+# глубокая копия поддерева: узлы копируются, описания идентификаторов и типы остаются общими
+def clone(node: Optional[AstNode]) -> Optional[AstNode]:
+    if node is None or node is EMPTY_STMT:
+        return node
+    r = copy.copy(node)
+    for name, kind in NODE_FIELDS[type(node)]:
+        if kind == NODE:
+            setattr(r, name, clone(getattr(node, name)))
+        elif kind == NODES:
+            setattr(r, name, tuple(clone(child) for child in getattr(node, name)))
+    return r
+
+
+# заменяет каждый непосредственный дочерний узел результатом fn (None и EMPTY_STMT не передаются)
+def replace_children(node: AstNode, fn: Callable[[AstNode], AstNode]) -> AstNode:
+    for name, kind in NODE_FIELDS[type(node)]:
+        if kind == NODE:
+            child = getattr(node, name)
+            if child is not None and child is not EMPTY_STMT:
+                setattr(node, name, fn(child))
+        elif kind == NODES:
+            setattr(node, name, tuple(fn(child) for child in getattr(node, name)))
+    return node
+
+
+# выделение индексов для переменных, которые оптимизации добавляют в кадр функции (scope = LOCAL, frame - функция)
+# или в глобальную область (scope = GLOBAL, frame - вся программа): индексы следуют за уже занятыми
+class FrameSlots:
+
+    def __init__(self, scope: VariableScope, frame: AstNode) -> None:
+        self.scope = scope
+        indices = [node.node_ident.index for node in walk(frame)
+                   if node.node_ident is not None and node.node_ident.scope == scope and not node.node_ident.built_in
+                   and not node.node_ident.type.function]
+        self.index = max(indices) + 1 if indices else 0
+
+    def new(self, name: str, type_: DataType) -> IdentDesc:
+        desc = IdentDesc(name, type_, self.scope, self.index)
+        self.index += 1
+        return desc
+
+
+# построение проверенных узлов (с заполненными node_type и node_ident) для оптимизирующих проходов
+def make_literal(value: Union[int, float, bool, str], type_: DataType, like: Optional[AstNode] = None) -> LiteralNode:
+    if isinstance(value, bool):
+        literal = 'true' if value else 'false'
+    elif isinstance(value, str):
+        literal = json.dumps(value)
+    else:
+        literal = repr(value)
+    node = LiteralNode(literal, row=like.row if like else None, col=like.col if like else None)
+    node.value = value
+    node.node_type = type_
+    return node
+
+
+def make_ident(desc: IdentDesc, like: Optional[AstNode] = None) -> IdentNode:
+    node = IdentNode(desc.name, row=like.row if like else None, col=like.col if like else None)
+    node.node_type = desc.type
+    node.node_ident = desc
+    return node
+
+
+def make_binop(op: BinaryOperation, arg1: ExprNode, arg2: ExprNode, type_: DataType) -> BinOpNode:
+    node = BinOpNode(op, arg1, arg2, row=arg1.row, col=arg1.col)
+    node.node_type = type_
+    return node
+
+
+def make_assign(desc: IdentDesc, val: ExprNode) -> AssignNode:
+    node = AssignNode(make_ident(desc), val)
+    node.node_type = desc.type
+    return node
+
+
+def make_declaration(desc: IdentDesc, val: Optional[ExprNode] = None) -> VarsNode:
+    node = VarsNode(TypeNode(str(desc.type)), make_assign(desc, val) if val is not None else make_ident(desc))
+    node.node_type = DataType.VOID
+    return node
+
+
+def make_block(*exprs: AstNode) -> StmtListNode:
+    node = StmtListNode(*exprs)
+    node.node_type = DataType.VOID
+    return node
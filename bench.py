@@ -0,0 +1,234 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+import _parser
+import semantic
+import workload
+from ast_nodes import AstNode
+
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.bench', 'history.jsonl')
+
+# падение пропускной способности (в долях), начиная с которого результат считается регрессией
+REGRESSION_THRESHOLD = 0.1
+
+PHASES = ('parse', 'semantic_check', 'tree')
+
+
+# подсчет узлов дерева
+def count_nodes(node: AstNode) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.childs)
+    return count
+
+
+# семантическая проверка; ошибка допустима только в программе с намеренно внесенной ошибкой
+def _semantic_check(prog: AstNode, scope: semantic.IdentScope, expect_error: bool) -> None:
+    try:
+        prog.semantic_check(scope)
+    except semantic.SemanticException:
+        if not expect_error:
+            raise
+
+
+# выполняет фазы компиляции для переданной программы, возвращает время каждой фазы
+def run_phases(source: str, expect_error: bool = False) -> Tuple[Dict[str, float], int]:
+    times = {}
+    start = time.perf_counter()
+    prog = _parser.parse(source)
+    times['parse'] = time.perf_counter() - start
+
+    scope = semantic.prepare_global_scope()
+    start = time.perf_counter()
+    _semantic_check(prog, scope, expect_error)
+    times['semantic_check'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prog.tree
+    times['tree'] = time.perf_counter() - start
+    return times, count_nodes(prog)
+
+
+# пиковое потребление памяти каждой фазой (отдельным прогоном, т.к. tracemalloc замедляет работу)
+def measure_memory(source: str, expect_error: bool = False) -> Dict[str, int]:
+    peaks = {}
+
+    def measure(phase: str, func: Callable):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            return func()
+        finally:
+            peaks[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    prog = measure('parse', lambda: _parser.parse(source))
+    scope = semantic.prepare_global_scope()
+    measure('semantic_check', lambda: _semantic_check(prog, scope, expect_error))
+    measure('tree', lambda: prog.tree)
+    return peaks
+
+
+# замер одной конфигурации нагрузки
+def bench_workload(w: workload.Workload, repeat: int = 3, memory: bool = True) -> Dict[str, dict]:
+    data = w.source
+    size = len(data.encode('utf-8'))
+    best: Dict[str, float] = {}
+    nodes = 0
+    for _ in range(repeat):
+        times, nodes = run_phases(data, w.error is not None)
+        for phase, t in times.items():
+            best[phase] = min(best.get(phase, t), t)
+    peaks = measure_memory(data, w.error is not None) if memory else {}
+    result = {}
+    for phase in PHASES:
+        t = best[phase]
+        result[phase] = {
+            'seconds': t,
+            'nodes_per_sec': nodes / t if t else 0.0,
+            'bytes_per_sec': size / t if t else 0.0,
+            'peak_bytes': peaks.get(phase),
+        }
+    result['nodes'] = nodes
+    result['bytes'] = size
+    return result
+
+
+# позиции всех узлов дерева в порядке обхода
+def node_positions(node: AstNode) -> List[Tuple[str, Optional[int], Optional[int]]]:
+    r = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        r.append((node.to_str(), node.row, node.col))
+        stack.extend(reversed(node.childs))
+    return r
+
+
+# нагрузочная проверка: программы разбираются параллельно в пуле потоков,
+# позиции узлов должны совпасть с последовательным разбором; возвращает число расхождений
+def stress_parse(threads: int = 8, programs: int = 16, size: int = 6, rounds: int = 2) -> int:
+    sources = [workload.generate(size=size, depth=2, seed=seed).source for seed in range(programs)]
+    # программы разной длины и с разным числом строк перед кодом, чтобы позиции не совпадали
+    sources = ['\n' * seed + ' ' * (seed % 7) + source for seed, source in enumerate(sources)]
+    expected = [node_positions(_parser.parse(source)) for source in sources]
+    mismatches = 0
+    for _ in range(rounds):
+        for i, prog in enumerate(_parser.parse_many(sources * 2, threads)):
+            if node_positions(prog) != expected[i % len(sources)]:
+                mismatches += 1
+    return mismatches
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str = HISTORY_FILE) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_history(record: dict, path: str = HISTORY_FILE) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+# сравнивает результат с последним сохраненным для той же конфигурации
+def find_regressions(record: dict, history: List[dict], threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    previous = [r for r in history if r['config'] == record['config']]
+    if not previous:
+        return []
+    last = previous[-1]
+    regressions = []
+    for phase in PHASES:
+        old = last['results'][phase]['nodes_per_sec']
+        new = record['results'][phase]['nodes_per_sec']
+        if old and new < old * (1 - threshold):
+            regressions.append('{}: {:.0f} -> {:.0f} узлов/с ({:+.1%}, ревизия {})'.format(
+                phase, old, new, new / old - 1, last.get('revision')
+            ))
+    return regressions
+
+
+def format_result(config: dict, results: dict) -> str:
+    lines = ['size={size} depth={depth} seed={seed} error={error}: {0} байт, {1} узлов'.format(
+        results['bytes'], results['nodes'], **config
+    )]
+    for phase in PHASES:
+        r = results[phase]
+        peak = r['peak_bytes']
+        lines.append('  {:<15} {:>9.4f} с {:>12.0f} узлов/с {:>14.0f} байт/с {:>12}'.format(
+            phase, r['seconds'], r['nodes_per_sec'], r['bytes_per_sec'],
+            '{} КБ'.format(peak // 1024) if peak is not None else '-'
+        ))
+    return os.linesep.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Замер производительности парсера и семантического анализа')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200])
+    arg_parser.add_argument('--depth', type=int, default=3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--error', choices=workload.ERROR_KINDS, help='внести в программы ошибку')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--no-memory', action='store_true', help='не замерять пиковую память')
+    arg_parser.add_argument('--history', default=HISTORY_FILE, help='файл с историей результатов')
+    arg_parser.add_argument('--no-save', action='store_true', help='не сохранять результат в историю')
+    arg_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    arg_parser.add_argument('--stress-threads', type=int, metavar='N',
+                            help='только проверить позиции узлов при параллельном разборе в N потоках')
+    args = arg_parser.parse_args(argv)
+
+    if args.stress_threads:
+        mismatches = stress_parse(args.stress_threads)
+        print('Расхождений позиций при параллельном разборе: {}'.format(mismatches))
+        return 1 if mismatches else 0
+
+    history = load_history(args.history)
+    revision = _git_revision()
+    regressions = []
+    for size in args.sizes:
+        w = workload.generate(size=size, depth=args.depth, seed=args.seed, error=args.error)
+        config = {'size': size, 'depth': args.depth, 'seed': args.seed, 'error': args.error}
+        results = bench_workload(w, args.repeat, not args.no_memory)
+        print(format_result(config, results))
+        record = {
+            'timestamp': time.time(),
+            'revision': revision,
+            'python': platform.python_version(),
+            'config': config,
+            'results': results,
+        }
+        regressions.extend(find_regressions(record, history, args.threshold))
+        if not args.no_save:
+            save_history(record, args.history)
+
+    if regressions:
+        print('Регрессии:')
+        print(*regressions, sep=os.linesep)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from typing import Dict, Iterator, List, Optional, Set
+
+import ast_utils
+from ast_nodes import AstNode, CallNode, FuncNode, StmtListNode
+from semantic import IdentDesc, NativeIdentDesc
+
+
+# граф вызовов проверенной программы: вершины - функции программы (встроенные функции не учитываются),
+# вызовы из операторов верхнего уровня относятся к вершине None.
+# calls - уже известные места вызова (вызывающая функция -> call_sites ее тела), иначе они ищутся по дереву
+class CallGraph:
+
+    def __init__(self, prog: StmtListNode,
+                 calls: Optional[Dict[Optional[IdentDesc], Dict[IdentDesc, int]]] = None) -> None:
+        self.functions: Dict[IdentDesc, FuncNode] = {}
+        self.calls: Dict[Optional[IdentDesc], Set[IdentDesc]] = {None: set()}
+        # количество мест вызова каждой функции
+        self.sites: Dict[IdentDesc, int] = {}
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                self.functions[expr.name.node_ident] = expr
+                self.calls[expr.name.node_ident] = set()
+        if calls is None:
+            calls = {}
+            for expr in prog.exprs:
+                caller = expr.name.node_ident if isinstance(expr, FuncNode) else None
+                sites = calls.setdefault(caller, {})
+                for callee in _callees(expr):
+                    sites[callee] = sites.get(callee, 0) + 1
+        for caller, sites in calls.items():
+            for callee, count in sites.items():
+                if callee in self.functions:
+                    self.calls[caller].add(callee)
+                    self.sites[callee] = self.sites.get(callee, 0) + count
+        self.sccs = self._strongly_connected()
+        self.recursive: Set[IdentDesc] = set()
+        for scc in self.sccs:
+            if len(scc) > 1 or scc[0] in self.calls[scc[0]]:
+                self.recursive.update(scc)
+
+    def callees(self, func: Optional[IdentDesc]) -> Set[IdentDesc]:
+        return self.calls.get(func, set())
+
+    def callers(self, func: IdentDesc) -> Set[Optional[IdentDesc]]:
+        return {caller for caller, callees in self.calls.items() if func in callees}
+
+    def is_recursive(self, func: IdentDesc) -> bool:
+        return func in self.recursive
+
+    # функции в порядке "вызываемые раньше вызывающих" (функции одной компоненты - в произвольном порядке)
+    def bottom_up(self) -> Iterator[IdentDesc]:
+        for scc in self.sccs:
+            yield from scc
+
+    # компоненты сильной связности (алгоритм Тарьяна без рекурсии);
+    # компоненты получаются в обратном топологическом порядке: вызываемые раньше вызывающих
+    def _strongly_connected(self) -> List[List[IdentDesc]]:
+        index: Dict[IdentDesc, int] = {}
+        lowlink: Dict[IdentDesc, int] = {}
+        stack: List[IdentDesc] = []
+        on_stack: Set[IdentDesc] = set()
+        sccs: List[List[IdentDesc]] = []
+        for root in self.functions:
+            if root in index:
+                continue
+            work = [(root, iter(self.calls[root]))]
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                func, callees = work[-1]
+                for callee in callees:
+                    if callee not in index:
+                        index[callee] = lowlink[callee] = len(index)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        work.append((callee, iter(self.calls[callee])))
+                        break
+                    if callee in on_stack:
+                        lowlink[func] = min(lowlink[func], index[callee])
+                else:
+                    work.pop()
+                    if work:
+                        caller = work[-1][0]
+                        lowlink[caller] = min(lowlink[caller], lowlink[func])
+                    if lowlink[func] == index[func]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            scc.append(member)
+                            if member is func:
+                                break
+                        sccs.append(scc)
+        return sccs
+
+
+# функции программы, вызываемые в поддереве, и количество мест их вызова
+def call_sites(node: AstNode) -> Dict[IdentDesc, int]:
+    sites: Dict[IdentDesc, int] = {}
+    for callee in _callees(node):
+        sites[callee] = sites.get(callee, 0) + 1
+    return sites
+
+
+# функции программы, вызываемые в поддереве
+def _callees(node: AstNode) -> Iterator[IdentDesc]:
+    for n in ast_utils.walk(node):
+        if isinstance(n, CallNode) and n.func.node_ident is not None and \
+                not isinstance(n.func.node_ident, NativeIdentDesc):
+            yield n.func.node_ident
@@ -0,0 +1,451 @@
+import gc
+from typing import Dict, Iterator, List, Optional, Set, Union
+
+from ast_nodes import AstNode, LiteralNode, IdentNode, BinOpNode, CallNode, TypeConvertNode, AssignNode, VarsNode, \
+    ReturnNode, IfNode, ForNode, FuncNode, StmtListNode
+from semantic import BinaryOperation, DataType, IdentDesc, VariableScope
+
+
+# переменная промежуточного представления: локальная переменная или параметр программы (desc задан)
+# либо временная переменная; после перевода в SSA - версия исходной переменной (origin, version)
+class Var:
+
+    def __init__(self, name: str, type_: Optional[DataType], desc: Optional[IdentDesc] = None,
+                 origin: Optional['Var'] = None, version: Optional[int] = None) -> None:
+        self.name = name
+        self.type = type_
+        self.desc = desc
+        self.origin = origin
+        self.version = version
+
+    def __str__(self) -> str:
+        return self.name if self.version is None else '{}.{}'.format(self.name, self.version)
+
+    __repr__ = __str__
+
+
+class Const:
+
+    def __init__(self, value: Union[int, float, bool, str, None], type_: Optional[DataType]) -> None:
+        self.value = value
+        self.type = type_
+
+    def __str__(self) -> str:
+        if self.value is None:
+            return 'undef'
+        if isinstance(self.value, bool):
+            return 'true' if self.value else 'false'
+        return repr(self.value)
+
+    __repr__ = __str__
+
+
+# значение, не присвоенное ни на одном пути (переменная объявлена без начального значения)
+UNDEF = Const(None, None)
+
+Operand = Union[Var, Const]
+
+# виды инструкций
+COPY = 'copy'          # dest = args[0]
+BINOP = 'binop'        # dest = args[0] <attr: BinaryOperation> args[1]
+CONVERT = 'convert'    # dest = (attr: DataType) args[0]
+CALL = 'call'          # dest = attr(args...), attr - IdentDesc функции; dest = None, если значение не нужно
+LOAD = 'load'          # dest = глобальная переменная attr
+STORE = 'store'        # глобальная переменная attr = args[0]
+
+
+class Instr:
+
+    def __init__(self, op: str, dest: Optional[Var], args: List[Operand], attr=None) -> None:
+        self.op = op
+        self.dest = dest
+        self.args = args
+        self.attr = attr
+
+    def __str__(self) -> str:
+        if self.op == COPY:
+            r = str(self.args[0])
+        elif self.op == BINOP:
+            r = '{} {} {}'.format(self.args[0], self.attr, self.args[1])
+        elif self.op == CONVERT:
+            r = '({}) {}'.format(self.attr, self.args[0])
+        elif self.op == CALL:
+            r = '{}({})'.format(self.attr.name, ', '.join(str(arg) for arg in self.args))
+        elif self.op == LOAD:
+            r = 'load {}'.format(self.attr.name)
+        else:
+            return 'store {}, {}'.format(self.attr.name, self.args[0])
+        return '{} = {}'.format(self.dest, r) if self.dest is not None else r
+
+
+# phi-функция в начале блока: значение args[pred] при переходе из блока pred
+class Phi:
+
+    def __init__(self, dest: Var) -> None:
+        self.dest = dest
+        self.args: Dict['Block', Operand] = {}
+
+    def __str__(self) -> str:
+        return '{} = phi({})'.format(self.dest, ', '.join('b{}: {}'.format(block.id, arg)
+                                                         for block, arg in self.args.items()))
+
+
+class Jump:
+
+    def __init__(self, target: 'Block') -> None:
+        self.target = target
+
+    @property
+    def targets(self) -> List['Block']:
+        return [self.target]
+
+    def __str__(self) -> str:
+        return 'jump b{}'.format(self.target.id)
+
+
+class Branch:
+
+    def __init__(self, cond: Operand, then_block: 'Block', else_block: 'Block') -> None:
+        self.cond = cond
+        self.then_block = then_block
+        self.else_block = else_block
+
+    @property
+    def targets(self) -> List['Block']:
+        return [self.then_block, self.else_block]
+
+    def __str__(self) -> str:
+        return 'branch {}, b{}, b{}'.format(self.cond, self.then_block.id, self.else_block.id)
+
+
+class Return:
+
+    def __init__(self, value: Optional[Operand] = None) -> None:
+        self.value = value
+
+    @property
+    def targets(self) -> List['Block']:
+        return []
+
+    def __str__(self) -> str:
+        return 'return' if self.value is None else 'return {}'.format(self.value)
+
+
+Terminator = Union[Jump, Branch, Return]
+
+
+# базовый блок: phi-функции, линейная последовательность инструкций и завершающий переход
+class Block:
+
+    def __init__(self, id_: int) -> None:
+        self.id = id_
+        self.phis: List[Phi] = []
+        self.instrs: List[Instr] = []
+        self.terminator: Optional[Terminator] = None
+        self.preds: List['Block'] = []
+
+    @property
+    def succs(self) -> List['Block']:
+        return self.terminator.targets if self.terminator else []
+
+    def __str__(self) -> str:
+        lines = ['b{}:{}'.format(self.id, '  ; preds: ' + ', '.join('b{}'.format(p.id) for p in self.preds)
+                                 if self.preds else '')]
+        lines.extend('    {}'.format(line) for line in (*self.phis, *self.instrs, self.terminator))
+        return '\n'.join(lines)
+
+
+# граф потока управления функции (или операторов верхнего уровня программы, func = None)
+class Function:
+
+    def __init__(self, name: str, func: Optional[IdentDesc] = None) -> None:
+        self.name = name
+        self.func = func
+        self.params: List[Var] = []
+        self.blocks: List[Block] = []
+        self.entry: Optional[Block] = None
+        self.ssa = False
+        # результаты анализа доминаторов (см. compute_dominators)
+        self.idom: Dict[Block, Block] = {}
+        self.frontiers: Dict[Block, Set[Block]] = {}
+        self.dom_children: Dict[Block, List[Block]] = {}
+
+    def new_block(self) -> Block:
+        block = Block(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def instrs(self) -> Iterator[Instr]:
+        for block in self.blocks:
+            yield from block.instrs
+
+    # обратный порядок обхода в глубину от входного блока (только достижимые блоки)
+    def reverse_postorder(self) -> List[Block]:
+        order, visited = [], {self.entry}
+        stack = [(self.entry, iter(self.entry.succs))]
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ not in visited:
+                    visited.add(succ)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    # удаляет недостижимые блоки, перенумеровывает оставшиеся и заполняет списки предшественников
+    def finish(self) -> None:
+        self.blocks = self.reverse_postorder()
+        for i, block in enumerate(self.blocks):
+            block.id = i
+            block.preds = []
+        for block in self.blocks:
+            for succ in block.succs:
+                if block not in succ.preds:
+                    succ.preds.append(block)
+
+    # непосредственные доминаторы итеративным алгоритмом Купера-Харви-Кеннеди и границы доминирования
+    def compute_dominators(self) -> None:
+        order = self.blocks
+        number = {block: i for i, block in enumerate(order)}
+        idom: Dict[Block, Block] = {self.entry: self.entry}
+
+        def intersect(b1: Block, b2: Block) -> Block:
+            while b1 is not b2:
+                while number[b1] > number[b2]:
+                    b1 = idom[b1]
+                while number[b2] > number[b1]:
+                    b2 = idom[b2]
+            return b1
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                new_idom = None
+                for pred in block.preds:
+                    if pred in idom:
+                        new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if idom.get(block) is not new_idom:
+                    idom[block] = new_idom
+                    changed = True
+
+        self.idom = idom
+        self.dom_children = {block: [] for block in order}
+        for block in order[1:]:
+            self.dom_children[idom[block]].append(block)
+        self.frontiers = {block: set() for block in order}
+        for block in order:
+            if len(block.preds) < 2:
+                continue
+            for pred in block.preds:
+                runner = pred
+                while runner is not idom[block]:
+                    self.frontiers[runner].add(block)
+                    runner = idom[runner]
+
+    def dominates(self, a: Block, b: Block) -> bool:
+        while True:
+            if a is b:
+                return True
+            if b is self.entry:
+                return False
+            b = self.idom[b]
+
+    def __str__(self) -> str:
+        header = '{}({}){}:'.format(self.name, ', '.join(str(param) for param in self.params),
+                                    ' [ssa]' if self.ssa else '')
+        return '\n'.join((header, *(str(block) for block in self.blocks)))
+
+
+# промежуточное представление программы: функции и операторы верхнего уровня
+class Module:
+
+    def __init__(self) -> None:
+        self.functions: Dict[IdentDesc, Function] = {}
+        self.main: Optional[Function] = None
+
+    def all(self) -> Iterator[Function]:
+        yield from self.functions.values()
+        yield self.main
+
+    def __str__(self) -> str:
+        return '\n\n'.join(str(func) for func in self.all())
+
+
+# перевод проверенного AST функции (или операторов верхнего уровня) в граф базовых блоков;
+# локальные переменные и параметры становятся переменными Var, глобальные переменные читаются
+# и записываются инструкциями load/store, т.к. их могут изменить вызываемые функции
+class _Lowering:
+
+    def __init__(self, function: Function) -> None:
+        self.function = function
+        self.vars: Dict[IdentDesc, Var] = {}
+        self.temps = 0
+        self.block = function.entry = function.new_block()
+
+    def var(self, desc: IdentDesc) -> Var:
+        var = self.vars.get(desc)
+        if var is None:
+            var = self.vars[desc] = Var(desc.name, desc.type, desc)
+        return var
+
+    def temp(self, type_: Optional[DataType]) -> Var:
+        self.temps += 1
+        return Var('%t{}'.format(self.temps), type_)
+
+    def emit(self, op: str, dest: Optional[Var], args: List[Operand], attr=None) -> Optional[Var]:
+        self.block.instrs.append(Instr(op, dest, args, attr))
+        return dest
+
+    # завершает текущий блок; следующие инструкции попадают в новый блок (возможно, недостижимый)
+    def terminate(self, terminator: Terminator, next_block: Optional[Block] = None) -> None:
+        if self.block.terminator is None:
+            self.block.terminator = terminator
+        self.block = next_block if next_block is not None else self.function.new_block()
+
+    def jump(self, target: Block) -> None:
+        self.terminate(Jump(target), target)
+
+    def expr(self, node: AstNode) -> Operand:
+        if isinstance(node, LiteralNode):
+            value = node.literal == 'true' if isinstance(node.value, bool) else node.value
+            return Const(value, node.node_type)
+        if isinstance(node, IdentNode):
+            desc = node.node_ident
+            if desc.scope == VariableScope.GLOBAL:
+                return self.emit(LOAD, self.temp(desc.type), [], desc)
+            return self.var(desc)
+        if isinstance(node, BinOpNode):
+            if node.op in (BinaryOperation.LOGICAL_AND, BinaryOperation.LOGICAL_OR):
+                return self.short_circuit(node)
+            arg1 = self.expr(node.arg1)
+            arg2 = self.expr(node.arg2)
+            return self.emit(BINOP, self.temp(node.node_type), [arg1, arg2], node.op)
+        if isinstance(node, TypeConvertNode):
+            return self.emit(CONVERT, self.temp(node.type), [self.expr(node.expr)], node.type)
+        if isinstance(node, CallNode):
+            args = [self.expr(param) for param in node.params]
+            dest = self.temp(node.node_type) if node.node_type != DataType.VOID else None
+            self.emit(CALL, dest, args, node.func.node_ident)
+            return dest if dest is not None else UNDEF
+        raise TypeError('Неподдерживаемый узел выражения {}'.format(type(node).__name__))
+
+    # && и || вычисляются с пропуском второго операнда, результат собирается в одной переменной
+    def short_circuit(self, node: BinOpNode) -> Var:
+        result = self.temp(node.node_type)
+        self.emit(COPY, result, [self.expr(node.arg1)])
+        rhs, end = self.function.new_block(), self.function.new_block()
+        if node.op == BinaryOperation.LOGICAL_AND:
+            self.terminate(Branch(result, rhs, end), rhs)
+        else:
+            self.terminate(Branch(result, end, rhs), rhs)
+        self.emit(COPY, result, [self.expr(node.arg2)])
+        self.jump(end)
+        return result
+
+    def assign(self, desc: IdentDesc, value: Operand) -> None:
+        if desc.scope == VariableScope.GLOBAL:
+            self.emit(STORE, None, [value], desc)
+        else:
+            self.emit(COPY, self.var(desc), [value])
+
+    def stmt(self, node: AstNode) -> None:
+        if isinstance(node, StmtListNode):
+            for expr in node.exprs:
+                self.stmt(expr)
+        elif isinstance(node, VarsNode):
+            # переменная без начального значения получает значение по умолчанию для своего типа
+            for var in node.vars:
+                if isinstance(var, AssignNode):
+                    self.stmt(var)
+                else:
+                    self.assign(var.node_ident, _default(var.node_ident.type))
+        elif isinstance(node, AssignNode):
+            self.assign(node.var.node_ident, self.expr(node.val))
+        elif isinstance(node, ReturnNode):
+            self.terminate(Return(self.expr(node.val)))
+        elif isinstance(node, IfNode):
+            cond = self.expr(node.cond)
+            then_block, end = self.function.new_block(), self.function.new_block()
+            else_block = self.function.new_block() if node.else_stmt else end
+            self.terminate(Branch(cond, then_block, else_block), then_block)
+            self.stmt(node.then_stmt)
+            if node.else_stmt:
+                self.terminate(Jump(end), else_block)
+                self.stmt(node.else_stmt)
+            self.jump(end)
+        elif isinstance(node, ForNode):
+            self.stmt(node.init)
+            cond_block = self.function.new_block()
+            self.jump(cond_block)
+            body, step, end = self.function.new_block(), self.function.new_block(), self.function.new_block()
+            self.terminate(Branch(self.expr(node.cond), body, end), body)
+            self.stmt(node.body)
+            self.jump(step)
+            self.stmt(node.step)
+            self.terminate(Jump(cond_block), end)
+        elif isinstance(node, CallNode):
+            self.expr(node)
+        elif isinstance(node, FuncNode):
+            pass
+        else:
+            raise TypeError('Неподдерживаемый оператор {}'.format(type(node).__name__))
+
+
+def _default(type_: DataType) -> Const:
+    if type_ == DataType.INT:
+        return Const(0, type_)
+    if type_ == DataType.DOUBLE:
+        return Const(0.0, type_)
+    if type_ == DataType.BOOLEAN:
+        return Const(False, type_)
+    return Const('', type_)
+
+
+def build_function(func: FuncNode) -> Function:
+    function = Function(func.name.name, func.name.node_ident)
+    lowering = _Lowering(function)
+    function.params = [lowering.var(param.name.node_ident) for param in func.params]
+    lowering.stmt(func.body)
+    lowering.terminate(Return())
+    function.finish()
+    return function
+
+
+# операторы верхнего уровня программы (без объявлений функций) как функция main
+def build_main(prog: StmtListNode) -> Function:
+    function = Function('main')
+    lowering = _Lowering(function)
+    lowering.stmt(prog)
+    lowering.terminate(Return())
+    function.finish()
+    return function
+
+
+# перевод проверенной программы в промежуточное представление с графами потока управления;
+# при ssa=True функции дополнительно переводятся в SSA-форму.
+# Сборщик мусора на время построения отключается: представление создает много долгоживущих объектов,
+# а каждая полная сборка обходит все AST программы (на больших программах это в разы медленнее)
+def build_module(prog: StmtListNode, ssa: bool = False) -> Module:
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        module = Module()
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                module.functions[expr.name.node_ident] = build_function(expr)
+        module.main = build_main(prog)
+        for function in module.all():
+            function.compute_dominators()
+        if ssa:
+            import ssa as ssa_
+            for function in module.all():
+                ssa_.to_ssa(function)
+        return module
+    finally:
+        if enabled:
+            gc.enable()
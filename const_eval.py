@@ -0,0 +1,342 @@
+import math
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import ast_utils
+from ast_nodes import AstNode, LiteralNode, IdentNode, BinOpNode, CallNode, TypeConvertNode, AssignNode, VarsNode, \
+    ReturnNode, IfNode, ForNode, FuncNode, StmtListNode, EMPTY_STMT
+from callgraph import CallGraph
+from semantic import BinaryOperation, DataType, IdentDesc, NativeIdentDesc, VariableScope
+
+
+# границы типа int: вычисление с переполнением не выполняется, т.к. во время выполнения значение было бы другим
+_INT_MIN, _INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+# вычисление невозможно или не завершилось (переполнение, деление на ноль, исчерпан лимит шагов, ...)
+class _Abort(Exception):
+    pass
+
+
+class _Return(Exception):
+
+    def __init__(self, value: Any) -> None:
+        super().__init__()
+        self.value = value
+
+
+_FAILED = object()
+
+
+def _typed(value: Any, type_: DataType) -> Any:
+    if type_ == DataType.INT:
+        if isinstance(value, bool) or not isinstance(value, int) or not _INT_MIN <= value <= _INT_MAX:
+            raise _Abort()
+    elif type_ == DataType.DOUBLE:
+        value = float(value)
+        if not math.isfinite(value):
+            raise _Abort()
+    elif type_ == DataType.BOOLEAN:
+        if not isinstance(value, bool):
+            raise _Abort()
+    elif type_ == DataType.STRING:
+        if not isinstance(value, str):
+            raise _Abort()
+    return value
+
+
+def _default(type_: DataType) -> Any:
+    if type_ == DataType.INT:
+        return 0
+    if type_ == DataType.DOUBLE:
+        return 0.0
+    if type_ == DataType.BOOLEAN:
+        return False
+    return ''
+
+
+# целочисленные деление и остаток с округлением к нулю
+def _int_div(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _int_mod(a: int, b: int) -> int:
+    return a - b * _int_div(a, b)
+
+
+_COMPARE = {
+    BinaryOperation.GT: lambda a, b: a > b,
+    BinaryOperation.LT: lambda a, b: a < b,
+    BinaryOperation.GE: lambda a, b: a >= b,
+    BinaryOperation.LE: lambda a, b: a <= b,
+    BinaryOperation.EQUALS: lambda a, b: a == b,
+    BinaryOperation.NOTEQUALS: lambda a, b: a != b,
+}
+
+
+# вычисление на этапе компиляции вызовов чистых функций с постоянными аргументами.
+# Функция чистая, если не обращается к глобальным переменным и вызывает только чистые функции
+# (встроенные с pure=True или чистые функции программы); чистота определяется по компонентам
+# сильной связности графа вызовов. Вызов вычисляется интерпретацией тела функции не дольше max_steps шагов,
+# результаты запоминаются по (функции, аргументам). Вычисленный вызов заменяется литералом его типа
+class ConstEvaluator:
+
+    def __init__(self, max_steps: int = 100_000, max_call_depth: int = 64) -> None:
+        # шагов (операторов и выражений) на вычисление одного вызова в программе
+        self.max_steps = max_steps
+        # глубина вложенных вызовов при вычислении
+        self.max_call_depth = max_call_depth
+        self.pure: Set[IdentDesc] = set()
+        self.folded = 0
+        self.removed = 0
+        self.memo_hits = 0
+        self.failed = 0
+        self._memo: Dict[Tuple, Any] = {}
+        self._functions: Dict[IdentDesc, FuncNode] = {}
+        self._steps = 0
+        self._depth = 0
+
+    def evaluate(self, prog: StmtListNode) -> StmtListNode:
+        prog = ast_utils.clone(prog)
+        graph = CallGraph(prog)
+        self._functions = graph.functions
+        self.pure = self._pure_functions(graph)
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                expr.body = self._fold(expr.body)
+        exprs = (expr if isinstance(expr, FuncNode) else self._fold_stmt(expr) for expr in prog.exprs)
+        prog.exprs = tuple(expr for expr in exprs if expr is not EMPTY_STMT)
+        self._functions = {}
+        return prog
+
+    def report(self) -> str:
+        return 'вычислено вызовов: {}, удалено операторов-вызовов: {} (из кэша: {}), не вычислено: {}, ' \
+               'чистые функции: {}'.format(self.folded, self.removed, self.memo_hits, self.failed,
+                                           ', '.join(sorted(desc.name for desc in self.pure)) or '-')
+
+    def _pure_functions(self, graph: CallGraph) -> Set[IdentDesc]:
+        pure: Set[IdentDesc] = set()
+        for scc in graph.sccs:
+            members = set(scc)
+            if all(self._locally_pure(graph.functions[desc], pure | members) for desc in scc):
+                pure |= members
+        return pure
+
+    # функция не обращается к глобальным переменным и вызывает только функции из pure или чистые встроенные
+    @staticmethod
+    def _locally_pure(func: FuncNode, pure: Set[IdentDesc]) -> bool:
+        for n in ast_utils.walk(func.body):
+            if isinstance(n, CallNode):
+                desc = n.func.node_ident
+                if not (desc.pure if isinstance(desc, NativeIdentDesc) else desc in pure):
+                    return False
+            elif isinstance(n, IdentNode) and n.node_ident is not None and \
+                    n.node_ident.scope == VariableScope.GLOBAL and not n.node_ident.type.function:
+                return False
+        return True
+
+    # замена вычислимых вызовов в поддереве (снизу вверх, поэтому вложенные вызовы вычисляются раньше)
+    def _fold(self, node: AstNode) -> AstNode:
+        if isinstance(node, StmtListNode):
+            if node is not EMPTY_STMT:
+                node.exprs = tuple(expr for expr in map(self._fold_stmt, node.exprs) if expr is not EMPTY_STMT)
+            return node
+        if isinstance(node, IfNode):
+            node.cond = self._fold(node.cond)
+            node.then_stmt = self._fold_stmt(node.then_stmt)
+            if node.else_stmt:
+                node.else_stmt = self._fold_stmt(node.else_stmt)
+            return node
+        if isinstance(node, ForNode):
+            node.init = self._fold_stmt(node.init)
+            node.cond = self._fold(node.cond)
+            node.step = self._fold_stmt(node.step)
+            node.body = self._fold_stmt(node.body)
+            return node
+        node = ast_utils.replace_children(node, self._fold)
+        if isinstance(node, CallNode) and node.node_type != DataType.VOID:
+            value = self._value(node)
+            if value is not _FAILED:
+                self.folded += 1
+                return ast_utils.make_literal(value, node.node_type, node)
+        return node
+
+    # вызов-оператор, результат которого вычисляется, не имеет эффекта и удаляется
+    def _fold_stmt(self, node: AstNode) -> AstNode:
+        if isinstance(node, CallNode):
+            node = ast_utils.replace_children(node, self._fold)
+            if self._value(node) is not _FAILED:
+                self.removed += 1
+                return EMPTY_STMT
+            return node
+        return self._fold(node)
+
+    # значение вызова чистой функции с постоянными аргументами или _FAILED
+    def _value(self, call: CallNode) -> Any:
+        desc = call.func.node_ident
+        if not (desc.pure if isinstance(desc, NativeIdentDesc) else desc in self.pure):
+            return _FAILED
+        args = []
+        for param in call.params:
+            try:
+                args.append(self._const(param))
+            except _Abort:
+                return _FAILED
+        value = self._call_top(desc, args)
+        if value is _FAILED:
+            self.failed += 1
+        return value
+
+    # значение постоянного аргумента (литерал, возможно с преобразованием типа)
+    def _const(self, node: AstNode) -> Any:
+        if isinstance(node, LiteralNode):
+            return self._literal(node)
+        if isinstance(node, TypeConvertNode):
+            return self._convert(self._const(node.expr), node.expr.node_type, node.type)
+        raise _Abort()
+
+    def _call_top(self, func: IdentDesc, args: List[Any]) -> Any:
+        key = self._key(func, args)
+        if key in self._memo:
+            self.memo_hits += 1
+            return self._memo[key]
+        self._steps = self.max_steps
+        self._depth = 0
+        try:
+            value = self._call(func, args)
+        except (_Abort, ArithmeticError, ValueError, TypeError, RecursionError):
+            value = _FAILED
+        # неудача запоминается только для вызова верхнего уровня: вложенный вызов мог не уложиться
+        # в остаток лимита шагов, а не в весь лимит
+        self._memo[key] = value
+        return value
+
+    @staticmethod
+    def _key(func: IdentDesc, args: List[Any]) -> Tuple:
+        # тип значения входит в ключ, т.к. 1 == 1.0 == True
+        return (func, *((type(arg), arg) for arg in args))
+
+    def _call(self, func: IdentDesc, args: List[Any]) -> Any:
+        if isinstance(func, NativeIdentDesc):
+            return _typed(func.impl(*args), func.type.return_type)
+        key = self._key(func, args)
+        value = self._memo.get(key, _FAILED)
+        if value is not _FAILED:
+            self.memo_hits += 1
+            return value
+        if self._depth >= self.max_call_depth:
+            raise _Abort()
+        node = self._functions[func]
+        frame = {param.name.node_ident: arg for param, arg in zip(node.params, args)}
+        self._depth += 1
+        try:
+            self._exec(node.body, frame)
+            value = None
+        except _Return as r:
+            value = r.value
+        finally:
+            self._depth -= 1
+        if func.type.return_type != DataType.VOID:
+            if value is None:
+                raise _Abort()
+            value = _typed(value, func.type.return_type)
+        self._memo[key] = value
+        return value
+
+    def _step(self) -> None:
+        self._steps -= 1
+        if self._steps < 0:
+            raise _Abort()
+
+    def _exec(self, node: AstNode, frame: Dict[IdentDesc, Any]) -> None:
+        self._step()
+        if isinstance(node, StmtListNode):
+            for expr in node.exprs:
+                self._exec(expr, frame)
+        elif isinstance(node, VarsNode):
+            for var in node.vars:
+                if isinstance(var, AssignNode):
+                    self._exec(var, frame)
+                else:
+                    frame[var.node_ident] = _default(var.node_ident.type)
+        elif isinstance(node, AssignNode):
+            frame[node.var.node_ident] = self._eval(node.val, frame)
+        elif isinstance(node, ReturnNode):
+            raise _Return(self._eval(node.val, frame))
+        elif isinstance(node, IfNode):
+            if self._eval(node.cond, frame):
+                self._exec(node.then_stmt, frame)
+            elif node.else_stmt:
+                self._exec(node.else_stmt, frame)
+        elif isinstance(node, ForNode):
+            self._exec(node.init, frame)
+            while self._eval(node.cond, frame):
+                self._exec(node.body, frame)
+                self._exec(node.step, frame)
+        elif isinstance(node, CallNode):
+            self._eval(node, frame)
+        else:
+            raise _Abort()
+
+    def _eval(self, node: AstNode, frame: Dict[IdentDesc, Any]) -> Any:
+        self._step()
+        if isinstance(node, LiteralNode):
+            return self._literal(node)
+        if isinstance(node, IdentNode):
+            if node.node_ident not in frame:
+                raise _Abort()
+            return frame[node.node_ident]
+        if isinstance(node, BinOpNode):
+            op = node.op
+            if op == BinaryOperation.LOGICAL_AND:
+                return bool(self._eval(node.arg1, frame)) and bool(self._eval(node.arg2, frame))
+            if op == BinaryOperation.LOGICAL_OR:
+                return bool(self._eval(node.arg1, frame)) or bool(self._eval(node.arg2, frame))
+            return self._binop(op, self._eval(node.arg1, frame), self._eval(node.arg2, frame), node.node_type)
+        if isinstance(node, TypeConvertNode):
+            return self._convert(self._eval(node.expr, frame), node.expr.node_type, node.type)
+        if isinstance(node, CallNode):
+            return self._call(node.func.node_ident, [self._eval(param, frame) for param in node.params])
+        raise _Abort()
+
+    @staticmethod
+    def _literal(node: LiteralNode) -> Any:
+        return _typed(node.value, node.node_type)
+
+    @staticmethod
+    def _binop(op: BinaryOperation, a: Any, b: Any, type_: DataType) -> Any:
+        compare = _COMPARE.get(op)
+        if compare is not None:
+            return compare(a, b)
+        int_args = type_ == DataType.INT
+        if op == BinaryOperation.ADD:
+            value = a + b
+        elif op == BinaryOperation.SUB:
+            value = a - b
+        elif op == BinaryOperation.MULT:
+            value = a * b
+        elif op == BinaryOperation.DIV:
+            value = _int_div(a, b) if int_args else a / b
+        elif op == BinaryOperation.MOD:
+            value = _int_mod(a, b) if int_args else math.fmod(a, b)
+        else:
+            raise _Abort()
+        return _typed(value, type_)
+
+    # преобразование типа; строковое представление double во время выполнения может отличаться, поэтому
+    # такое преобразование не вычисляется
+    @staticmethod
+    def _convert(value: Any, from_type: DataType, to_type: DataType) -> Any:
+        if to_type == DataType.DOUBLE:
+            return _typed(value, to_type)
+        if to_type == DataType.BOOLEAN:
+            return value != 0 if from_type == DataType.INT else _typed(value, to_type)
+        if to_type == DataType.STRING:
+            if from_type == DataType.DOUBLE:
+                raise _Abort()
+            return ('True' if value else 'False') if isinstance(value, bool) else str(value)
+        return _typed(value, to_type)
+
+
+def evaluate_constants(prog: StmtListNode, max_steps: int = 100_000) -> StmtListNode:
+    return ConstEvaluator(max_steps).evaluate(prog)
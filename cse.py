@@ -0,0 +1,283 @@
+from typing import Dict, List, Optional, Tuple
+
+import ast_utils
+from ast_utils import make_ident, make_declaration, make_block
+from ast_nodes import AstNode, LiteralNode, IdentNode, BinOpNode, CallNode, TypeConvertNode, AssignNode, VarsNode, \
+    ReturnNode, IfNode, ForNode, FuncNode, StmtListNode
+from semantic import BinaryOperation, DataType, IdentDesc, IdentScope, NativeIdentDesc, VariableScope
+
+
+# операции, результат которых не зависит от порядка операндов (сложение строк не перестановочно)
+_COMMUTATIVE = (BinaryOperation.ADD, BinaryOperation.MULT, BinaryOperation.EQUALS, BinaryOperation.NOTEQUALS)
+# второй операнд этих операций вычисляется не всегда
+_SHORT_CIRCUIT = (BinaryOperation.LOGICAL_AND, BinaryOperation.LOGICAL_OR)
+
+
+# временные переменные прохода (__cse1, __cse2, ...). Регистрируются в области видимости кадра, в которую
+# занесены все имена кадра: add_ident выдает индекс после занятых (см. FrameSlots) и не допускает повторов
+class _Temps:
+
+    def __init__(self, scope: VariableScope, frame: AstNode, counter: List[int]) -> None:
+        self.scope = IdentScope()
+        if scope == VariableScope.LOCAL:
+            self.scope = IdentScope(self.scope)
+            self.scope.func = frame.name.node_ident
+        self.scope.var_index = ast_utils.FrameSlots(scope, frame).index
+        for node in ast_utils.walk(frame):
+            if node.node_ident is not None:
+                self.scope.idents.setdefault(node.node_ident.name, node.node_ident)
+        self.counter = counter
+
+    def new(self, type_: DataType) -> IdentDesc:
+        name = None
+        while name is None or self.scope.get_ident(name) is not None:
+            self.counter[0] += 1
+            name = '__cse{}'.format(self.counter[0])
+        return self.scope.add_ident(IdentDesc(name, type_))
+
+
+# вычисление подвыражения-кандидата в блоке
+class _Occurrence:
+
+    def __init__(self, node: AstNode, stmt: int, seq: int, conditional: bool, hoistable: bool) -> None:
+        self.node = node
+        # номер оператора блока и порядковый номер вычисления
+        self.stmt = stmt
+        self.seq = seq
+        # вычисляется не всегда (во втором операнде && или ||)
+        self.conditional = conditional
+        # можно вычислить перед оператором: до него в операторе нет вызовов и присваиваний
+        self.hoistable = hoistable
+
+
+# нумерация значений в линейной последовательности операторов: одинаковые номера получают выражения
+# с одной операцией над одинаковыми значениями. Номер переменной включает ее версию (увеличивается
+# при каждом присваивании), у глобальных переменных - еще и эпоху (увеличивается при вызове функции программы)
+class _ValueNumbering:
+
+    def __init__(self) -> None:
+        self.versions: Dict[IdentDesc, int] = {}
+        self.epoch = 0
+        self.occurrences: Dict[tuple, List[_Occurrence]] = {}
+        # корни пронумерованных выражений каждого оператора
+        self.roots: List[List[AstNode]] = []
+        self._stmt = 0
+        self._seq = 0
+        self._dirty = False
+
+    def statement(self, stmt: AstNode) -> None:
+        self._stmt = len(self.roots)
+        self._dirty = False
+        roots = []
+        if isinstance(stmt, AssignNode):
+            roots.append(stmt.val)
+            self._number(stmt.val, False)
+            self._define(stmt.var.node_ident)
+        elif isinstance(stmt, VarsNode):
+            for var in stmt.vars:
+                if isinstance(var, AssignNode):
+                    roots.append(var.val)
+                    self._number(var.val, False)
+                    self._define(var.var.node_ident)
+                else:
+                    self._define(var.node_ident)
+        elif isinstance(stmt, ReturnNode):
+            if stmt.val is not None:
+                roots.append(stmt.val)
+                self._number(stmt.val, False)
+        elif isinstance(stmt, CallNode):
+            roots.append(stmt)
+            self._number(stmt, False)
+        elif isinstance(stmt, IfNode):
+            # условие вычисляется в блоке, ветви - отдельные блоки
+            roots.append(stmt.cond)
+            self._number(stmt.cond, False)
+            self._invalidate(stmt.then_stmt)
+            if stmt.else_stmt is not None:
+                self._invalidate(stmt.else_stmt)
+        elif not isinstance(stmt, FuncNode):
+            # циклы и вложенные блоки
+            self._invalidate(stmt)
+        self.roots.append(roots)
+
+    def _define(self, desc: IdentDesc) -> None:
+        self.versions[desc] = self.versions.get(desc, 0) + 1
+        self._dirty = True
+
+    # переменные, которым присваиваются значения во вложенных операторах, получают новые версии
+    def _invalidate(self, node: AstNode) -> None:
+        for n in ast_utils.walk(node):
+            if isinstance(n, AssignNode):
+                self._define(n.var.node_ident)
+            elif isinstance(n, CallNode) and not isinstance(n.func.node_ident, NativeIdentDesc):
+                self.epoch += 1
+
+    # номер значения выражения и наличие в нем переменных. Номер вызова (и выражения с вызовом)
+    # не совпадает ни с каким другим, поэтому такие выражения не выносятся
+    def _number(self, node: AstNode, conditional: bool) -> Tuple[tuple, bool]:
+        if isinstance(node, LiteralNode):
+            return ('literal', str(node.node_type), repr(node.value)), False
+        if isinstance(node, IdentNode):
+            desc = node.node_ident
+            epoch = self.epoch if desc.scope == VariableScope.GLOBAL else 0
+            return ('var', desc, self.versions.get(desc, 0), epoch), True
+        if isinstance(node, TypeConvertNode):
+            key, has_vars = self._number(node.expr, conditional)
+            key = ('convert', str(node.type), key)
+        elif isinstance(node, BinOpNode):
+            key1, vars1 = self._number(node.arg1, conditional)
+            key2, vars2 = self._number(node.arg2, conditional or node.op in _SHORT_CIRCUIT)
+            if node.op in _COMMUTATIVE and node.node_type != DataType.STRING:
+                key = ('binop', node.op, frozenset((key1, key2)))
+            else:
+                key = ('binop', node.op, key1, key2)
+            has_vars = vars1 or vars2
+        else:
+            if isinstance(node, CallNode):
+                for param in node.params:
+                    self._number(param, conditional)
+                # функция программы может изменить глобальные переменные
+                if not isinstance(node.func.node_ident, NativeIdentDesc):
+                    self.epoch += 1
+                self._dirty = True
+            return ('node', node), False
+        if has_vars:
+            self._seq += 1
+            self.occurrences.setdefault(key, []).append(_Occurrence(
+                node, self._stmt, self._seq, conditional, not conditional and not self._dirty
+            ))
+        return key, has_vars
+
+
+# исключение общих подвыражений нумерацией значений в линейных последовательностях операторов:
+# одинаковые BinOpNode и TypeConvertNode над переменными, которым между вычислениями не присваивались
+# значения, вычисляются один раз во временную переменную, объявленную перед оператором с первым вычислением.
+# Выражения с вызовами функций не выносятся. Работает с проверенным AST и возвращает преобразованную копию
+class CommonSubexprEliminator:
+
+    def __init__(self) -> None:
+        # количество временных переменных и замененных ими вычислений
+        self.temps = 0
+        self.replaced = 0
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self._counter = [0]
+        self._temps: Optional[_Temps] = None
+
+    def eliminate(self, prog: StmtListNode) -> StmtListNode:
+        prog = ast_utils.clone(prog)
+        self.nodes_before += ast_utils.count_nodes(prog)
+        global_temps = _Temps(VariableScope.GLOBAL, prog, self._counter)
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                self._temps = _Temps(VariableScope.LOCAL, expr, self._counter)
+                expr.body = self._body(expr.body)
+        self._temps = global_temps
+        prog.exprs = tuple(self._block(list(prog.exprs)))
+        self._temps = None
+        self.nodes_after += ast_utils.count_nodes(prog)
+        return prog
+
+    def report(self) -> str:
+        return 'временных переменных: {}, заменено вычислений: {}, узлов: {} -> {}'.format(
+            self.temps, self.replaced, self.nodes_before, self.nodes_after)
+
+    # вложенный оператор как отдельный блок (при необходимости оборачивается в StmtListNode)
+    def _body(self, stmt: AstNode) -> AstNode:
+        if isinstance(stmt, StmtListNode):
+            stmt.exprs = tuple(self._block(list(stmt.exprs)))
+            return stmt
+        stmts = self._block([stmt])
+        return stmts[0] if len(stmts) == 1 else make_block(*stmts)
+
+    def _block(self, stmts: List[AstNode]) -> List[AstNode]:
+        # вложенные блоки обрабатываются раньше
+        for stmt in stmts:
+            if isinstance(stmt, IfNode):
+                stmt.then_stmt = self._body(stmt.then_stmt)
+                if stmt.else_stmt is not None:
+                    stmt.else_stmt = self._body(stmt.else_stmt)
+            elif isinstance(stmt, ForNode):
+                stmt.body = self._body(stmt.body)
+            elif isinstance(stmt, StmtListNode):
+                stmt.exprs = tuple(self._block(list(stmt.exprs)))
+
+        # после выноса выражения в его объявлении могут найтись новые общие подвыражения
+        while True:
+            numbering = _ValueNumbering()
+            for stmt in stmts:
+                numbering.statement(stmt)
+            chosen = self._choose(numbering)
+            if not chosen:
+                return stmts
+            stmts = self._hoist(stmts, numbering, chosen)
+
+    def _hoist(self, stmts: List[AstNode], numbering: _ValueNumbering,
+               chosen: List[Tuple[_Occurrence, List[_Occurrence]]]) -> List[AstNode]:
+        replace: Dict[int, IdentDesc] = {}
+        before: Dict[int, List[Tuple[int, AstNode]]] = {}
+        for definer, occurrences in chosen:
+            desc = self._temps.new(definer.node.node_type)
+            before.setdefault(definer.stmt, []).append((definer.seq, make_declaration(desc, definer.node)))
+            for occurrence in occurrences:
+                replace[id(occurrence.node)] = desc
+            self.temps += 1
+            self.replaced += len(occurrences)
+
+        def rewrite(node: AstNode) -> AstNode:
+            desc = replace.get(id(node))
+            if desc is not None:
+                return make_ident(desc, node)
+            return ast_utils.replace_children(node, rewrite)
+
+        result = []
+        for i, stmt in enumerate(stmts):
+            result.extend(decl for _, decl in sorted(before.get(i, ()), key=lambda item: item[0]))
+            if isinstance(stmt, IfNode):
+                stmt.cond = rewrite(stmt.cond)
+            elif numbering.roots[i]:
+                ast_utils.replace_children(stmt, rewrite)
+            result.append(stmt)
+        return result
+
+    # выносимые выражения (от больших к меньшим): вхождения внутри уже вынесенного выражения не учитываются.
+    # Временная переменная вычисляется перед оператором первого вхождения, которое можно туда перенести,
+    # и заменяет вхождения начиная с этого оператора
+    def _choose(self, numbering: _ValueNumbering) -> List[Tuple[_Occurrence, List[_Occurrence]]]:
+        candidates = [occurrences for occurrences in numbering.occurrences.values() if len(occurrences) >= 2]
+        if not candidates:
+            return []
+        parents: Dict[int, AstNode] = {}
+        for roots in numbering.roots:
+            for root in roots:
+                for node in ast_utils.walk(root):
+                    for child in ast_utils.child_nodes(node):
+                        parents[id(child)] = node
+
+        covered: set = set()
+
+        def visible(node: AstNode) -> bool:
+            parent = parents.get(id(node))
+            while parent is not None:
+                if id(parent) in covered:
+                    return False
+                parent = parents.get(id(parent))
+            return True
+
+        candidates.sort(key=lambda occurrences: -ast_utils.count_nodes(occurrences[0].node))
+        chosen = []
+        for occurrences in candidates:
+            occurrences = [occurrence for occurrence in occurrences if visible(occurrence.node)]
+            definer = next((occurrence for occurrence in occurrences if occurrence.hoistable), None)
+            if definer is None:
+                continue
+            occurrences = [occurrence for occurrence in occurrences if occurrence.stmt >= definer.stmt]
+            if len(occurrences) < 2:
+                continue
+            chosen.append((definer, occurrences))
+            covered.update(id(occurrence.node) for occurrence in occurrences)
+        return chosen
+
+
+def eliminate_common_subexpressions(prog: StmtListNode) -> StmtListNode:
+    return CommonSubexprEliminator().eliminate(prog)
@@ -0,0 +1,415 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Any, Deque, Dict, List, Optional
+
+import pyparsing as pp
+
+import _parser
+import limits as limits_
+import semantic
+
+
+OUTPUTS = ('diagnostics', 'tree', 'json')
+
+# коды ошибок JSON-RPC
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+TIMEOUT_ERROR = -32000
+
+# сколько последних замеров задержки хранить для каждого метода
+LATENCY_WINDOW = 1000
+
+# запас времени сверх таймаута запроса, после которого рабочий процесс завершается принудительно:
+# за время таймаута компиляция обычно сама прерывается по бюджету (limits.Guard) с диагностикой
+KILL_GRACE = 1.0
+
+
+# компилирует программу и возвращает диагностику, дерево и/или JSON-представление AST;
+# limits - параметры limits.Limits, при превышении ограничения компиляция прерывается с диагностикой
+def compile_source(source: str, outputs: List[str] = OUTPUTS, check: bool = True,
+                   limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {'ok': True, 'diagnostics': []}
+    limits = limits_.Limits(**limits) if limits is not None else None
+    guard = limits.guard() if limits is not None else None
+    try:
+        prog = limits_.parse(source, limits, guard) if limits is not None else _parser.parse(source)
+    except pp.ParseBaseException as e:
+        result['ok'] = False
+        result['diagnostics'].append({'stage': 'parse', 'message': str(e), 'row': e.lineno, 'col': e.col})
+        return result
+    except limits_.LimitException as e:
+        result['ok'] = False
+        result['diagnostics'].append(e.to_dict())
+        return result
+    if check:
+        try:
+            if limits is not None:
+                limits_.semantic_check(prog, limits, guard)
+            else:
+                prog.semantic_check(semantic.prepare_global_scope())
+        except limits_.LimitException as e:
+            result['ok'] = False
+            result['diagnostics'].append(e.to_dict())
+            return result
+        except semantic.SemanticException as e:
+            result['ok'] = False
+            result['diagnostics'].append({'stage': 'semantic', 'message': e.message, 'row': e.row, 'col': e.col})
+    if 'tree' in outputs:
+        result['tree'] = list(prog.tree)
+    if 'json' in outputs:
+        result['ast'] = prog.to_dict()
+    if 'diagnostics' not in outputs and result['ok']:
+        del result['diagnostics']
+    return result
+
+
+# цикл рабочего процесса: парсер и модули уже загружены, запросы приходят через канал
+def _worker_main(conn: Connection) -> None:
+    compile_source('int a = 1;')
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            response = {'result': compile_source(**request)}
+        except Exception as e:
+            response = {'error': '{}: {}'.format(type(e).__name__, e)}
+        conn.send(response)
+    conn.close()
+
+
+# заранее запущенный рабочий процесс
+class _Worker:
+
+    def __init__(self, ctx: multiprocessing.context.BaseContext) -> None:
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    async def call(self, request: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fd = self.conn.fileno()
+
+        def on_readable():
+            loop.remove_reader(fd)
+            if future.done():
+                return
+            try:
+                future.set_result(self.conn.recv())
+            except (EOFError, OSError) as e:
+                future.set_exception(e)
+
+        loop.add_reader(fd, on_readable)
+        try:
+            self.conn.send(request)
+            return await future
+        finally:
+            loop.remove_reader(fd)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+# пул заранее запущенных рабочих процессов с прогретым парсером
+class WorkerPool:
+
+    def __init__(self, size: int = os.cpu_count() or 1) -> None:
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if self._ctx.get_start_method() == 'forkserver':
+            # рабочие процессы порождаются из сервера, в котором модули компилятора уже загружены
+            self._ctx.set_forkserver_preload(['_parser', 'semantic', 'ast_nodes', 'limits', 'daemon'])
+        self.size = size
+        self._workers: List[_Worker] = []
+        self._idle: Optional[asyncio.Queue] = None
+
+    async def start(self) -> None:
+        self._idle = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        workers = await asyncio.gather(*(loop.run_in_executor(None, _Worker, self._ctx) for _ in range(self.size)))
+        for worker in workers:
+            self._workers.append(worker)
+            self._idle.put_nowait(worker)
+
+    async def submit(self, request: dict, timeout: Optional[float] = None) -> dict:
+        worker: _Worker = await self._idle.get()
+        try:
+            response = await asyncio.wait_for(worker.call(request), timeout)
+        except (asyncio.TimeoutError, EOFError, OSError):
+            # зависший или упавший процесс заменяется новым
+            self._workers.remove(worker)
+            worker.kill()
+            worker = await asyncio.get_running_loop().run_in_executor(None, _Worker, self._ctx)
+            self._workers.append(worker)
+            raise
+        finally:
+            self._idle.put_nowait(worker)
+        return response
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.stop()
+        self._workers.clear()
+
+
+# статистика задержек по методам
+class LatencyMetrics:
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self.window = window
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.timeouts: Dict[str, int] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, method: str, seconds: float, error: bool = False, timeout: bool = False) -> None:
+        self.counts[method] = self.counts.get(method, 0) + 1
+        if error:
+            self.errors[method] = self.errors.get(method, 0) + 1
+        if timeout:
+            self.timeouts[method] = self.timeouts.get(method, 0) + 1
+        self._samples.setdefault(method, deque(maxlen=self.window)).append(seconds)
+
+    def summary(self) -> Dict[str, dict]:
+        r = {}
+        for method, samples in self._samples.items():
+            ordered = sorted(samples)
+
+            def percentile(p: float) -> float:
+                return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+            r[method] = {
+                'count': self.counts[method],
+                'errors': self.errors.get(method, 0),
+                'timeouts': self.timeouts.get(method, 0),
+                'mean_ms': sum(ordered) / len(ordered) * 1000,
+                'p50_ms': percentile(0.5),
+                'p90_ms': percentile(0.9),
+                'p99_ms': percentile(0.99),
+                'max_ms': ordered[-1] * 1000,
+            }
+        return r
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+# демон компиляции: принимает запросы JSON-RPC и распределяет их по пулу рабочих процессов
+class CompileDaemon:
+
+    def __init__(self, workers: int = os.cpu_count() or 1, timeout: Optional[float] = 10.0,
+                 limits: Optional[limits_.Limits] = None) -> None:
+        self.pool = WorkerPool(workers)
+        self.timeout = timeout
+        # ограничения для всех запросов; время компиляции берется из таймаута запроса
+        self.limits = limits or limits_.Limits()
+        self.metrics = LatencyMetrics()
+        self.started = time.time()
+        self._stopped: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        self._stopped = asyncio.Event()
+        await self.pool.start()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    async def _compile(self, params: dict) -> dict:
+        source = params.get('source')
+        if not isinstance(source, str):
+            raise RpcError(INVALID_PARAMS, 'Параметр source должен быть строкой')
+        outputs = params.get('outputs', list(OUTPUTS))
+        if not isinstance(outputs, list) or any(o not in OUTPUTS for o in outputs):
+            raise RpcError(INVALID_PARAMS, 'Параметр outputs должен быть списком из {}'.format(', '.join(OUTPUTS)))
+        timeout = params.get('timeout', self.timeout)
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or
+                                    not 0 < timeout < float('inf')):
+            raise RpcError(INVALID_PARAMS, 'Параметр timeout должен быть положительным числом')
+        limits = dict(vars(self.limits), timeout=timeout)
+        request = {'source': source, 'outputs': outputs, 'check': bool(params.get('check', True)), 'limits': limits}
+        try:
+            response = await self.pool.submit(request, timeout + KILL_GRACE if timeout is not None else None)
+        except asyncio.TimeoutError:
+            raise RpcError(TIMEOUT_ERROR, 'Превышено время компиляции ({} с)'.format(timeout))
+        except (EOFError, OSError):
+            raise RpcError(INTERNAL_ERROR, 'Рабочий процесс аварийно завершился')
+        if 'error' in response:
+            raise RpcError(INTERNAL_ERROR, response['error'])
+        return response['result']
+
+    async def handle(self, message: Any) -> Optional[dict]:
+        if not isinstance(message, dict) or not isinstance(message.get('method'), str):
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': INVALID_REQUEST, 'message': 'Некорректный запрос'}}
+        method, params, id_ = message['method'], message.get('params') or {}, message.get('id')
+        start = time.perf_counter()
+        error = None
+        try:
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, 'Параметры должны быть объектом')
+            if method == 'compile':
+                result = await self._compile(params)
+            elif method == 'stats':
+                result = {'uptime': time.time() - self.started, 'workers': self.pool.size,
+                          'methods': self.metrics.summary()}
+            elif method == 'ping':
+                result = 'pong'
+            elif method == 'shutdown':
+                self._stopped.set()
+                result = None
+            else:
+                raise RpcError(METHOD_NOT_FOUND, 'Метод {} не найден'.format(method))
+        except RpcError as e:
+            error = {'code': e.code, 'message': e.message}
+        except Exception as e:
+            # ошибка демона не должна оставлять запрос без ответа
+            error = {'code': INTERNAL_ERROR, 'message': '{}: {}'.format(type(e).__name__, e)}
+        self.metrics.record(method, time.perf_counter() - start, error is not None,
+                            error is not None and error['code'] == TIMEOUT_ERROR)
+        if id_ is None:
+            return None
+        if error:
+            return {'jsonrpc': '2.0', 'id': id_, 'error': error}
+        return {'jsonrpc': '2.0', 'id': id_, 'result': result}
+
+    # обрабатывает поток сообщений (по одному JSON в строке), запросы выполняются параллельно
+    async def serve_stream(self, reader: asyncio.StreamReader, write) -> None:
+        tasks = set()
+
+        async def process(line: bytes):
+            try:
+                message = json.loads(line)
+            except ValueError:
+                response = {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': 'Некорректный JSON'}}
+            else:
+                response = await self.handle(message)
+            if response is not None:
+                await write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        # чтение прерывается остановкой демона, даже если клиент не закрывает поток
+        stopped = asyncio.ensure_future(self._stopped.wait())
+        try:
+            while not self._stopped.is_set():
+                read = asyncio.ensure_future(reader.readline())
+                await asyncio.wait((read, stopped), return_when=asyncio.FIRST_COMPLETED)
+                if not read.done():
+                    read.cancel()
+                    break
+                line = read.result()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(process(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        finally:
+            stopped.cancel()
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def serve_unix(self, path: str) -> None:
+        async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            lock = asyncio.Lock()
+
+            async def write(data: bytes):
+                async with lock:
+                    writer.write(data)
+                    await writer.drain()
+
+            try:
+                await self.serve_stream(reader, write)
+            finally:
+                writer.close()
+
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(on_connect, path, limit=2 ** 30)
+        try:
+            await self._stopped.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            os.unlink(path)
+
+    async def serve_stdio(self) -> None:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=2 ** 30)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        out = sys.stdout.buffer
+
+        async def write(data: bytes):
+            out.write(data)
+            out.flush()
+
+        await self.serve_stream(reader, write)
+
+
+# синхронный клиент для обращения к демону через Unix-сокет
+def request(path: str, method: str, params: Optional[dict] = None, id_: int = 1) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        message = {'jsonrpc': '2.0', 'id': id_, 'method': method, 'params': params or {}}
+        sock.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+async def run(args: argparse.Namespace) -> None:
+    limits = limits_.Limits(args.max_source_size, args.max_depth, args.max_nodes)
+    daemon = CompileDaemon(args.workers, args.timeout, limits)
+    await daemon.start()
+    try:
+        if args.socket:
+            await daemon.serve_unix(args.socket)
+        else:
+            await daemon.serve_stdio()
+    finally:
+        daemon.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    arg_parser = argparse.ArgumentParser(description='Демон компиляции (JSON-RPC через Unix-сокет или stdin)')
+    arg_parser.add_argument('--socket', help='путь к Unix-сокету (по умолчанию stdin/stdout)')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    arg_parser.add_argument('--timeout', type=float, default=10.0, help='время на один запрос, с')
+    arg_parser.add_argument('--max-source-size', type=int, default=1 << 20, help='размер программы, символов')
+    arg_parser.add_argument('--max-depth', type=int, default=200, help='вложенность скобок и глубина AST')
+    arg_parser.add_argument('--max-nodes', type=int, default=1_000_000, help='количество узлов AST')
+    args = arg_parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
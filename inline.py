@@ -0,0 +1,323 @@
+from typing import Dict, List, Optional, Set
+
+import ast_utils
+from ast_utils import make_ident, make_assign, make_declaration, make_block
+from ast_nodes import AstNode, ExprNode, LiteralNode, IdentNode, CallNode, TypeConvertNode, AssignNode, VarsNode, \
+    ReturnNode, IfNode, ForNode, FuncNode, StmtListNode, type_convert
+from callgraph import CallGraph
+from semantic import DataType, IdentDesc, IdentScope, NativeIdentDesc, VariableScope
+
+
+# места вызова, которые заменяются телом функции целиком (вызов - все значение оператора)
+_DROP, _ASSIGN, _DECLARE, _RETURN = 'drop', 'assign', 'declare', 'return'
+
+
+def _calls_program_functions(node: AstNode) -> bool:
+    return any(isinstance(n, CallNode) and not isinstance(n.func.node_ident, NativeIdentDesc)
+               for n in ast_utils.walk(node))
+
+
+def _has_calls(node: AstNode) -> bool:
+    return any(isinstance(n, CallNode) for n in ast_utils.walk(node))
+
+
+def _uses(node: AstNode) -> Dict[IdentDesc, int]:
+    uses: Dict[IdentDesc, int] = {}
+    for n in ast_utils.walk(node):
+        if isinstance(n, IdentNode) and n.node_ident is not None:
+            uses[n.node_ident] = uses.get(n.node_ident, 0) + 1
+    return uses
+
+
+# подстановка выражений вместо идентификаторов (каждый раз подставляется новая копия выражения)
+def _replace(node: AstNode, values: Dict[IdentDesc, ExprNode]) -> AstNode:
+    if isinstance(node, IdentNode) and node.node_ident in values:
+        return ast_utils.clone(values[node.node_ident])
+    return ast_utils.replace_children(node, lambda child: _replace(child, values))
+
+
+# переименование переменных в копии тела функции
+def _rename(node: AstNode, names: Dict[IdentDesc, IdentDesc]) -> AstNode:
+    for n in ast_utils.walk(node):
+        desc = names.get(n.node_ident) if n.node_ident is not None else None
+        if desc is not None:
+            n.node_ident = desc
+            if isinstance(n, IdentNode):
+                n.name = desc.name
+    return node
+
+
+# вызов, значение которого целиком составляет выражение (возможно, с преобразованием типа)
+def _call_of(expr: Optional[AstNode]) -> Optional[CallNode]:
+    if isinstance(expr, TypeConvertNode):
+        expr = expr.expr
+    return expr if isinstance(expr, CallNode) else None
+
+
+# заменяет вызов в выражении (возможно, обернутый в преобразование типа) новым значением
+def _with_value(expr: ExprNode, value: ExprNode) -> ExprNode:
+    if isinstance(expr, TypeConvertNode):
+        expr.expr = value
+        return expr
+    return value
+
+
+# переменные, которые встраивание добавляет в кадр функции или в глобальную область. Регистрируются
+# в области видимости кадра (add_ident выдает индекс после занятых, см. FrameSlots); имя не совпадает
+# ни с одним именем программы и ранее добавленных переменных (names - общее множество имен)
+class _Frame:
+
+    def __init__(self, scope: VariableScope, frame: AstNode, names: Set[str]) -> None:
+        self.scope = IdentScope()
+        if scope == VariableScope.LOCAL:
+            self.scope = IdentScope(self.scope)
+            self.scope.func = frame.name.node_ident
+        self.scope.var_index = ast_utils.FrameSlots(scope, frame).index
+        self.names = names
+
+    def new(self, name: str, type_: DataType) -> IdentDesc:
+        base, suffix = name, 1
+        while name in self.names:
+            suffix += 1
+            name = '{}_{}'.format(base, suffix)
+        self.names.add(name)
+        return self.scope.add_ident(IdentDesc(name, type_))
+
+
+# встраивание тел небольших нерекурсивных функций в места их вызова.
+# Функции обрабатываются от вызываемых к вызывающим, поэтому встраиваемое тело уже содержит
+# встроенные в него функции. Работает с проверенным AST и возвращает преобразованную копию
+class Inliner:
+
+    def __init__(self, max_size: int = 40, budget: Optional[int] = None) -> None:
+        # наибольший размер (в узлах) тела встраиваемой функции
+        self.max_size = max_size
+        # на сколько узлов всего может вырасти программа (None - без ограничения)
+        self.budget = budget
+        # имя функции -> количество встроенных вызовов
+        self.inlined: Dict[str, int] = {}
+        self.expression_sites = 0
+        self.statement_sites = 0
+        self.added_nodes = 0
+        self.recursive: Set[str] = set()
+        self._graph: Optional[CallGraph] = None
+        self._slots: Optional[_Frame] = None
+        self._counter = 0
+        self._expressions: Dict[IdentDesc, Optional[ExprNode]] = {}
+
+    def inline(self, prog: StmtListNode) -> StmtListNode:
+        prog = ast_utils.clone(prog)
+        names = {node.node_ident.name for node in ast_utils.walk(prog) if node.node_ident is not None}
+        self._graph = CallGraph(prog)
+        self.recursive = {desc.name for desc in self._graph.recursive}
+        for desc in self._graph.bottom_up():
+            func = self._graph.functions[desc]
+            self._slots = _Frame(VariableScope.LOCAL, func, names)
+            func.body = self._single(self._transform(func.body))
+        self._slots = _Frame(VariableScope.GLOBAL, prog, names)
+        exprs = []
+        for expr in prog.exprs:
+            exprs.extend((expr,) if isinstance(expr, FuncNode) else self._transform(expr))
+        prog.exprs = tuple(exprs)
+        self._graph = self._slots = None
+        return prog
+
+    # сводка о встроенных функциях
+    def report(self) -> str:
+        lines = ['встроено вызовов: {} (в выражения: {}, операторами: {}), добавлено узлов: {}'.format(
+            self.expression_sites + self.statement_sites, self.expression_sites, self.statement_sites,
+            self.added_nodes
+        )]
+        for name, count in sorted(self.inlined.items()):
+            lines.append('  {}: {}'.format(name, count))
+        if self.recursive:
+            lines.append('рекурсивные функции (не встраиваются): {}'.format(', '.join(sorted(self.recursive))))
+        return '\n'.join(lines)
+
+    # встраиваемая функция, вызываемая в call
+    def _candidate(self, call: CallNode) -> Optional[FuncNode]:
+        desc = call.func.node_ident
+        func = self._graph.functions.get(desc)
+        if func is None or self._graph.is_recursive(desc) or not isinstance(func.body, StmtListNode):
+            return None
+        if ast_utils.count_nodes(func.body) > self.max_size:
+            return None
+        # единственный выход из функции: return может быть только последним оператором тела
+        exprs = func.body.exprs
+        returns = [n for n in ast_utils.walk(func.body) if isinstance(n, ReturnNode)]
+        if returns and (len(returns) > 1 or not exprs or returns[0] is not exprs[-1]):
+            return None
+        return func
+
+    def _spend(self, added: int) -> bool:
+        if self.budget is not None and self.added_nodes + added > self.budget:
+            return False
+        self.added_nodes += added
+        return True
+
+    def _count(self, func: FuncNode) -> None:
+        self.inlined[func.name.name] = self.inlined.get(func.name.name, 0) + 1
+
+    def _single(self, stmts: List[AstNode]) -> AstNode:
+        return stmts[0] if len(stmts) == 1 else make_block(*stmts)
+
+    def _transform(self, node: AstNode) -> List[AstNode]:
+        if isinstance(node, StmtListNode):
+            exprs = []
+            for expr in node.exprs:
+                exprs.extend(self._transform(expr))
+            node.exprs = tuple(exprs)
+            return [node]
+        if isinstance(node, IfNode):
+            node.cond = self._inline_expr(node.cond)
+            node.then_stmt = self._single(self._transform(node.then_stmt))
+            if node.else_stmt:
+                node.else_stmt = self._single(self._transform(node.else_stmt))
+            return [node]
+        if isinstance(node, ForNode):
+            # в заголовке цикла встраиваются только выражения
+            node.init = self._inline_expr(node.init)
+            node.cond = self._inline_expr(node.cond)
+            node.step = self._inline_expr(node.step)
+            node.body = self._single(self._transform(node.body))
+            return [node]
+        node = self._inline_expr(node)
+        if isinstance(node, VarsNode) and len(node.vars) > 1:
+            # объявление нескольких переменных разбивается, чтобы встроить вызов в одно из них
+            stmts = []
+            for var in node.vars:
+                single = VarsNode(ast_utils.clone(node.type), var, row=node.row, col=node.col)
+                single.node_type = node.node_type
+                stmts.extend(self._inline_stmt(single))
+            return stmts if len(stmts) > len(node.vars) else [node]
+        return self._inline_stmt(node)
+
+    # встраивание вызовов внутри выражения: тело функции вида { T x = ...; return <выражение>; }
+    # подставляется в выражение, если аргументы - литералы или переменные
+    def _inline_expr(self, node: AstNode) -> AstNode:
+        ast_utils.replace_children(node, self._inline_expr)
+        if not isinstance(node, CallNode):
+            return node
+        func = self._candidate(node)
+        if func is None:
+            return node
+        expr = self._expression_form(func)
+        if expr is None:
+            return node
+        values = {}
+        for param, arg in zip(func.params, node.params):
+            value = arg.expr if isinstance(arg, TypeConvertNode) else arg
+            if isinstance(value, LiteralNode):
+                pass
+            # глобальную переменную могут изменить функции, вызываемые до использования параметра
+            elif isinstance(value, IdentNode) and not (value.node_ident.scope == VariableScope.GLOBAL
+                                                       and _calls_program_functions(expr)):
+                pass
+            else:
+                return node
+            values[param.name.node_ident] = arg
+        result = _replace(ast_utils.clone(expr), values)
+        if not self._spend(ast_utils.count_nodes(result) - ast_utils.count_nodes(node)):
+            return node
+        self.expression_sites += 1
+        self._count(func)
+        return result
+
+    # тело функции в виде одного выражения (с подставленными локальными переменными) или None
+    def _expression_form(self, func: FuncNode) -> Optional[ExprNode]:
+        desc = func.name.node_ident
+        if desc in self._expressions:
+            return self._expressions[desc]
+        self._expressions[desc] = None
+        exprs = func.body.exprs
+        if not exprs or not isinstance(exprs[-1], ReturnNode):
+            return None
+        values: Dict[IdentDesc, ExprNode] = {}
+        # использования переменных во всех начальных значениях и в возвращаемом выражении: каждое
+        # использование получает свою копию значения, поэтому вычисляемое значение допускает только одно
+        uses = _uses(exprs[-1].val)
+        for stmt in exprs[:-1]:
+            if not isinstance(stmt, VarsNode):
+                return None
+            for var in stmt.vars:
+                # переменная с вызовами в начальном значении изменила бы порядок вызовов
+                if not isinstance(var, AssignNode) or _has_calls(var.val):
+                    return None
+                for local, count in _uses(var.val).items():
+                    uses[local] = uses.get(local, 0) + count
+                values[var.var.node_ident] = _replace(ast_utils.clone(var.val), values)
+        for local, value in values.items():
+            if uses.get(local, 0) > 1 and not isinstance(value, (LiteralNode, IdentNode)):
+                return None
+        expr = _replace(ast_utils.clone(exprs[-1].val), values)
+        self._expressions[desc] = expr
+        return expr
+
+    # встраивание вызова, составляющего значение оператора: аргументы сохраняются в переменных,
+    # затем выполняется переименованная копия тела и результат присваивается (возвращается) вместо вызова
+    def _inline_stmt(self, stmt: AstNode) -> List[AstNode]:
+        if isinstance(stmt, CallNode):
+            kind, call = _DROP, stmt
+        elif isinstance(stmt, AssignNode):
+            kind, call = _ASSIGN, _call_of(stmt.val)
+        elif isinstance(stmt, VarsNode) and isinstance(stmt.vars[0], AssignNode):
+            kind, call = _DECLARE, _call_of(stmt.vars[0].val)
+        elif isinstance(stmt, ReturnNode):
+            kind, call = _RETURN, _call_of(stmt.val)
+        else:
+            return [stmt]
+        func = self._candidate(call) if call is not None else None
+        if func is None:
+            return [stmt]
+        body = func.body.exprs
+        has_result = bool(body) and isinstance(body[-1], ReturnNode)
+        if kind != _DROP and not has_result:
+            return [stmt]
+
+        # параметры и локальные переменные функции становятся переменными вызывающего кода с новыми именами
+        self._counter += 1
+        names: Dict[IdentDesc, IdentDesc] = {}
+        for n in ast_utils.walk(func):
+            desc = n.node_ident
+            if isinstance(n, IdentNode) and desc is not None and desc not in names and \
+                    desc.scope in (VariableScope.PARAM, VariableScope.LOCAL):
+                names[desc] = self._slots.new('{}__{}{}'.format(func.name.name, desc.name, self._counter), desc.type)
+
+        stmts: List[AstNode] = []
+        for param, arg in zip(func.params, call.params):
+            stmts.append(make_declaration(names[param.name.node_ident], type_convert(arg, param.type.type)))
+        for expr in body[:-1] if has_result else body:
+            stmts.append(_rename(ast_utils.clone(expr), names))
+
+        result = _rename(ast_utils.clone(body[-1].val), names) if has_result else None
+        added = sum(ast_utils.count_nodes(n) for n in stmts) + (ast_utils.count_nodes(result) if result else 0) - \
+            ast_utils.count_nodes(call) + 1
+        if not self._spend(added):
+            return [stmt]
+        self.statement_sites += 1
+        self._count(func)
+
+        before: List[AstNode] = []
+        if kind == _DROP:
+            if result is not None and _has_calls(result):
+                stmts.append(make_declaration(self._slots.new('{}__result{}'.format(func.name.name, self._counter),
+                                                              result.node_type), result))
+        elif kind == _ASSIGN:
+            stmt.val = _with_value(stmt.val, result)
+            stmts.append(stmt)
+        elif kind == _DECLARE:
+            var = stmt.vars[0]
+            # переменная объявляется до блока со встроенным телом, чтобы остаться в своей области видимости
+            declaration = VarsNode(stmt.type, ast_utils.clone(var.var), row=stmt.row, col=stmt.col)
+            declaration.node_type = stmt.node_type
+            before.append(declaration)
+            var.val = _with_value(var.val, result)
+            stmts.append(var)
+        else:
+            stmt.val = _with_value(stmt.val, result)
+            stmts.append(stmt)
+        return [*before, make_block(*stmts)]
+
+
+def inline_functions(prog: StmtListNode, max_size: int = 40, budget: Optional[int] = None) -> StmtListNode:
+    return Inliner(max_size, budget).inline(prog)
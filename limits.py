@@ -0,0 +1,146 @@
+import re
+import time
+from typing import Optional, Tuple
+
+import _parser
+import ast_utils
+import semantic
+from ast_nodes import AstNode, StmtListNode
+
+
+# скобки, строки и комментарии: глубина вложенности считается по скобкам вне строк и комментариев
+_BRACKETS = re.compile(r'"(?:\\.|[^"\\\n])*"|/\*[\s\S]*?\*/|//[^\n]*|[(){}]')
+
+
+# ограничения на обработку недоверенной программы (None - без ограничения)
+class Limits:
+
+    def __init__(self, max_source_size: Optional[int] = 1 << 20, max_depth: Optional[int] = 200,
+                 max_nodes: Optional[int] = 1_000_000, timeout: Optional[float] = None) -> None:
+        # размер исходного текста, символов
+        self.max_source_size = max_source_size
+        # глубина вложенности скобок в тексте и глубина AST
+        self.max_depth = max_depth
+        # количество узлов, созданных парсером (включая отброшенные при возврате)
+        self.max_nodes = max_nodes
+        # время на разбор и проверку вместе, с
+        self.timeout = timeout
+
+    def guard(self) -> 'Guard':
+        return Guard(self)
+
+
+# превышение ограничения; stage - этап ('parse' или 'semantic'), limit - имя нарушенного ограничения
+class LimitException(semantic.SemanticException):
+
+    def __init__(self, limit: str, message: str, stage: str, row: int = None, col: int = None) -> None:
+        super().__init__(message, row, col)
+        self.limit = limit
+        self.stage = stage
+
+    def to_dict(self) -> dict:
+        return {'stage': self.stage, 'limit': self.limit, 'message': self.message, 'row': self.row, 'col': self.col}
+
+
+# бюджет одного запуска: отсчет времени начинается при создании.
+# Проверки кооперативные: парсер вызывает tick для каждого создаваемого узла,
+# семантическая проверка - для каждого оператора списка (см. IdentScope.guard)
+class Guard:
+
+    # время проверяется не на каждом узле, а раз в столько узлов
+    TIME_CHECK_PERIOD = 256
+
+    def __init__(self, limits: Limits) -> None:
+        self.limits = limits
+        self.deadline = time.monotonic() + limits.timeout if limits.timeout is not None else None
+        self.stage = 'parse'
+        self.nodes = 0
+
+    def tick(self) -> None:
+        self.nodes += 1
+        if self.limits.max_nodes is not None and self.nodes > self.limits.max_nodes:
+            raise LimitException('nodes', 'Превышено количество узлов ({})'.format(self.limits.max_nodes), self.stage)
+        if self.deadline is not None and self.nodes % self.TIME_CHECK_PERIOD == 0:
+            self.check_time()
+
+    def check_time(self, node: Optional[AstNode] = None) -> None:
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise LimitException('timeout', 'Превышено время компиляции ({} с)'.format(self.limits.timeout),
+                                 self.stage, node.row if node else None, node.col if node else None)
+
+    def check_source(self, source: str) -> None:
+        limits = self.limits
+        if limits.max_source_size is not None and len(source) > limits.max_source_size:
+            raise LimitException('source_size', 'Размер программы {} превышает {} символов'.format(
+                len(source), limits.max_source_size), self.stage)
+        if limits.max_depth is not None:
+            loc = _bracket_overflow(source, limits.max_depth)
+            if loc is not None:
+                row, col = _parser.ParseContext(source).position(loc - 1)
+                raise LimitException('depth', 'Вложенность скобок превышает {}'.format(limits.max_depth),
+                                     self.stage, row, col)
+
+    def check_tree(self, prog: AstNode) -> None:
+        if self.limits.max_depth is None:
+            return
+        node, depth = _deepest(prog)
+        if depth > self.limits.max_depth:
+            raise LimitException('depth', 'Глубина AST {} превышает {}'.format(depth, self.limits.max_depth),
+                                 self.stage, node.row, node.col)
+
+
+# позиция первой скобки, на которой вложенность превышает max_depth
+def _bracket_overflow(source: str, max_depth: int) -> Optional[int]:
+    if source.count('(') + source.count('{') <= max_depth:
+        return None
+    depth = 0
+    for m in _BRACKETS.finditer(source):
+        ch = m.group()
+        if ch == '(' or ch == '{':
+            depth += 1
+            if depth > max_depth:
+                return m.start()
+        elif ch == ')' or ch == '}':
+            depth -= 1
+    return None
+
+
+# самый глубокий узел дерева и его глубина (без рекурсии)
+def _deepest(prog: AstNode) -> Tuple[AstNode, int]:
+    deepest, max_depth = prog, 1
+    stack = [(prog, 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > max_depth:
+            deepest, max_depth = node, depth
+        stack.extend((child, depth + 1) for child in ast_utils.child_nodes(node))
+    return deepest, max_depth
+
+
+# разбор с ограничениями: переполнение стека при разборе тоже считается превышением вложенности
+def parse(source: str, limits: Limits, guard: Optional[Guard] = None) -> StmtListNode:
+    guard = guard or limits.guard()
+    guard.stage = 'parse'
+    guard.check_source(source)
+    try:
+        prog = _parser.parse(source, guard=guard)
+    except RecursionError:
+        raise LimitException('depth', 'Слишком глубокая вложенность конструкций', guard.stage) from None
+    guard.check_tree(prog)
+    return prog
+
+
+# семантическая проверка с ограничениями (глубина дерева проверяется в parse)
+def semantic_check(prog: StmtListNode, limits: Limits, guard: Optional[Guard] = None,
+                   scope: Optional[semantic.IdentScope] = None) -> semantic.IdentScope:
+    guard = guard or limits.guard()
+    guard.stage = 'semantic'
+    scope = scope or semantic.prepare_global_scope()
+    scope.guard = guard
+    try:
+        prog.semantic_check(scope)
+    except RecursionError:
+        raise LimitException('depth', 'Слишком глубокая вложенность конструкций', guard.stage) from None
+    finally:
+        scope.guard = None
+    return scope
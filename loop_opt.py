@@ -0,0 +1,369 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import ast_utils
+from ast_utils import make_literal, make_ident, make_binop, make_assign, make_declaration, make_block
+from ast_nodes import AstNode, ExprNode, LiteralNode, IdentNode, BinOpNode, CallNode, AssignNode, VarsNode, ForNode, \
+    FuncNode, StmtListNode, EMPTY_STMT
+from semantic import BinaryOperation, DataType, IdentDesc, IdentScope, NativeIdentDesc, VariableScope
+
+
+# операции сравнения в условии цикла -> проверка значения переменной цикла
+_CONDITIONS = {
+    BinaryOperation.LT: lambda i, n: i < n,
+    BinaryOperation.LE: lambda i, n: i <= n,
+    BinaryOperation.GT: lambda i, n: i > n,
+    BinaryOperation.GE: lambda i, n: i >= n,
+    BinaryOperation.NOTEQUALS: lambda i, n: i != n,
+}
+# сравнение с переставленными операндами (n < i то же, что i > n)
+_SWAPPED = {
+    BinaryOperation.LT: BinaryOperation.GT,
+    BinaryOperation.LE: BinaryOperation.GE,
+    BinaryOperation.GT: BinaryOperation.LT,
+    BinaryOperation.GE: BinaryOperation.LE,
+    BinaryOperation.NOTEQUALS: BinaryOperation.NOTEQUALS,
+}
+# число итераций больше этого значения не вычисляется
+_MAX_TRIP_COUNT = 100000
+
+
+# временные переменные оптимизации (__t1, __t2, ...) в кадре функции или в глобальной области.
+# Регистрируются в области видимости кадра, в которую занесены все имена кадра: имя временной переменной
+# не совпадает с именами программы, add_ident выдает индекс после занятых (см. FrameSlots)
+class _Temps:
+
+    def __init__(self, scope: VariableScope, frame: AstNode, counter: List[int]) -> None:
+        self.scope = IdentScope()
+        if scope == VariableScope.LOCAL:
+            self.scope = IdentScope(self.scope)
+            self.scope.func = frame.name.node_ident
+        self.scope.var_index = ast_utils.FrameSlots(scope, frame).index
+        for node in ast_utils.walk(frame):
+            if node.node_ident is not None:
+                self.scope.idents.setdefault(node.node_ident.name, node.node_ident)
+        self.counter = counter
+
+    def new(self, type_: DataType) -> IdentDesc:
+        name = None
+        while name is None or self.scope.get_ident(name) is not None:
+            self.counter[0] += 1
+            name = '__t{}'.format(self.counter[0])
+        return self.scope.add_ident(IdentDesc(name, type_))
+
+
+# описание цикла вида for (int i = s; i < n; i = i + c) с переменной цикла i
+class _Induction:
+
+    def __init__(self, var: IdentDesc, start: ExprNode, step: int, update: AssignNode, declared: bool) -> None:
+        self.var = var
+        self.start = start
+        self.step = step
+        # изменение переменной цикла среди операторов шага
+        self.update = update
+        # переменная объявлена в заголовке цикла (иначе ее значение нужно и после цикла)
+        self.declared = declared
+        self.trip_count: Optional[int] = None
+        self.values: List[int] = []
+
+
+# идентификаторы, которым присваиваются значения внутри поддерева, и наличие вызовов функций программы
+def _assigned(node: AstNode) -> Tuple[Set[IdentDesc], bool]:
+    assigned, calls = set(), False
+    for n in ast_utils.walk(node):
+        if isinstance(n, AssignNode):
+            assigned.add(n.var.node_ident)
+        elif isinstance(n, CallNode) and not isinstance(n.func.node_ident, NativeIdentDesc):
+            calls = True
+    return assigned, calls
+
+
+def _uses(node: AstNode, desc: IdentDesc) -> bool:
+    return any(isinstance(n, IdentNode) and n.node_ident is desc for n in ast_utils.walk(node))
+
+
+def _int_literal(node: AstNode) -> Optional[int]:
+    if isinstance(node, LiteralNode) and node.node_type == DataType.INT:
+        return node.value
+    return None
+
+
+# распознает переменную цикла: одно присваивание в заголовке, шаг i = i +/- c и переменная не меняется в теле
+def _induction(loop: ForNode) -> Optional[_Induction]:
+    init = loop.init
+    if isinstance(init, VarsNode) and len(init.vars) == 1 and isinstance(init.vars[0], AssignNode):
+        assign, declared = init.vars[0], True
+    elif isinstance(init, StmtListNode) and len(init.exprs) == 1 and isinstance(init.exprs[0], AssignNode):
+        assign, declared = init.exprs[0], False
+    else:
+        return None
+    var = assign.var.node_ident
+    if var.type != DataType.INT:
+        return None
+
+    if not isinstance(loop.step, StmtListNode):
+        return None
+    steps = [expr for expr in loop.step.exprs if isinstance(expr, AssignNode) and expr.var.node_ident is var]
+    if len(steps) != 1 or not isinstance(steps[0].val, BinOpNode):
+        return None
+    val = steps[0].val
+    if val.op not in (BinaryOperation.ADD, BinaryOperation.SUB):
+        return None
+    if isinstance(val.arg1, IdentNode) and val.arg1.node_ident is var:
+        step = _int_literal(val.arg2)
+    elif val.op == BinaryOperation.ADD and isinstance(val.arg2, IdentNode) and val.arg2.node_ident is var:
+        step = _int_literal(val.arg1)
+    else:
+        return None
+    if not step:
+        return None
+    if val.op == BinaryOperation.SUB:
+        step = -step
+
+    assigned, calls = _assigned(make_block(loop.cond, loop.body, *(e for e in loop.step.exprs if e is not steps[0])))
+    # глобальную переменную цикла может изменить вызываемая функция
+    if var in assigned or (calls and var.scope == VariableScope.GLOBAL) or _uses(assign.val, var):
+        return None
+    return _Induction(var, assign.val, step, steps[0], declared)
+
+
+# число итераций при постоянных начальном значении и границе
+def _trip_count(loop: ForNode, induction: _Induction) -> None:
+    start, cond = _int_literal(induction.start), loop.cond
+    if start is None or not isinstance(cond, BinOpNode) or cond.op not in _CONDITIONS:
+        return
+    if isinstance(cond.arg1, IdentNode) and cond.arg1.node_ident is induction.var:
+        op, bound = cond.op, _int_literal(cond.arg2)
+    elif isinstance(cond.arg2, IdentNode) and cond.arg2.node_ident is induction.var:
+        op, bound = _SWAPPED[cond.op], _int_literal(cond.arg1)
+    else:
+        return
+    if bound is None:
+        return
+    check, i, values = _CONDITIONS[op], start, []
+    while check(i, bound):
+        if len(values) >= _MAX_TRIP_COUNT:
+            return
+        values.append(i)
+        i += induction.step
+    induction.trip_count = len(values)
+    induction.values = values
+
+
+# ключ выражения: одинаковые выражения с одними и теми же переменными выносятся в одну временную переменную
+def _expr_key(node: AstNode) -> tuple:
+    return tuple((type(n), n.to_str(), str(n.node_type), id(n.node_ident) if n.node_ident is not None else None)
+                 for n in ast_utils.walk(node))
+
+
+# подстановка значения вместо переменной цикла в копию тела
+def _substitute(node: AstNode, desc: IdentDesc, value: int) -> AstNode:
+    if isinstance(node, IdentNode) and node.node_ident is desc:
+        return make_literal(value, DataType.INT, node)
+    return ast_utils.replace_children(node, lambda child: _substitute(child, desc, value))
+
+
+# оптимизация циклов for: вынос инвариантных выражений, снижение стоимости умножений на переменную цикла
+# и полная или частичная развертка циклов с постоянным числом итераций.
+# Работает с проверенным AST и возвращает преобразованную копию, исходное дерево не меняется
+class LoopOptimizer:
+
+    def __init__(self, unroll_limit: int = 8, unroll_factor: int = 4, max_unrolled_nodes: int = 256) -> None:
+        # циклы не более чем из unroll_limit итераций разворачиваются полностью
+        self.unroll_limit = unroll_limit
+        # во сколько раз частично развертывается тело более длинного цикла
+        self.unroll_factor = unroll_factor
+        # предельный размер развернутого тела (в узлах)
+        self.max_unrolled_nodes = max_unrolled_nodes
+        self.unrolled = 0
+        self.partially_unrolled = 0
+        self.reduced = 0
+        self.hoisted = 0
+        self._counter = [0]
+        self._temps: Optional[_Temps] = None
+
+    def optimize(self, prog: StmtListNode) -> StmtListNode:
+        prog = ast_utils.clone(prog)
+        global_temps = _Temps(VariableScope.GLOBAL, prog, self._counter)
+        exprs = []
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                self._temps = _Temps(VariableScope.LOCAL, expr, self._counter)
+            else:
+                self._temps = global_temps
+            exprs.append(self._transform(expr))
+        prog.exprs = tuple(exprs)
+        self._temps = None
+        return prog
+
+    def _transform(self, node: AstNode) -> AstNode:
+        # вложенные циклы оптимизируются раньше внешних
+        ast_utils.replace_children(node, self._transform)
+        if isinstance(node, ForNode):
+            return self._optimize_loop(node)
+        return node
+
+    def _optimize_loop(self, loop: ForNode) -> AstNode:
+        induction = _induction(loop)
+        if induction is not None:
+            _trip_count(loop, induction)
+        before: List[AstNode] = []
+        self._hoist_invariants(loop, induction, before)
+
+        if induction is not None and induction.trip_count is not None:
+            size = ast_utils.count_nodes(loop.body) + sum(
+                ast_utils.count_nodes(expr) for expr in loop.step.exprs if expr is not induction.update)
+            if induction.trip_count <= self.unroll_limit and size * induction.trip_count <= self.max_unrolled_nodes:
+                return make_block(*before, *self._unroll(loop, induction))
+        if induction is not None:
+            self._reduce_strength(loop, induction, before)
+            if induction.trip_count is not None and induction.trip_count >= 2 * self.unroll_factor and \
+                    ast_utils.count_nodes(loop.body) * self.unroll_factor <= self.max_unrolled_nodes:
+                return self._unroll_partially(loop, induction, before)
+        return make_block(*before, loop) if before else loop
+
+    # вынос вычисляемых на каждой итерации, но не меняющихся в цикле выражений во временные переменные
+    def _hoist_invariants(self, loop: ForNode, induction: Optional[_Induction], before: List[AstNode]) -> None:
+        variant, calls = _assigned(loop)
+        for n in ast_utils.walk(loop):
+            if isinstance(n, VarsNode):
+                variant.update(var.var.node_ident if isinstance(var, AssignNode) else var.node_ident for var in n.vars)
+        if induction is not None:
+            variant.add(induction.var)
+        hoisted: Dict[tuple, IdentDesc] = {}
+
+        def invariant(node: AstNode) -> bool:
+            for n in ast_utils.walk(node):
+                if isinstance(n, IdentNode):
+                    desc = n.node_ident
+                    if desc in variant or (calls and desc.scope == VariableScope.GLOBAL):
+                        return False
+                # вызовы и деление могут завершиться ошибкой, а в цикле они могут быть защищены условием
+                # или не выполняться ни разу, поэтому заранее не вычисляются
+                elif isinstance(n, (CallNode, AssignNode)):
+                    return False
+                elif isinstance(n, BinOpNode) and n.op in (BinaryOperation.DIV, BinaryOperation.MOD):
+                    return False
+            return True
+
+        def hoist(node: AstNode) -> AstNode:
+            if isinstance(node, BinOpNode) and invariant(node) and \
+                    any(isinstance(n, IdentNode) for n in ast_utils.walk(node)):
+                key = _expr_key(node)
+                desc = hoisted.get(key)
+                if desc is None:
+                    desc = hoisted[key] = self._temps.new(node.node_type)
+                    before.append(make_declaration(desc, node))
+                    self.hoisted += 1
+                return make_ident(desc, node)
+            return ast_utils.replace_children(node, hoist)
+
+        loop.cond = hoist(loop.cond)
+        loop.body = hoist(loop.body)
+
+    # замена умножений i * k (k не меняется в цикле) переменной, увеличиваемой на c * k на каждом шаге
+    def _reduce_strength(self, loop: ForNode, induction: _Induction, before: List[AstNode]) -> None:
+        variant, calls = _assigned(loop)
+        variant.add(induction.var)
+        reduced: Dict[object, IdentDesc] = {}
+
+        def factor(node: AstNode) -> Optional[ExprNode]:
+            if node.node_type != DataType.INT:
+                return None
+            if isinstance(node, LiteralNode) or (isinstance(node, IdentNode) and node.node_ident not in variant
+                                                 and not (calls and node.node_ident.scope == VariableScope.GLOBAL)):
+                return node
+            return None
+
+        def reduce(node: AstNode) -> AstNode:
+            if isinstance(node, BinOpNode) and node.op == BinaryOperation.MULT and node.node_type == DataType.INT:
+                k = None
+                if isinstance(node.arg1, IdentNode) and node.arg1.node_ident is induction.var:
+                    k = factor(node.arg2)
+                elif isinstance(node.arg2, IdentNode) and node.arg2.node_ident is induction.var:
+                    k = factor(node.arg1)
+                if k is not None:
+                    key = k.value if isinstance(k, LiteralNode) else k.node_ident
+                    desc = reduced.get(key)
+                    if desc is None:
+                        desc = reduced[key] = self._new_reduced(induction, k, loop, before)
+                    self.reduced += 1
+                    return make_ident(desc, node)
+            return ast_utils.replace_children(node, reduce)
+
+        loop.body = reduce(loop.body)
+
+    def _new_reduced(self, induction: _Induction, k: ExprNode, loop: ForNode, before: List[AstNode]) -> IdentDesc:
+        desc = self._temps.new(DataType.INT)
+        start, k_value = _int_literal(induction.start), _int_literal(k)
+        if start is not None and k_value is not None:
+            init = make_literal(start * k_value, DataType.INT)
+        else:
+            init = make_binop(BinaryOperation.MULT, ast_utils.clone(induction.start), ast_utils.clone(k), DataType.INT)
+        before.append(make_declaration(desc, init))
+        if k_value is not None:
+            delta = make_literal(induction.step * k_value, DataType.INT)
+        elif induction.step == 1:
+            delta = ast_utils.clone(k)
+        else:
+            delta_desc = self._temps.new(DataType.INT)
+            before.append(make_declaration(delta_desc, make_binop(
+                BinaryOperation.MULT, make_literal(induction.step, DataType.INT), ast_utils.clone(k), DataType.INT
+            )))
+            delta = make_ident(delta_desc)
+        loop.step.exprs = (*loop.step.exprs,
+                           make_assign(desc, make_binop(BinaryOperation.ADD, make_ident(desc), delta, DataType.INT)))
+        return desc
+
+    # полная развертка: тело и остальные операторы шага повторяются для каждого значения переменной цикла
+    # (операторы шага после ее изменения получают следующее значение)
+    def _unroll(self, loop: ForNode, induction: _Induction) -> List[AstNode]:
+        self.unrolled += 1
+        stmts = []
+        for value in induction.values:
+            body = _substitute(ast_utils.clone(loop.body), induction.var, value)
+            stmts.append(make_block(body) if isinstance(body, VarsNode) else body)
+            current = value
+            for expr in loop.step.exprs:
+                if expr is induction.update:
+                    current = value + induction.step
+                else:
+                    stmts.append(_substitute(ast_utils.clone(expr), induction.var, current))
+        if not induction.declared:
+            final = _int_literal(induction.start) + induction.step * induction.trip_count
+            stmts.append(make_assign(induction.var, make_literal(final, DataType.INT)))
+        return stmts
+
+    # частичная развертка: за одну итерацию нового цикла выполняется unroll_factor итераций исходного,
+    # оставшиеся итерации выполняются после цикла
+    def _unroll_partially(self, loop: ForNode, induction: _Induction, before: List[AstNode]) -> AstNode:
+        self.partially_unrolled += 1
+        factor = self.unroll_factor
+        main, rest = divmod(induction.trip_count, factor)
+        original = loop.body
+
+        def iteration(last: bool) -> List[AstNode]:
+            body = ast_utils.clone(original)
+            body = make_block(body) if isinstance(body, VarsNode) else body
+            return [body] if last else [body, ast_utils.clone(loop.step)]
+
+        body: List[AstNode] = []
+        for i in range(factor):
+            body.extend(iteration(i == factor - 1))
+        end = _int_literal(induction.start) + main * factor * induction.step
+        op = BinaryOperation.LT if induction.step > 0 else BinaryOperation.GT
+        loop.cond = make_binop(op, make_ident(induction.var), make_literal(end, DataType.INT), DataType.BOOLEAN)
+        loop.body = make_block(*body)
+
+        # переменная цикла объявляется перед ним, чтобы быть доступной оставшимся итерациям
+        if induction.declared:
+            before.insert(0, loop.init)
+            loop.init = EMPTY_STMT
+        after: List[AstNode] = []
+        for i in range(rest):
+            after.extend(iteration(False))
+        return make_block(*before, loop, *after)
+
+
+def optimize_loops(prog: StmtListNode, unroll_limit: int = 8, unroll_factor: int = 4,
+                   max_unrolled_nodes: int = 256) -> StmtListNode:
+    return LoopOptimizer(unroll_limit, unroll_factor, max_unrolled_nodes).optimize(prog)
@@ -0,0 +1,186 @@
+import mmap
+import re
+from typing import Dict, List, Optional, Tuple
+
+import pyparsing as pp
+from pyparsing import pyparsing_common as ppc
+
+import _parser
+import stream_parser
+from ast_nodes import FuncNode, IdentNode, ParamNode, StmtListNode, StmtNode, TypeNode, VarsNode
+
+
+_SKIP = _parser._SKIP.pattern
+# идентификатор, как его разбирает парсер: символы pyparsing_common.identifier, ключевые слова
+# (которые pp.Keyword отделяет от следующих за ними символов из DEFAULT_KEYWORD_CHARS) не могут быть
+# именами и типами
+_IDENT = r'(?!(?:if|for|return)(?![{}]))[{}][{}]*'.format(
+    re.escape(pp.Keyword.DEFAULT_KEYWORD_CHARS), re.escape(''.join(sorted(ppc.identifier.initChars))),
+    re.escape(''.join(sorted(ppc.identifier.bodyChars)))
+)
+# начало объявления: тип и имя, за которыми у функции следует список параметров
+_HEADER = re.compile(r'(?P<type>{0}){1}(?P<name>{0}){1}(?P<lpar>\()?'.format(_IDENT, _SKIP))
+# параметр функции и разделитель за ним
+_PARAM = re.compile(r'{1}(?P<type>{0}){1}(?P<name>{0}){1}(?P<sep>[,)])'.format(_IDENT, _SKIP))
+# комментарии, которые парсер пропускает перед конструкцией до передачи ее позиции действию разбора
+_COMMENTS = re.compile(r'(?:\s*(?:/\*[\s\S]*?\*/|//[^\n]*))*')
+# имя следующей переменной объявления
+_NAME = re.compile(r'{1}(?P<name>{0})'.format(_IDENT, _SKIP))
+# лексемы, по которым пропускается инициализатор переменной
+_VAR_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|/\*[\s\S]*?\*/|//[^\n]*|[(),;]')
+_EMPTY_PARAMS = re.compile(r'{}\)'.format(_SKIP))
+_BODY = re.compile(r'{}\{{'.format(_SKIP))
+
+
+# оглавление программы: функции верхнего уровня с сигнатурами и объявления глобальных переменных.
+# Тела функций и инициализаторы переменных не разбираются (границы единиц находятся по парным скобкам):
+# вместо тела у FuncNode пустой StmtListNode, VarsNode содержит только имена переменных (IdentNode).
+# Полное дерево объявления строит expand. Позиции узлов совпадают с полным разбором
+class Outline:
+
+    def __init__(self) -> None:
+        # объявления в порядке следования в тексте
+        self.decls: List[StmtNode] = []
+        # объявление -> текст его единицы, строка и столбец (с 0) начала
+        self._units: Dict[int, Tuple[str, int, int]] = {}
+        self._expanded: Dict[int, StmtNode] = {}
+
+    @property
+    def functions(self) -> List[FuncNode]:
+        return [decl for decl in self.decls if isinstance(decl, FuncNode)]
+
+    @property
+    def variables(self) -> List[VarsNode]:
+        return [decl for decl in self.decls if isinstance(decl, VarsNode)]
+
+    def find(self, name: str) -> Optional[FuncNode]:
+        for func in self.functions:
+            if func.name.name == name:
+                return func
+        return None
+
+    # полное дерево объявления (функция с телом, переменные с инициализаторами),
+    # разбирается при первом обращении
+    def expand(self, decl: StmtNode) -> StmtNode:
+        key = id(decl)
+        if key not in self._units:
+            raise ValueError('Объявление {} не принадлежит оглавлению'.format(decl))
+        expanded = self._expanded.get(key)
+        if expanded is None:
+            text, row, col = self._units[key]
+            expanded = self._expanded[key] = _parser.parse(text, row, col).exprs[0]
+        return expanded
+
+    def _add_unit(self, text: str, row: int, col: int) -> None:
+        # комментарии перед первой единицей файла не отбрасываются при разбиении
+        m = _HEADER.match(text, _parser._SKIP.match(text).end())
+        if m is None:
+            # операторы верхнего уровня не являются объявлениями
+            return
+        decl = _func_header(text, row, col, m) if m.group('lpar') else _vars_names(text, row, col, m)
+        if decl is not None:
+            self._units[id(decl)] = (text, row, col)
+            self.decls.append(decl)
+            return
+        # объявление, которое не удалось разобрать регулярными выражениями, разбирается полностью
+        for stmt in _parser.parse(text, row, col).exprs:
+            if isinstance(stmt, (FuncNode, VarsNode)):
+                self._units[id(stmt)] = (text, row, col)
+                self._expanded[id(stmt)] = stmt
+                self.decls.append(stmt)
+
+
+# Позиции узлов вычисляются так же, как их дает парсер: символ после конца предыдущей лексемы
+# или комментариев за ней (см. ParseContext.position), у имен дополнительно - их первый символ.
+# Функции возвращают None, если объявление не разбирается регулярными выражениями
+
+def _ident(text: str, context: _parser.ParseContext, name: str, start: int, end: int) -> IdentNode:
+    loc = _COMMENTS.match(text, end).end()
+    row, col = context.position(loc)
+    name_row, name_col = context.position(start - 1)
+    return IdentNode(name, row=row, col=col, name_row=name_row, name_col=name_col, loc=loc)
+
+
+def _type(text: str, context: _parser.ParseContext, m: re.Match) -> TypeNode:
+    loc = _COMMENTS.match(text).end()
+    row, col = context.position(loc)
+    return TypeNode(m.group('type'), row=row, col=col, loc=loc)
+
+
+# заголовок функции с пустым телом
+def _func_header(text: str, row: int, col: int, m: re.Match) -> Optional[FuncNode]:
+    context = _parser.ParseContext(text, row, col)
+    params = []
+    loc = m.end()
+    if _EMPTY_PARAMS.match(text, loc):
+        loc = _EMPTY_PARAMS.match(text, loc).end()
+    else:
+        while True:
+            p = _PARAM.match(text, loc)
+            if p is None:
+                return None
+            loc = _COMMENTS.match(text, loc).end()
+            param_row, param_col = context.position(loc)
+            type_ = TypeNode(p.group('type'), row=param_row, col=param_col, loc=loc)
+            name = _ident(text, context, p.group('name'), p.start('name'), p.end('type'))
+            params.append(ParamNode(type_, name, row=param_row, col=param_col, loc=loc))
+            loc = p.end()
+            if p.group('sep') == ')':
+                break
+    body = _BODY.match(text, loc)
+    if body is None:
+        return None
+    body_loc = _COMMENTS.match(text, body.end()).end()
+    body_row, body_col = context.position(body_loc)
+    type_ = _type(text, context, m)
+    name = _ident(text, context, m.group('name'), m.start('name'), m.end('type'))
+    return FuncNode(type_, name, params, StmtListNode(row=body_row, col=body_col, loc=body_loc),
+                    row=type_.row, col=type_.col, loc=type_.loc)
+
+
+# объявление переменных без инициализаторов: инициализатор пропускается до запятой или точки с запятой
+# вне скобок
+def _vars_names(text: str, row: int, col: int, m: re.Match) -> Optional[VarsNode]:
+    context = _parser.ParseContext(text, row, col)
+    names = []
+    name, prev_end = m, m.end('type')
+    while True:
+        names.append(_ident(text, context, name.group('name'), name.start('name'), prev_end))
+        depth, sep = 0, None
+        for token in _VAR_TOKENS.finditer(text, name.end('name')):
+            ch = token.group()
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            elif depth == 0 and (ch == ',' or ch == ';'):
+                sep = token
+                break
+        if sep is None:
+            return None
+        if sep.group() == ';':
+            break
+        name, prev_end = _NAME.match(text, sep.end()), sep.end()
+        if name is None:
+            return None
+    type_ = _type(text, context, m)
+    return VarsNode(type_, *names, row=type_.row, col=type_.col, loc=type_.loc)
+
+
+# оглавление программы в памяти или в байтах (в том числе mmap)
+def parse_outline(data: stream_parser.Source, encoding: str = 'utf-8') -> Outline:
+    outline = Outline()
+    for text, row, col in stream_parser.iter_units(data, encoding):
+        outline._add_unit(text, row, col)
+    return outline
+
+
+# оглавление файла, читаемого через mmap
+def outline_file(path: str, encoding: str = 'utf-8') -> Outline:
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return Outline()
+        with mm:
+            return parse_outline(mm, encoding)
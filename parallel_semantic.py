@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import semantic
+from ast_nodes import AstNode, FuncNode, StmtListNode
+from semantic import IdentScope, SemanticException, VariableScope
+
+
+# программа и глобальная область видимости, доступные рабочим процессам
+_state: Optional[Tuple[StmtListNode, IdentScope]] = None
+
+# результат проверки функции: индекс оператора, проверенная функция или ошибка (сообщение, строка, столбец)
+_Result = Tuple[int, Optional[FuncNode], Optional[Tuple[str, Optional[int], Optional[int]]]]
+
+
+def _init_worker(prog: StmtListNode, scope: IdentScope) -> None:
+    global _state
+    _state = prog, scope
+
+
+def _check_funcs(indices: List[int]) -> List[_Result]:
+    prog, scope = _state
+    results = []
+    for i in indices:
+        func = prog.exprs[i]
+        # тело функции видит глобальные переменные, объявленные до нее
+        scope.statement = i
+        try:
+            func.semantic_check(scope)
+            results.append((i, func, None))
+        except SemanticException as e:
+            results.append((i, None, (e.message, e.row, e.col)))
+    return results
+
+
+# связывает глобальные идентификаторы в проверенной другим процессом функции
+# с описаниями из глобальной области видимости текущего процесса
+def _rebind(node: AstNode, scope: IdentScope) -> None:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        ident = node.node_ident
+        if ident is not None and ident.scope == VariableScope.GLOBAL:
+            node.node_ident = scope.get_ident(ident.name)
+        stack.extend(node.childs)
+
+
+def _chunks(indices: List[int], count: int) -> List[List[int]]:
+    size, rest = divmod(len(indices), count)
+    chunks, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < rest else 0)
+        if end > start:
+            chunks.append(indices[start:end])
+        start = end
+    return chunks
+
+
+# семантическая проверка программы: после поднятия объявлений тела функций верхнего уровня
+# не зависят друг от друга и проверяются параллельно в пуле процессов;
+# при ошибках выбрасывается первая из них в порядке операторов программы, как при последовательной проверке
+def check_program(prog: StmtListNode, scope: Optional[IdentScope] = None,
+                  workers: Optional[int] = None) -> IdentScope:
+    global _state
+    if scope is None:
+        scope = semantic.prepare_global_scope()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    func_indices = [i for i, expr in enumerate(prog.exprs) if isinstance(expr, FuncNode)]
+    if workers <= 1 or len(func_indices) < 2:
+        prog.semantic_check(scope)
+        return scope
+
+    prog.hoist(scope)
+    errors: List[Tuple[int, SemanticException]] = []
+    fork = multiprocessing.get_start_method() == 'fork'
+    _state = prog, scope
+    try:
+        # при fork рабочие процессы получают программу и область видимости без копирования через pickle
+        with ProcessPoolExecutor(min(workers, len(func_indices)), initializer=None if fork else _init_worker,
+                                 initargs=() if fork else (prog, scope)) as executor:
+            futures = [executor.submit(_check_funcs, chunk) for chunk in _chunks(func_indices, workers * 4)]
+
+            # остальные операторы верхнего уровня проверяются в текущем процессе
+            for i, expr in enumerate(prog.exprs):
+                if isinstance(expr, FuncNode):
+                    continue
+                scope.statement = i
+                try:
+                    expr.semantic_check(scope)
+                except SemanticException as e:
+                    errors.append((i, e))
+                    break
+
+            exprs = list(prog.exprs)
+            for future in futures:
+                for i, func, error in future.result():
+                    if error is not None:
+                        e = SemanticException(error[0])
+                        e.row, e.col = error[1], error[2]
+                        errors.append((i, e))
+                    else:
+                        _rebind(func, scope)
+                        exprs[i] = func
+            prog.exprs = tuple(exprs)
+    finally:
+        _state = None
+
+    if errors:
+        raise min(errors, key=lambda error: error[0])[1]
+    prog.node_type = semantic.DataType.VOID
+    return scope
@@ -0,0 +1,441 @@
+import argparse
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import _parser
+import ast_utils
+import cfg
+import const_eval
+import cse
+import inline
+import loop_opt
+import semantic
+from ast_utils import make_block
+from ast_nodes import AstNode, ExprNode, IdentNode, TypeNode, BinOpNode, CallNode, AssignNode, VarsNode, ParamNode, FuncNode, \
+    StmtListNode, EMPTY_STMT
+from callgraph import CallGraph, call_sites
+from semantic import BinaryOperation, DataType, IdentDesc, VariableScope
+
+
+# единица анализа: функция программы (по имени) или операторы верхнего уровня (None)
+UnitKey = Optional[str]
+
+
+# идентификаторы единицы: объявленные в ней переменные и параметры, прочитанные и измененные переменные
+class Scopes:
+
+    def __init__(self, node: AstNode) -> None:
+        self.params: List[IdentDesc] = []
+        self.declared: Set[IdentDesc] = set()
+        self.reads: Set[IdentDesc] = set()
+        self.writes: Set[IdentDesc] = set()
+        # идентификаторы, которые не читают значение переменной (объявляемые, изменяемые, вызываемые)
+        names: Set[int] = set()
+        for n in ast_utils.walk(node):
+            if isinstance(n, ParamNode):
+                self.params.append(n.name.node_ident)
+                names.add(id(n.name))
+            elif isinstance(n, VarsNode):
+                for var in n.vars:
+                    ident = var.var if isinstance(var, AssignNode) else var
+                    self.declared.add(ident.node_ident)
+                    names.add(id(ident))
+            elif isinstance(n, AssignNode):
+                self.writes.add(n.var.node_ident)
+                names.add(id(n.var))
+            elif isinstance(n, (CallNode, FuncNode)):
+                names.add(id(n.func if isinstance(n, CallNode) else n.name))
+            elif isinstance(n, IdentNode) and id(n) not in names and n.node_ident is not None and \
+                    not n.node_ident.type.function:
+                self.reads.add(n.node_ident)
+
+    # глобальные переменные, которые единица читает или изменяет
+    @property
+    def globals(self) -> Set[IdentDesc]:
+        return {desc for desc in self.reads | self.writes if desc.scope == VariableScope.GLOBAL}
+
+
+# живые переменные на границах базовых блоков графа потока управления единицы (см. cfg)
+class Liveness:
+
+    def __init__(self, function: cfg.Function) -> None:
+        self.function = function
+        self.live_in: Dict[cfg.Block, Set[cfg.Var]] = {block: set() for block in function.blocks}
+        self.live_out: Dict[cfg.Block, Set[cfg.Var]] = {block: set() for block in function.blocks}
+        # инструкции, результат которых не используется (кроме вызовов)
+        self.dead: List[cfg.Instr] = []
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(function.blocks):
+                live_out = set().union(*(self.live_in[succ] for succ in block.succs))
+                live_in = self._transfer(block, set(live_out))
+                if live_in != self.live_in[block] or live_out != self.live_out[block]:
+                    self.live_in[block], self.live_out[block] = live_in, live_out
+                    changed = True
+        for block in function.blocks:
+            self._transfer(block, set(self.live_out[block]), self.dead)
+
+    @staticmethod
+    def _transfer(block: cfg.Block, live: Set[cfg.Var], dead: Optional[List[cfg.Instr]] = None) -> Set[cfg.Var]:
+        terminator = block.terminator
+        operand = terminator.cond if isinstance(terminator, cfg.Branch) else \
+            terminator.value if isinstance(terminator, cfg.Return) else None
+        if isinstance(operand, cfg.Var):
+            live.add(operand)
+        for instr in reversed(block.instrs):
+            if instr.dest is not None:
+                if dead is not None and instr.dest not in live and instr.op != cfg.CALL:
+                    dead.append(instr)
+                live.discard(instr.dest)
+            live.update(arg for arg in instr.args if isinstance(arg, cfg.Var))
+        return live
+
+
+# ошибки типизации единицы: узлы без типа и идентификаторы без описания
+# (оптимизирующие проходы должны оставлять дерево проверенным)
+def type_errors(node: AstNode) -> List[str]:
+    errors = []
+    for n in ast_utils.walk(node):
+        if n is EMPTY_STMT or isinstance(n, TypeNode):
+            continue
+        if isinstance(n, ExprNode) and n.node_type is None:
+            errors.append('Выражение {} без типа (строка {})'.format(n, n.row))
+        elif isinstance(n, IdentNode) and n.node_ident is None:
+            errors.append('Идентификатор {} без описания (строка {})'.format(n.name, n.row))
+        elif isinstance(n, AssignNode) and n.val.node_type is not None and n.var.node_type is not None and \
+                n.val.node_type != n.var.node_type:
+            errors.append('Присваивание {} значения типа {} (строка {})'.format(n.var.name, n.val.node_type, n.row))
+    return errors
+
+
+def _liveness(node: AstNode) -> Liveness:
+    return Liveness(cfg.build_function(node) if isinstance(node, FuncNode) else cfg.build_main(node))
+
+
+# анализы единиц: имя -> функция, вычисляющая результат по узлу функции (или блоку операторов верхнего уровня)
+ANALYSES: Dict[str, Callable[[AstNode], Any]] = {
+    'scopes': Scopes,
+    'types': type_errors,
+    'callgraph': call_sites,
+    'liveness': _liveness,
+}
+
+
+# единицы программы: функции и блок операторов верхнего уровня
+def program_units(prog: StmtListNode) -> Dict[UnitKey, AstNode]:
+    result: Dict[UnitKey, AstNode] = {expr.name.name: expr for expr in prog.exprs if isinstance(expr, FuncNode)}
+    result[None] = make_block(*(expr for expr in prog.exprs if not isinstance(expr, FuncNode)))
+    return result
+
+
+# отпечаток единицы: совпадает у одинаковых деревьев с одинаковыми описаниями идентификаторов
+def fingerprint(node: AstNode) -> int:
+    return hash(tuple((type(n), n.to_str(), str(n.node_type), _ident_key(n.node_ident)) for n in ast_utils.walk(node)))
+
+
+def _ident_key(desc: Optional[IdentDesc]) -> Optional[tuple]:
+    return (desc.name, desc.scope, desc.index) if desc is not None else None
+
+
+# проход над проверенной программой. requires - анализы, которые вычисляются до запуска прохода
+# (проход получает их через manager.get), preserves - анализы, результаты которых остаются верными
+# для измененных проходом единиц
+class Pass(ABC):
+
+    name = ''
+    requires: Tuple[str, ...] = ()
+    preserves: Tuple[str, ...] = ()
+
+    # возвращает преобразованную копию программы, исходное дерево не меняется
+    @abstractmethod
+    def run(self, prog: StmtListNode, manager: 'PassManager') -> StmtListNode:
+        pass
+
+
+# выражение с вызовами (побочные эффекты, ошибки встроенных функций) или целочисленным делением
+def _may_fail(node: AstNode) -> bool:
+    return any(isinstance(n, CallNode) or (isinstance(n, BinOpNode) and n.node_type == DataType.INT and
+                                           n.op in (BinaryOperation.DIV, BinaryOperation.MOD))
+               for n in ast_utils.walk(node))
+
+
+# проход из функции, преобразующей всю программу (оптимизации, которые возвращают копию AST)
+class TransformPass(Pass):
+
+    def __init__(self, name: str, transform: Callable[[StmtListNode], StmtListNode],
+                 requires: Tuple[str, ...] = (), preserves: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.transform = transform
+        self.requires = requires
+        self.preserves = preserves
+
+    def run(self, prog: StmtListNode, manager: 'PassManager') -> StmtListNode:
+        return self.transform(prog)
+
+
+# удаление локальных переменных, значение которых не читается: объявления и присваивания, значение которых
+# вычисляется без вызовов и без целочисленного деления (деление на ноль - ошибка выполнения)
+class UnusedLocalsPass(Pass):
+
+    name = 'unused'
+    requires = ('scopes',)
+    preserves = ('callgraph',)
+
+    def __init__(self) -> None:
+        self.removed = 0
+
+    def run(self, prog: StmtListNode, manager: 'PassManager') -> StmtListNode:
+        prog = ast_utils.clone(prog)
+        for expr in prog.exprs:
+            if isinstance(expr, FuncNode):
+                scopes: Scopes = manager.get('scopes', expr.name.name)
+                unused = scopes.declared - scopes.reads
+                if unused:
+                    unused -= self._kept(expr.body, unused)
+                if unused:
+                    expr.body = self._remove(expr.body, unused)
+        return prog
+
+    # переменные, которые объявляются или изменяются не отдельным оператором блока (в заголовке цикла,
+    # в объявлении нескольких переменных) или значением, вычисление которого может завершиться ошибкой
+    # или иметь побочные эффекты: такие переменные не удаляются
+    def _kept(self, body: AstNode, unused: Set[IdentDesc]) -> Set[IdentDesc]:
+        removable, declarations = set(), set()
+        for n in ast_utils.walk(body):
+            if isinstance(n, StmtListNode):
+                removable.update(id(expr) for expr in n.exprs if self._target(expr, unused) is not None)
+            elif isinstance(n, VarsNode):
+                declarations.update(id(var) for var in n.vars)
+        kept = set()
+        for n in ast_utils.walk(body):
+            if isinstance(n, VarsNode) and id(n) not in removable:
+                kept.update(var.var.node_ident if isinstance(var, AssignNode) else var.node_ident for var in n.vars)
+            elif isinstance(n, AssignNode) and id(n) not in removable and id(n) not in declarations:
+                kept.add(n.var.node_ident)
+        return kept & unused
+
+    # переменная, которую объявляет или изменяет оператор (если ее можно удалить вместе с оператором)
+    @staticmethod
+    def _target(stmt: AstNode, unused: Set[IdentDesc]) -> Optional[IdentDesc]:
+        if isinstance(stmt, VarsNode) and len(stmt.vars) == 1:
+            var = stmt.vars[0]
+            desc = var.var.node_ident if isinstance(var, AssignNode) else var.node_ident
+            value = var.val if isinstance(var, AssignNode) else None
+        elif isinstance(stmt, AssignNode):
+            desc, value = stmt.var.node_ident, stmt.val
+        else:
+            return None
+        if desc not in unused or (value is not None and _may_fail(value)):
+            return None
+        return desc
+
+    def _remove(self, node: AstNode, unused: Set[IdentDesc]) -> AstNode:
+        if isinstance(node, StmtListNode):
+            exprs = [expr for expr in node.exprs if self._target(expr, unused) is None]
+            self.removed += len(node.exprs) - len(exprs)
+            node.exprs = tuple(exprs)
+        return ast_utils.replace_children(node, lambda child: self._remove(child, unused))
+
+
+# проходы по именам (для сборки конвейера из командной строки)
+PASSES: Dict[str, Callable[[], Pass]] = {
+    'inline': lambda: TransformPass('inline', inline.inline_functions),
+    'const_eval': lambda: TransformPass('const_eval', const_eval.evaluate_constants),
+    'loops': lambda: TransformPass('loops', loop_opt.optimize_loops),
+    # общие подвыражения выносятся без вызовов, поэтому места вызова не меняются
+    'cse': lambda: TransformPass('cse', cse.eliminate_common_subexpressions, preserves=('callgraph',)),
+    'unused': UnusedLocalsPass,
+}
+
+
+# результат одного запуска прохода
+class PassStats:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # время прохода и вычисления нужных ему анализов, с
+        self.seconds = 0.0
+        self.analysis_seconds = 0.0
+        self.nodes_before = 0
+        self.nodes_after = 0
+        # измененные единицы и удаленные из кэша результаты анализов
+        self.changed: List[UnitKey] = []
+        self.invalidated = 0
+
+    @property
+    def nodes_delta(self) -> int:
+        return self.nodes_after - self.nodes_before
+
+
+# вычисления и попадания в кэш одного анализа
+class AnalysisStats:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.computed = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+# менеджер проходов: запускает проходы по порядку, вычисляет нужные им анализы по единицам и хранит
+# результаты в кэше. После прохода изменившиеся единицы находятся сравнением отпечатков, и только для них
+# удаляются результаты анализов, которые проход не сохраняет. При verify=True после каждого прохода
+# измененные единицы проверяются анализом types
+class PassManager:
+
+    def __init__(self, passes: Iterable[Pass] = (), verify: bool = False) -> None:
+        self.passes: List[Pass] = list(passes)
+        self.verify = verify
+        self.analyses: Dict[str, Callable[[AstNode], Any]] = dict(ANALYSES)
+        self.stats: List[PassStats] = []
+        self.analysis_stats: Dict[str, AnalysisStats] = {name: AnalysisStats(name) for name in self.analyses}
+        self.prog: Optional[StmtListNode] = None
+        self._units: Dict[UnitKey, AstNode] = {}
+        self._fingerprints: Dict[UnitKey, int] = {}
+        self._cache: Dict[Tuple[str, UnitKey], Any] = {}
+        self._call_graph: Optional[CallGraph] = None
+
+    def add(self, pass_: Pass) -> 'PassManager':
+        self.passes.append(pass_)
+        return self
+
+    def register_analysis(self, name: str, analysis: Callable[[AstNode], Any]) -> None:
+        self.analyses[name] = analysis
+        self.analysis_stats[name] = AnalysisStats(name)
+        self._invalidate(name, list(self._units))
+        self._call_graph = None
+
+    # результат анализа единицы текущей программы (из кэша, если единица не менялась)
+    def get(self, analysis: str, unit: UnitKey = None) -> Any:
+        if analysis not in self.analyses:
+            raise ValueError('Неизвестный анализ {}'.format(analysis))
+        if unit not in self._units:
+            raise ValueError('Нет функции {}'.format(unit))
+        stats = self.analysis_stats[analysis]
+        key = (analysis, unit)
+        if key in self._cache:
+            stats.hits += 1
+            return self._cache[key]
+        start = time.perf_counter()
+        result = self._cache[key] = self.analyses[analysis](self._units[unit])
+        stats.seconds += time.perf_counter() - start
+        stats.computed += 1
+        return result
+
+    # граф вызовов программы по местам вызова единиц (анализ callgraph). Граф ссылается на узлы функций
+    # программы, поэтому строится заново после любого изменения программы, даже если места вызова сохранены
+    def call_graph(self) -> CallGraph:
+        if self._call_graph is None:
+            self._call_graph = CallGraph(self.prog, {
+                self._units[unit].name.node_ident if unit is not None else None: self.get('callgraph', unit)
+                for unit in self._units
+            })
+        return self._call_graph
+
+    # загружает программу: результаты анализов сохраняются для единиц, которые не изменились
+    # с предыдущей загруженной программы
+    def load(self, prog: StmtListNode) -> None:
+        self._update(prog, ())
+
+    def run(self, prog: StmtListNode) -> StmtListNode:
+        self.load(prog)
+        for pass_ in self.passes:
+            stats = PassStats(pass_.name)
+            stats.nodes_before = ast_utils.count_nodes(self.prog)
+            start = time.perf_counter()
+            for analysis in pass_.requires:
+                for unit in self._units:
+                    self.get(analysis, unit)
+            stats.analysis_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            prog = pass_.run(self.prog, self)
+            stats.seconds = time.perf_counter() - start
+            stats.nodes_after = ast_utils.count_nodes(prog)
+            stats.changed, stats.invalidated = self._update(prog, pass_.preserves)
+            self.stats.append(stats)
+            if self.verify:
+                for unit in stats.changed:
+                    errors = self.get('types', unit)
+                    if errors:
+                        raise ValueError('Проход {} нарушил типизацию {}: {}'.format(
+                            pass_.name, 'операторов верхнего уровня' if unit is None else 'функции ' + unit,
+                            errors[0]))
+        return self.prog
+
+    # переход к новой программе: результаты анализов изменившихся единиц (кроме preserves) удаляются
+    def _update(self, prog: StmtListNode, preserves: Iterable[str]) -> Tuple[List[UnitKey], int]:
+        old_prog, self.prog = self.prog, prog
+        old = self._fingerprints
+        self._units = program_units(prog)
+        self._fingerprints = {unit: fingerprint(node) for unit, node in self._units.items()}
+        changed = [unit for unit, value in self._fingerprints.items() if old.get(unit) != value]
+        removed = [unit for unit in old if unit not in self._units]
+        if prog is not old_prog or changed or removed:
+            self._call_graph = None
+        invalidated = 0
+        for analysis in self.analyses:
+            if analysis not in preserves:
+                invalidated += self._invalidate(analysis, changed)
+            invalidated += self._invalidate(analysis, removed)
+        return changed, invalidated
+
+    def _invalidate(self, analysis: str, changed: Iterable[UnitKey]) -> int:
+        count = 0
+        for unit in changed:
+            if self._cache.pop((analysis, unit), None) is not None:
+                count += 1
+        return count
+
+    # таблица времени и изменения размера по проходам и сводка по анализам
+    def report(self) -> str:
+        lines = ['{:<12} {:>10} {:>10} {:>9} {:>9} {:>8} {:>8} {:>6}'.format(
+            'проход', 'время, мс', 'анализ, мс', 'узлов до', 'после', 'разница', 'единиц', 'сброс')]
+        for stats in self.stats:
+            lines.append('{:<12} {:>10.2f} {:>10.2f} {:>9} {:>9} {:>+8} {:>8} {:>6}'.format(
+                stats.name, stats.seconds * 1000, stats.analysis_seconds * 1000, stats.nodes_before,
+                stats.nodes_after, stats.nodes_delta, len(stats.changed), stats.invalidated))
+        for name, stats in self.analysis_stats.items():
+            if stats.computed or stats.hits:
+                lines.append('анализ {}: вычислен {} раз ({:.2f} мс), из кэша {}'.format(
+                    name, stats.computed, stats.seconds * 1000, stats.hits))
+        return '\n'.join(lines)
+
+
+def build_pipeline(names: Iterable[str], verify: bool = False) -> PassManager:
+    manager = PassManager(verify=verify)
+    for name in names:
+        if name not in PASSES:
+            raise ValueError('Неизвестный проход {}'.format(name))
+        manager.add(PASSES[name]())
+    return manager
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description='Запуск конвейера оптимизирующих проходов')
+    arg_parser.add_argument('file', help='файл программы')
+    arg_parser.add_argument('--passes', nargs='+', default=['inline', 'const_eval', 'loops', 'cse', 'unused'],
+                            choices=sorted(PASSES))
+    arg_parser.add_argument('--verify', action='store_true', help='проверять типизацию после каждого прохода')
+    arg_parser.add_argument('--tree', action='store_true', help='вывести итоговое дерево')
+    args = arg_parser.parse_args(argv)
+
+    with open(args.file, encoding='utf-8') as f:
+        prog = _parser.parse(f.read())
+    try:
+        prog.semantic_check(semantic.prepare_global_scope())
+    except semantic.SemanticException as e:
+        print('Ошибка: {}'.format(e.message), file=sys.stderr)
+        return 1
+    manager = build_pipeline(args.passes, args.verify)
+    prog = manager.run(prog)
+    if args.tree:
+        print(*prog.tree, sep='\n')
+    print(manager.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
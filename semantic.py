@@ -1,4 +1,7 @@
-from typing import Tuple, Any, Dict, Optional
+import math
+import re
+import threading
+from typing import Tuple, Any, Callable, Dict, Optional
 from enum import Enum
 
 
@@ -80,6 +83,12 @@ class DataType:
                     return False
             return True
 
+    # простые типы при копировании и передаче в другие процессы остаются теми же объектами
+    def __reduce__(self):
+        if self.simple:
+            return DataType.from_primitive_type, (self.primitive_type,)
+        return DataType, (None, self.return_type, self.params)
+
     # создает экземпляр класса DataType на основе переданного базового типа данных
     @staticmethod
     def from_primitive_type(primitive_type_: PrimitiveType):
@@ -112,6 +121,9 @@ class DataType:
 # добавляет атрибуты к классу DataType
 for primitive_type in PrimitiveType:
     setattr(DataType, primitive_type.name, DataType(primitive_type))
+# имена, под которыми типы объявлены в аннотациях класса DataType
+DataType.BOOLEAN = DataType.BOOL
+DataType.STRING = DataType.STR
 
 
 # переменные могут быть параметром функции, локальными или глобальными
@@ -137,17 +149,44 @@ class IdentDesc:
         return '{}, {}, {}'.format(self.type, self.scope, 'built-in' if self.built_in else self.index)
 
 
+# встроенная функция, реализованная на Python (без разбора исходного кода)
+class NativeIdentDesc(IdentDesc):
+    def __init__(self, name: str, type_: DataType, impl: Callable, pure: bool = True):
+        super().__init__(name, type_, VariableScope.GLOBAL)
+        self.impl = impl
+        # функция без побочных эффектов, ее можно вычислять на этапе компиляции
+        self.pure = pure
+        self.built_in = True
+
+
 # область видимости
 class IdentScope:
     """Класс для представлений областей видимости переменных во время семантического анализа
     """
 
-    def __init__(self, parent: Optional['IdentScope'] = None) -> None:
+    def __init__(self, parent: Optional['IdentScope'] = None, base: Optional['IdentScope'] = None) -> None:
         self.idents: Dict[str, IdentDesc] = {}
         self.func: Optional[IdentDesc] = None
         self.parent = parent
+        # общая неизменяемая область видимости (встроенные объекты), в которой ищутся
+        # идентификаторы, не найденные в этой области и ее родителях
+        self.base = base
         self.var_index = 0
         self.param_index = 0
+        self.frozen = False
+        # индекс перекрестных ссылок (xref.XrefIndex), заполняемый при семантической проверке
+        self.xref = parent.xref if parent is not None else None
+        # бюджет проверки (limits.Guard), None - без ограничений
+        self.guard = parent.guard if parent is not None else None
+        # глобальная переменная, объявленная при поднятии объявлений -> номер объявляющего оператора
+        # верхнего уровня, и номер проверяемого оператора: переменная доступна с оператора объявления
+        self.declared_at: Dict[IdentDesc, int] = {}
+        self.statement = 0
+
+    # запрещает дальнейшее изменение области видимости
+    def freeze(self) -> 'IdentScope':
+        self.frozen = True
+        return self
 
     @property
     def is_global(self) -> bool:
@@ -168,6 +207,10 @@ class IdentScope:
         return curr
 
     def add_ident(self, ident: IdentDesc) -> IdentDesc:
+        if self.frozen:
+            raise SemanticException('Нельзя объявить {}: область видимости встроенных объектов не изменяется'.format(
+                ident.name
+            ))
         func_scope = self.curr_func
         global_scope = self.curr_global
 
@@ -175,7 +218,8 @@ class IdentScope:
             ident.scope = VariableScope.LOCAL if func_scope else VariableScope.GLOBAL
 
         old_ident = self.get_ident(ident.name)
-        if old_ident:
+        # встроенные объекты перекрываются объявлениями программы
+        if old_ident and not old_ident.built_in:
             error = False
             if ident.scope == VariableScope.PARAM:
                 if old_ident.scope == VariableScope.PARAM:
@@ -200,6 +244,12 @@ class IdentScope:
         self.idents[ident.name] = ident
         return ident
 
+    # глобальная переменная, поднятая из оператора, который еще не проверялся, недоступна
+    def visible(self, ident: IdentDesc) -> bool:
+        global_scope = self.curr_global
+        declared_at = global_scope.declared_at.get(ident)
+        return declared_at is None or declared_at <= global_scope.statement
+
     def get_ident(self, name: str) -> Optional[IdentDesc]:
         scope = self
         ident = None
@@ -207,6 +257,10 @@ class IdentScope:
             ident = scope.idents.get(name)
             if ident:
                 break
+            if scope.base is not None:
+                ident = scope.base.get_ident(name)
+                if ident:
+                    break
             scope = scope.parent
         return ident
 
@@ -222,7 +276,10 @@ class SemanticException(Exception):
             if row:
                 message += 'позиция: {}'.format(col)
             message += ")"
+        super().__init__(message)
         self.message = message
+        self.row = row
+        self.col = col
 
 
 # конвертация типов
@@ -326,12 +383,98 @@ BUILT_IN_OBJECTS = '''
 '''
 
 
-def prepare_global_scope() -> IdentScope:
+def _print(s: str) -> None:
+    print(s, end='')
+
+
+def _println(s: str) -> None:
+    print(s)
+
+
+def _substring(s: str, start: int, length: int) -> str:
+    return s[start:start + length]
+
+
+# числа в строке без пробелов и разделителей "_", которые допускают int() и float()
+_INT_RE = re.compile(r'[+-]?[0-9]+')
+_DOUBLE_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
+
+def _parse_int(s: str) -> int:
+    if not _INT_RE.fullmatch(s):
+        raise ValueError('Строка "{}" не является целым числом'.format(s))
+    value = int(s)
+    if not -2 ** 31 <= value < 2 ** 31:
+        raise ValueError('Число {} не помещается в int'.format(s))
+    return value
+
+
+def _parse_double(s: str) -> float:
+    if not _DOUBLE_RE.fullmatch(s):
+        raise ValueError('Строка "{}" не является числом'.format(s))
+    return float(s)
+
+
+# встроенные функции: имя -> (тип возврата, типы параметров, реализация, без побочных эффектов)
+NATIVE_BUILT_INS: Dict[str, Tuple[DataType, Tuple[DataType, ...], Callable, bool]] = {
+    'print': (DataType.VOID, (DataType.STRING,), _print, False),
+    'println': (DataType.VOID, (DataType.STRING,), _println, False),
+    'abs': (DataType.DOUBLE, (DataType.DOUBLE,), abs, True),
+    'sqrt': (DataType.DOUBLE, (DataType.DOUBLE,), math.sqrt, True),
+    'pow': (DataType.DOUBLE, (DataType.DOUBLE, DataType.DOUBLE), math.pow, True),
+    'min': (DataType.DOUBLE, (DataType.DOUBLE, DataType.DOUBLE), min, True),
+    'max': (DataType.DOUBLE, (DataType.DOUBLE, DataType.DOUBLE), max, True),
+    'floor': (DataType.DOUBLE, (DataType.DOUBLE,), math.floor, True),
+    'ceil': (DataType.DOUBLE, (DataType.DOUBLE,), math.ceil, True),
+    'trunc': (DataType.INT, (DataType.DOUBLE,), math.trunc, True),
+    'length': (DataType.INT, (DataType.STRING,), len, True),
+    'concat': (DataType.STRING, (DataType.STRING, DataType.STRING), str.__add__, True),
+    'substring': (DataType.STRING, (DataType.STRING, DataType.INT, DataType.INT), _substring, True),
+    'parseInt': (DataType.INT, (DataType.STRING,), _parse_int, True),
+    'parseDouble': (DataType.DOUBLE, (DataType.STRING,), _parse_double, True),
+}
+
+_prelude: Optional[IdentScope] = None
+_prelude_lock = threading.Lock()
+
+
+# регистрирует встроенную функцию, реализованную на Python
+def register_built_in(name: str, return_type: DataType, params: Tuple[DataType, ...], impl: Callable,
+                      pure: bool = True) -> None:
+    global _prelude
+    with _prelude_lock:
+        NATIVE_BUILT_INS[name] = (return_type, tuple(params), impl, pure)
+        _prelude = None
+
+
+# строит неизменяемую область видимости встроенных объектов
+def build_prelude(source: str = BUILT_IN_OBJECTS,
+                  natives: Optional[Dict[str, Tuple[DataType, Tuple[DataType, ...], Callable, bool]]] = None
+                  ) -> IdentScope:
     from _parser import parse
-    prog = parse(BUILT_IN_OBJECTS)
     scope = IdentScope()
-    prog.semantic_check(scope)
+    for name, (return_type, params, impl, pure) in (NATIVE_BUILT_INS if natives is None else natives).items():
+        scope.add_ident(NativeIdentDesc(name, DataType(None, return_type, params), impl, pure))
+    if source.strip():
+        parse(source).semantic_check(scope)
     for name, ident in scope.idents.items():
         ident.built_in = True
-    scope.var_index = 0
-    return scope
+    return scope.freeze()
+
+
+# общая для всех компиляций область видимости встроенных объектов, строится один раз
+def get_prelude() -> IdentScope:
+    global _prelude
+    prelude = _prelude
+    if prelude is None:
+        with _prelude_lock:
+            if _prelude is None:
+                _prelude = build_prelude()
+            prelude = _prelude
+    return prelude
+
+
+# глобальная область видимости программы поверх общей области встроенных объектов:
+# встроенные объекты не копируются, объявления программы попадают только в новую область
+def prepare_global_scope() -> IdentScope:
+    return IdentScope(base=get_prelude())
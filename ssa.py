@@ -0,0 +1,180 @@
+from typing import Dict, List, Set
+
+from cfg import Var, Const, Phi, Branch, Return, Function, Block, Operand, UNDEF
+
+
+# перевод графа потока управления функции в SSA-форму (алгоритм Цитрона и др.):
+# phi-функции ставятся на итерированных границах доминирования блоков с присваиваниями,
+# затем переменные переименовываются обходом дерева доминаторов.
+# Phi-функции ставятся только для переменных, читаемых в каком-либо блоке до присваивания в нем
+# (semi-pruned SSA), переменные, живущие внутри одного блока, просто получают версии;
+# после переименования удаляются phi-функции, результат которых нигде не используется
+def to_ssa(function: Function) -> None:
+    if function.ssa:
+        return
+    if not function.idom:
+        function.compute_dominators()
+    _insert_phis(function)
+    _rename(function)
+    _prune_phis(function)
+    function.ssa = True
+
+
+def _insert_phis(function: Function) -> None:
+    defsites: Dict[Var, Set[Block]] = {}
+    nonlocal_vars: Set[Var] = set()
+    for param in function.params:
+        defsites[param] = {function.entry}
+    for block in function.blocks:
+        defined = set()
+        for instr in block.instrs:
+            for arg in _uses(instr.args):
+                if arg not in defined:
+                    nonlocal_vars.add(arg)
+            if instr.dest is not None:
+                defined.add(instr.dest)
+                defsites.setdefault(instr.dest, set()).add(block)
+        for arg in _uses(_terminator_args(block)):
+            if arg not in defined:
+                nonlocal_vars.add(arg)
+
+    for var, blocks in defsites.items():
+        if var not in nonlocal_vars:
+            continue
+        has_phi: Set[Block] = set()
+        work = list(blocks)
+        while work:
+            block = work.pop()
+            for frontier in function.frontiers[block]:
+                if frontier in has_phi:
+                    continue
+                has_phi.add(frontier)
+                frontier.phis.append(Phi(var))
+                if frontier not in blocks:
+                    work.append(frontier)
+
+
+def _rename(function: Function) -> None:
+    stacks: Dict[Var, List[Var]] = {}
+    counters: Dict[Var, int] = {}
+
+    def new_version(var: Var) -> Var:
+        counters[var] = counters.get(var, 0) + 1
+        version = Var(var.name, var.type, var.desc, var, counters[var])
+        stacks.setdefault(var, []).append(version)
+        return version
+
+    def current(arg: Operand) -> Operand:
+        if isinstance(arg, Var):
+            stack = stacks.get(arg)
+            return stack[-1] if stack else UNDEF
+        return arg
+
+    function.params = [new_version(param) for param in function.params]
+    # обход дерева доминаторов без рекурсии; при выходе из блока снимаются его версии
+    work = [(function.entry, False)]
+    pushed: Dict[Block, List[Var]] = {}
+    while work:
+        block, leaving = work.pop()
+        if leaving:
+            for var in pushed.pop(block):
+                stacks[var].pop()
+            continue
+        defined = []
+        for phi in block.phis:
+            defined.append(phi.dest)
+            phi.dest = new_version(phi.dest)
+        for instr in block.instrs:
+            instr.args = [current(arg) for arg in instr.args]
+            if instr.dest is not None:
+                defined.append(instr.dest)
+                instr.dest = new_version(instr.dest)
+        terminator = block.terminator
+        if isinstance(terminator, Branch):
+            terminator.cond = current(terminator.cond)
+        elif isinstance(terminator, Return) and terminator.value is not None:
+            terminator.value = current(terminator.value)
+        for succ in block.succs:
+            for phi in succ.phis:
+                phi.args[block] = current(phi.dest.origin or phi.dest)
+        pushed[block] = defined
+        work.append((block, True))
+        for child in reversed(function.dom_children[block]):
+            work.append((child, False))
+
+
+def _prune_phis(function: Function) -> None:
+    phis: Dict[Var, Phi] = {phi.dest: phi for block in function.blocks for phi in block.phis}
+    if not phis:
+        return
+    work = []
+    for block in function.blocks:
+        for instr in block.instrs:
+            work.extend(_uses(instr.args))
+        work.extend(_uses(_terminator_args(block)))
+    live: Set[Var] = set()
+    while work:
+        var = work.pop()
+        if var in live:
+            continue
+        live.add(var)
+        phi = phis.get(var)
+        if phi is not None:
+            work.extend(_uses(list(phi.args.values())))
+    for block in function.blocks:
+        if block.phis:
+            block.phis = [phi for phi in block.phis if phi.dest in live]
+
+
+def _uses(args: List[Operand]) -> List[Var]:
+    return [arg for arg in args if isinstance(arg, Var)]
+
+
+def _terminator_args(block: Block) -> List[Operand]:
+    terminator = block.terminator
+    if isinstance(terminator, Branch):
+        return [terminator.cond]
+    if isinstance(terminator, Return) and terminator.value is not None:
+        return [terminator.value]
+    return []
+
+
+# проверка SSA-формы: каждая версия присваивается один раз, каждое использование доминируется
+# присваиванием, у phi-функций аргументы ровно для предшественников блока; возвращает список нарушений
+def verify(function: Function) -> List[str]:
+    errors = []
+    defs: Dict[Var, Block] = {param: function.entry for param in function.params}
+    position: Dict[Var, int] = {param: -1 for param in function.params}
+    for block in function.blocks:
+        for i, dest in enumerate([phi.dest for phi in block.phis] + [instr.dest for instr in block.instrs]):
+            if dest is None:
+                continue
+            if dest in defs:
+                errors.append('{}: повторное присваивание {}'.format(function.name, dest))
+            defs[dest] = block
+            position[dest] = i
+
+    def check(arg: Operand, block: Block, i: int) -> None:
+        if isinstance(arg, Const):
+            return
+        if arg.version is None:
+            errors.append('{}: b{}: переменная {} без версии'.format(function.name, block.id, arg))
+        elif arg not in defs:
+            errors.append('{}: b{}: {} нигде не присваивается'.format(function.name, block.id, arg))
+        elif defs[arg] is block and position[arg] >= i or not function.dominates(defs[arg], block):
+            errors.append('{}: b{}: присваивание {} не доминирует использование'.format(function.name, block.id, arg))
+
+    for block in function.blocks:
+        for phi in block.phis:
+            if set(phi.args) != set(block.preds):
+                errors.append('{}: b{}: аргументы {} не соответствуют предшественникам'.format(
+                    function.name, block.id, phi))
+            for pred, arg in phi.args.items():
+                check(arg, pred, len(pred.phis) + len(pred.instrs))
+        offset = len(block.phis)
+        for i, instr in enumerate(block.instrs):
+            for arg in instr.args:
+                check(arg, block, offset + i)
+        for arg in _terminator_args(block):
+            check(arg, block, offset + len(block.instrs))
+    return errors
@@ -0,0 +1,110 @@
+import mmap
+import re
+from typing import Iterator, Optional, Tuple, Union
+
+import _parser
+import semantic
+from ast_nodes import StmtNode, StmtListNode
+
+
+# значимые для разбиения на единицы фрагменты: строки, комментарии и скобки
+_TOKENS = r'"(?:\\.|[^"\\])*"|/\*[\s\S]*?(?:\*/|$)|//[^\n]*|[;{}()]'
+# продолжение оператора if после закрывающей скобки или точки с запятой
+_ELSE = r'(?:\s|/\*[\s\S]*?\*/|//[^\n]*)*else\b'
+# пропускаемые между единицами пробелы, комментарии и лишние точки с запятой
+_SKIP = r'(?:\s|/\*[\s\S]*?\*/|//[^\n]*|;)*'
+
+_STR_TOKENS, _STR_ELSE, _STR_SKIP = re.compile(_TOKENS), re.compile(_ELSE), re.compile(_SKIP)
+_BYTES_TOKENS, _BYTES_ELSE = re.compile(_TOKENS.encode()), re.compile(_ELSE.encode())
+
+Source = Union[str, bytes, mmap.mmap]
+
+
+# границы единиц верхнего уровня (объявлений, функций, операторов) в тексте или байтах
+def iter_unit_bounds(data: Source) -> Iterator[Tuple[int, int]]:
+    tokens, else_ = (_STR_TOKENS, _STR_ELSE) if isinstance(data, str) else (_BYTES_TOKENS, _BYTES_ELSE)
+    open_chars = ('{', '(') if isinstance(data, str) else (b'{', b'(')
+    close_chars = ('}', ')') if isinstance(data, str) else (b'}', b')')
+    end_chars = (';', '}') if isinstance(data, str) else (b';', b'}')
+    start = depth = 0
+    for m in tokens.finditer(data):
+        token = m.group()
+        if len(token) != 1:
+            continue
+        if token in open_chars:
+            depth += 1
+        elif token in close_chars:
+            depth -= 1
+        if depth == 0 and token in end_chars and not else_.match(data, m.end()):
+            yield start, m.end()
+            start = m.end()
+    if start < len(data):
+        yield start, len(data)
+
+
+# сдвигает позицию (строка, столбец) на длину переданного текста
+def _advance(text: str, row: int, col: int) -> Tuple[int, int]:
+    nl = text.rfind('\n')
+    if nl < 0:
+        return row, col + len(text) - text.count('\r')
+    return row + text.count('\n'), len(text) - nl - 1 - text.count('\r', nl)
+
+
+# текст единиц верхнего уровня вместе со строкой и столбцом (с 0) их начала;
+# пробелы и комментарии перед единицей отбрасываются, как их пропускает и парсер.
+# После лишней точки с запятой парсер начинает следующий оператор сразу за ней, поэтому
+# пробелы и комментарии перед такой единицей остаются в ее тексте (иначе позиция оператора сдвинется)
+def iter_units(data: Source, encoding: str = 'utf-8') -> Iterator[Tuple[str, int, int]]:
+    row = col = 0
+    # предыдущая единица - лишняя точка с запятой
+    after_semi = False
+    for start, end in iter_unit_bounds(data):
+        text = data[start:end]
+        if not isinstance(text, str):
+            text = text.decode(encoding)
+        if _STR_SKIP.fullmatch(text):
+            # лишняя точка с запятой (или пробелы и комментарии в конце текста)
+            row, col = _advance(text, row, col)
+            after_semi = True
+            continue
+        if start > 0 and not after_semi:
+            skip = _STR_SKIP.match(text).end()
+            row, col = _advance(text[:skip], row, col)
+            text = text[skip:]
+        after_semi = False
+        yield text, row, col
+        row, col = _advance(text, row, col)
+
+
+# разбирает программу по одной единице верхнего уровня и возвращает операторы по мере разбора;
+# при check=True каждый оператор проходит семантическую проверку в общей глобальной области видимости
+# (без поднятия объявлений: функции и глобальные переменные доступны только после места объявления)
+def parse_units(data: Source, check: bool = False, scope: Optional[semantic.IdentScope] = None,
+                encoding: str = 'utf-8') -> Iterator[StmtNode]:
+    if check and scope is None:
+        scope = semantic.prepare_global_scope()
+    for text, row, col in iter_units(data, encoding):
+        unit: StmtListNode = _parser.parse(text, row, col)
+        for stmt in unit.exprs:
+            if check:
+                stmt.semantic_check(scope)
+            yield stmt
+
+
+# потоковый разбор файла через mmap: в памяти одновременно находится только одна единица
+def parse_file(path: str, check: bool = False, scope: Optional[semantic.IdentScope] = None,
+               encoding: str = 'utf-8') -> Iterator[StmtNode]:
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # пустой файл нельзя отобразить в память
+            return
+        with mm:
+            yield from parse_units(mm, check, scope, encoding)
+
+
+# потоковый разбор программы, уже находящейся в памяти
+def parse_string(prog: str, check: bool = False,
+                 scope: Optional[semantic.IdentScope] = None) -> Iterator[StmtNode]:
+    return parse_units(prog, check, scope)
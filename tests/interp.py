@@ -0,0 +1,222 @@
+import functools
+import math
+from typing import Any, Dict, List, Tuple, Union
+
+import _parser
+import semantic
+import workload
+from ast_nodes import AstNode, LiteralNode, IdentNode, BinOpNode, CallNode, TypeConvertNode, AssignNode, VarsNode, \
+    ReturnNode, IfNode, ForNode, FuncNode, StmtListNode, EMPTY_STMT
+from semantic import BinaryOperation, DataType, IdentDesc, NativeIdentDesc, VariableScope
+
+
+# исчерпан бюджет шагов интерпретации (программа не сравнивается)
+class StepsExceeded(Exception):
+    pass
+
+
+class _Return(Exception):
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+
+def _wrap(value: Any, type_: DataType) -> Any:
+    if type_ == DataType.INT:
+        return (int(value) + 2 ** 31) % 2 ** 32 - 2 ** 31
+    if type_ == DataType.DOUBLE:
+        return float(value)
+    return value
+
+
+# деление и остаток с округлением к нулю, как в C#
+def _div(a: Any, b: Any, type_: DataType) -> Any:
+    if type_ == DataType.INT:
+        if b == 0:
+            raise ZeroDivisionError()
+        q = abs(a) // abs(b)
+        return q if (a < 0) == (b < 0) else -q
+    if b == 0:
+        return math.copysign(math.inf, a) if a else math.nan
+    return a / b
+
+
+_COMPARE = {
+    BinaryOperation.LT: lambda a, b: a < b,
+    BinaryOperation.GT: lambda a, b: a > b,
+    BinaryOperation.LE: lambda a, b: a <= b,
+    BinaryOperation.GE: lambda a, b: a >= b,
+    BinaryOperation.EQUALS: lambda a, b: a == b,
+    BinaryOperation.NOTEQUALS: lambda a, b: a != b,
+}
+
+
+# эталонный интерпретатор проверенного AST для дифференциальных проверок оптимизирующих проходов:
+# результат программы - значения глобальных переменных после выполнения
+class Interpreter:
+
+    def __init__(self, prog: StmtListNode, steps: int = 1000000) -> None:
+        self.prog = prog
+        self.steps = steps
+        self.globals: Dict[IdentDesc, Any] = {}
+        self.frame: Dict[IdentDesc, Any] = {}
+        self.funcs = {expr.name.node_ident: expr for expr in prog.exprs if isinstance(expr, FuncNode)}
+
+    def run(self) -> Dict[str, Any]:
+        try:
+            self.execute(self.prog)
+        except _Return:
+            pass
+        return {desc.name: value for desc, value in self.globals.items()}
+
+    def _step(self) -> None:
+        self.steps -= 1
+        if self.steps < 0:
+            raise StepsExceeded()
+
+    def _vars(self, desc: IdentDesc) -> Dict[IdentDesc, Any]:
+        return self.globals if desc.scope == VariableScope.GLOBAL else self.frame
+
+    def execute(self, node: AstNode) -> None:
+        self._step()
+        if node is EMPTY_STMT or isinstance(node, FuncNode):
+            return
+        if isinstance(node, StmtListNode):
+            for expr in node.exprs:
+                self.execute(expr)
+        elif isinstance(node, VarsNode):
+            for var in node.vars:
+                if isinstance(var, AssignNode):
+                    self.execute(var)
+                else:
+                    self._vars(var.node_ident)[var.node_ident] = _wrap(0, var.node_ident.type)
+        elif isinstance(node, AssignNode):
+            self._vars(node.var.node_ident)[node.var.node_ident] = self.evaluate(node.val)
+        elif isinstance(node, ReturnNode):
+            raise _Return(self.evaluate(node.val) if node.val is not None else None)
+        elif isinstance(node, IfNode):
+            if self.evaluate(node.cond):
+                self.execute(node.then_stmt)
+            elif node.else_stmt is not None:
+                self.execute(node.else_stmt)
+        elif isinstance(node, ForNode):
+            self.execute(node.init)
+            while node.cond is EMPTY_STMT or node.cond is None or self.evaluate(node.cond):
+                self.execute(node.body)
+                self.execute(node.step)
+        elif isinstance(node, CallNode):
+            self.evaluate(node)
+        else:
+            raise TypeError('Неизвестный оператор {}'.format(type(node).__name__))
+
+    def evaluate(self, node: AstNode) -> Any:
+        self._step()
+        if isinstance(node, LiteralNode):
+            return node.value
+        if isinstance(node, IdentNode):
+            return self._vars(node.node_ident)[node.node_ident]
+        if isinstance(node, TypeConvertNode):
+            value = self.evaluate(node.expr)
+            if node.type == DataType.STRING:
+                return str(value)
+            return _wrap(value, node.type)
+        if isinstance(node, BinOpNode):
+            return self._binop(node)
+        if isinstance(node, CallNode):
+            return self._call(node)
+        raise TypeError('Неизвестное выражение {}'.format(type(node).__name__))
+
+    def _binop(self, node: BinOpNode) -> Any:
+        op = node.op
+        if op == BinaryOperation.LOGICAL_AND:
+            return bool(self.evaluate(node.arg1)) and bool(self.evaluate(node.arg2))
+        if op == BinaryOperation.LOGICAL_OR:
+            return bool(self.evaluate(node.arg1)) or bool(self.evaluate(node.arg2))
+        a, b = self.evaluate(node.arg1), self.evaluate(node.arg2)
+        if op in _COMPARE:
+            return _COMPARE[op](a, b)
+        type_ = node.node_type
+        if op == BinaryOperation.ADD:
+            return _wrap(a + b, type_)
+        if op == BinaryOperation.SUB:
+            return _wrap(a - b, type_)
+        if op == BinaryOperation.MULT:
+            return _wrap(a * b, type_)
+        if op == BinaryOperation.DIV:
+            return _wrap(_div(a, b, type_), type_)
+        if op == BinaryOperation.MOD:
+            if type_ == DataType.INT:
+                return _wrap(a - b * _div(a, b, type_), type_)
+            return math.fmod(a, b)
+        if op == BinaryOperation.BIT_AND:
+            return _wrap(a & b, type_)
+        if op == BinaryOperation.BIT_OR:
+            return _wrap(a | b, type_)
+        raise TypeError('Неизвестная операция {}'.format(op))
+
+    def _call(self, node: CallNode) -> Any:
+        desc = node.func.node_ident
+        args = [self.evaluate(param) for param in node.params]
+        if isinstance(desc, NativeIdentDesc):
+            return desc.impl(*args)
+        func = self.funcs[desc]
+        frame, self.frame = self.frame, {param.name.node_ident: arg for param, arg in zip(func.params, args)}
+        try:
+            self.execute(func.body)
+        except _Return as r:
+            return r.value
+        finally:
+            self.frame = frame
+        return None
+
+
+# результат программы или вид ошибки ее выполнения ('steps', 'division', 'error')
+def run(prog: StmtListNode, steps: int = 1000000) -> Union[Dict[str, Any], str]:
+    try:
+        return Interpreter(prog, steps).run()
+    except StepsExceeded:
+        return 'steps'
+    except ZeroDivisionError:
+        return 'division'
+    except (ArithmeticError, ValueError):
+        # ошибка встроенной функции
+        return 'error'
+
+
+def check(source: str) -> StmtListNode:
+    prog = _parser.parse(source)
+    prog.semantic_check(semantic.prepare_global_scope())
+    return prog
+
+
+# проверенные сгенерированные программы, которые выполняются в пределах бюджета шагов
+# (проходы не меняют исходное дерево, поэтому программы общие для всех проверок)
+@functools.lru_cache(maxsize=None)
+def programs(count: int = 40, size: int = 25, depth: int = 2, steps: int = 100000) -> Tuple[StmtListNode, ...]:
+    result = []
+    for seed in range(count):
+        prog = check(workload.generate(size=size, depth=depth, seed=seed, block_size=3).source)
+        if run(prog, steps) != 'steps':
+            result.append(prog)
+    return tuple(result)
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    if isinstance(a, float) or isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b)) or abs(a - b) <= 1e-9 * max(1.0, abs(a))
+    return a == b
+
+
+# переменные, объявленные на верхнем уровне программы (переменные циклов и временные переменные проходов
+# не сравниваются)
+def declared_globals(prog: StmtListNode) -> List[str]:
+    return [(var.var if isinstance(var, AssignNode) else var).name
+            for expr in prog.exprs if isinstance(expr, VarsNode) for var in expr.vars]
+
+
+# совпадение результатов исходной программы и преобразованной по значениям переменных верхнего уровня
+def same_result(prog: StmtListNode, transformed: StmtListNode, steps: int = 1000000) -> bool:
+    expected, actual = run(prog, steps), run(transformed, 2 * steps)
+    if isinstance(expected, str) or isinstance(actual, str):
+        return expected == actual
+    return all(name in actual and _same_value(expected[name], actual[name]) for name in declared_globals(prog))
@@ -0,0 +1,52 @@
+import pytest
+
+import ast_serializer
+from interp import check, programs
+
+
+SOURCE = '''
+int k = sum(4, 5);
+double e = length("строка") + 0.5;
+double d = 2.5 * k;
+int sum(int a, int b)
+{
+    int s = a + b;
+    return s;
+}
+'''
+
+
+def test_roundtrip():
+    prog = check(SOURCE)
+    assert ast_serializer.to_json(ast_serializer.loads(ast_serializer.dumps(prog))) == ast_serializer.to_json(prog)
+
+
+# позиция первого символа имени сохраняется отдельно от позиции узла
+def test_roundtrip_name_positions():
+    prog = check('int a = 1;\nint b = a +   a;')
+    ref = ast_serializer.loads(ast_serializer.dumps(prog)).exprs[1].vars[0].val.arg2
+    assert (ref.row, ref.col, ref.name_row, ref.name_col) == (2, 13, 2, 15)
+
+
+def test_roundtrip_generated():
+    for prog in programs()[:5]:
+        assert ast_serializer.loads(ast_serializer.dumps(prog)).tree == prog.tree
+
+
+# обрезанные данные дают FormatError, а не IndexError или struct.error
+def test_truncated_data():
+    data = ast_serializer.dumps(check(SOURCE))
+    for length in range(len(data)):
+        with pytest.raises(ast_serializer.FormatError):
+            ast_serializer.loads(data[:length])
+
+
+def test_corrupted_data():
+    data = bytearray(ast_serializer.dumps(check(SOURCE)))
+    for i in range(len(ast_serializer.MAGIC) + 1, len(data)):
+        corrupted = bytearray(data)
+        corrupted[i] ^= 0x5a
+        try:
+            ast_serializer.loads(bytes(corrupted))
+        except ast_serializer.FormatError:
+            pass
@@ -0,0 +1,190 @@
+import cfg
+import ssa
+from cfg import BINOP, COPY, Branch, Const, Function, Instr, Jump, Return, Var, UNDEF
+from interp import check
+from semantic import BinaryOperation, DataType
+
+
+INT = DataType.INT
+BOOL = DataType.BOOLEAN
+
+
+# граф из count блоков с ребрами edges (блок -> список преемников): один преемник - переход,
+# два - ветвление по cond, нет преемников - возврат ret
+def _graph(count, edges, cond=Const(True, BOOL), ret=None, instrs=None):
+    function = Function('f')
+    blocks = [function.new_block() for _ in range(count)]
+    function.entry = blocks[0]
+    for i, block in enumerate(blocks):
+        succs = [blocks[j] for j in edges.get(i, ())]
+        if len(succs) == 1:
+            block.terminator = Jump(succs[0])
+        elif len(succs) == 2:
+            block.terminator = Branch(cond, *succs)
+        else:
+            block.terminator = Return(ret)
+        block.instrs = list((instrs or {}).get(i, ()))
+    return function, blocks
+
+
+def _analyzed(function):
+    function.finish()
+    function.compute_dominators()
+    return function
+
+
+def _idoms(function, blocks):
+    return {blocks.index(block): blocks.index(idom) for block, idom in function.idom.items()}
+
+
+def _frontiers(function, blocks):
+    return {blocks.index(block): {blocks.index(f) for f in frontier}
+            for block, frontier in function.frontiers.items()}
+
+
+def test_diamond():
+    function, b = _graph(4, {0: [1, 2], 1: [3], 2: [3]})
+    _analyzed(function)
+    assert _idoms(function, b) == {0: 0, 1: 0, 2: 0, 3: 0}
+    assert _frontiers(function, b) == {0: set(), 1: {3}, 2: {3}, 3: set()}
+    assert function.dominates(b[0], b[3]) and not function.dominates(b[1], b[3])
+
+
+def test_loop():
+    # 0 -> 1 (заголовок) -> 2 (тело) -> 1, 1 -> 3 (выход)
+    function, b = _graph(4, {0: [1], 1: [2, 3], 2: [1]})
+    _analyzed(function)
+    assert _idoms(function, b) == {0: 0, 1: 0, 2: 1, 3: 1}
+    assert _frontiers(function, b) == {0: set(), 1: {1}, 2: {1}, 3: set()}
+    assert function.dominates(b[1], b[2]) and not function.dominates(b[2], b[1])
+
+
+def test_loop_with_branch():
+    # 0 -> 1; 1 -> 2, 3; 2 -> 4; 3 -> 4; 4 -> 1, 5
+    function, b = _graph(6, {0: [1], 1: [2, 3], 2: [4], 3: [4], 4: [1, 5]})
+    _analyzed(function)
+    assert _idoms(function, b) == {0: 0, 1: 0, 2: 1, 3: 1, 4: 1, 5: 4}
+    assert _frontiers(function, b) == {0: set(), 1: {1}, 2: {4}, 3: {4}, 4: {1}, 5: set()}
+    assert {b.index(child) for child in function.dom_children[b[1]]} == {2, 3, 4}
+
+
+# несводимый граф: у цикла два входа
+def test_irreducible():
+    function, b = _graph(3, {0: [1, 2], 1: [2], 2: [1]})
+    _analyzed(function)
+    assert _idoms(function, b) == {0: 0, 1: 0, 2: 0}
+    assert _frontiers(function, b) == {0: set(), 1: {2}, 2: {1}}
+
+
+def test_finish_removes_unreachable_blocks():
+    function, b = _graph(4, {0: [2], 1: [2], 2: [3]})
+    _analyzed(function)
+    assert function.blocks == [b[0], b[2], b[3]]
+    assert [block.id for block in function.blocks] == [0, 1, 2]
+    assert b[2].preds == [b[0]]
+
+
+def _var(name):
+    return Var(name, INT)
+
+
+# ветвление с присваиванием x в обеих ветвях: phi в блоке слияния, аргументы - версии из ветвей
+def test_phi_at_join():
+    p, x = Var('p', BOOL), _var('x')
+    function, b = _graph(4, {0: [1, 2], 1: [3], 2: [3]}, cond=p, ret=x, instrs={
+        1: [Instr(COPY, x, [Const(1, INT)])],
+        2: [Instr(COPY, x, [Const(2, INT)])],
+    })
+    function.params = [p]
+    ssa.to_ssa(_analyzed(function))
+    assert ssa.verify(function) == []
+    assert [block.phis for block in b[:3]] == [[], [], []]
+    phi, = b[3].phis
+    assert phi.dest.origin is x
+    assert phi.args == {b[1]: b[1].instrs[0].dest, b[2]: b[2].instrs[0].dest}
+    assert b[3].terminator.value is phi.dest
+    assert b[0].terminator.cond is function.params[0]
+    assert function.params[0].origin is p
+    versions = {b[1].instrs[0].dest.version, b[2].instrs[0].dest.version, phi.dest.version}
+    assert len(versions) == 3
+
+
+# переменная без присваивания на одном из путей получает в phi значение undef
+def test_phi_undef_argument():
+    x = _var('x')
+    function, b = _graph(4, {0: [1, 2], 1: [3], 2: [3]}, ret=x, instrs={1: [Instr(COPY, x, [Const(1, INT)])]})
+    ssa.to_ssa(_analyzed(function))
+    phi, = b[3].phis
+    assert phi.args == {b[1]: b[1].instrs[0].dest, b[2]: UNDEF}
+
+
+# счетчик цикла: phi в заголовке, тело читает версию из phi, выход возвращает ее же
+def test_phi_in_loop_header():
+    i, n, t = _var('i'), _var('n'), Var('t', BOOL)
+    function, b = _graph(4, {0: [1], 1: [2, 3], 2: [1]}, cond=t, ret=i, instrs={
+        0: [Instr(COPY, i, [Const(0, INT)])],
+        1: [Instr(BINOP, t, [i, n], BinaryOperation.LT)],
+        2: [Instr(BINOP, i, [i, Const(1, INT)], BinaryOperation.ADD)],
+    })
+    function.params = [n]
+    ssa.to_ssa(_analyzed(function))
+    assert ssa.verify(function) == []
+    phi, = b[1].phis
+    init, cmp, step = b[0].instrs[0], b[1].instrs[0], b[2].instrs[0]
+    assert phi.args == {b[0]: init.dest, b[2]: step.dest}
+    assert cmp.args == [phi.dest, function.params[0]]
+    assert step.args[0] is phi.dest
+    assert b[1].terminator.cond is cmp.dest
+    assert b[3].terminator.value is phi.dest
+    assert not b[2].phis and not b[3].phis
+
+
+# semi-pruned SSA: переменные, живущие внутри одного блока, не получают phi
+def test_no_phi_for_block_local_values():
+    x, y, t = _var('x'), _var('y'), _var('t')
+    function, b = _graph(4, {0: [1, 2], 1: [3], 2: [3]}, ret=Const(0, INT), instrs={
+        # t и y присваиваются и читаются в пределах одного блока
+        1: [Instr(COPY, t, [Const(1, INT)]), Instr(COPY, y, [t]), Instr(COPY, x, [y])],
+        2: [Instr(COPY, t, [Const(2, INT)]), Instr(COPY, y, [t]), Instr(COPY, x, [Const(3, INT)])],
+        # из переменных, присваиваемых в ветвях, до присваивания в блоке читается только x
+        3: [Instr(COPY, y, [x])],
+    })
+    function.params = []
+    ssa.to_ssa(_analyzed(function))
+    assert ssa.verify(function) == []
+    phi, = b[3].phis
+    assert phi.dest.origin is x
+    assert b[3].instrs[0].args == [phi.dest]
+
+
+# phi для x в блоке слияния ставится (x читается в блоке 1 до присваивания), но его результат
+# нигде не используется и удаляется
+def test_dead_phi_removed():
+    x = _var('x')
+    function, b = _graph(4, {0: [1, 2], 1: [3], 2: [3]}, ret=Const(0, INT), instrs={
+        0: [Instr(COPY, x, [Const(0, INT)])],
+        1: [Instr(BINOP, x, [x, Const(1, INT)], BinaryOperation.ADD)],
+    })
+    ssa.to_ssa(_analyzed(function))
+    assert ssa.verify(function) == []
+    assert b[3].phis == []
+    assert b[1].instrs[0].args[0] is b[0].instrs[0].dest
+
+
+def test_build_module_loop():
+    prog = check('''
+    int sum(int n)
+    {
+        int s = 0;
+        for (int i = 0; i < n; i = i + 1)
+            s = s + i;
+        return s;
+    }
+    ''')
+    function, = cfg.build_module(prog, ssa=True).functions.values()
+    assert function.ssa and ssa.verify(function) == []
+    header = next(block for block in function.blocks if block.phis)
+    assert sorted(phi.dest.name for phi in header.phis) == ['i', 's']
+    assert isinstance(header.terminator, Branch)
+    for phi in header.phis:
+        assert set(phi.args) == set(header.preds)
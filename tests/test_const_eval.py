@@ -0,0 +1,41 @@
+import pytest
+
+import const_eval
+from interp import check, programs, run, same_result
+
+
+@pytest.mark.parametrize('prog', programs(), ids=lambda prog: str(id(prog)))
+def test_generated_programs(prog):
+    assert same_result(prog, const_eval.evaluate_constants(prog))
+
+
+def test_folds_pure_call():
+    prog = check('int sum(int a, int b) { int s = a + b; return s; } int k = sum(4, 5);')
+    evaluator = const_eval.ConstEvaluator()
+    result = evaluator.evaluate(prog)
+    assert evaluator.folded == 1
+    assert result.exprs[-1].vars[0].val.to_str() == '9'
+    assert same_result(prog, result)
+
+
+# вызовы, которые нельзя вычислить (глобальные переменные, переполнение, деление на ноль), остаются
+@pytest.mark.parametrize('source', [
+    'int g = 2; int f(int a) { return a * g; } int k = f(3);',
+    'int f(int a) { return a * a * a; } int k = 0; if (k > 0) { k = f(100000); }',
+    'int f(int a) { return 10 / a; } int k = 0; if (k > 0) { k = f(0); }',
+])
+def test_not_folded(source):
+    prog = check(source)
+    evaluator = const_eval.ConstEvaluator()
+    result = evaluator.evaluate(prog)
+    assert evaluator.folded == 0
+    assert run(result) == run(prog)
+
+
+# некорректная строка не вычисляется на этапе компиляции
+def test_parse_int_is_not_folded():
+    prog = check('int a = parseInt("1_000"); int b = parseInt("12");')
+    evaluator = const_eval.ConstEvaluator()
+    result = evaluator.evaluate(prog)
+    assert result.exprs[0].vars[0].val.to_str() != '1000'
+    assert result.exprs[1].vars[0].val.to_str() == '12'
@@ -0,0 +1,117 @@
+import pytest
+
+import cfg
+import cse
+import ssa
+from ast_nodes import AssignNode, BinOpNode, IdentNode, IfNode, VarsNode
+from interp import check, programs, same_result
+
+
+SOURCES = {
+    'basic': 'int a = 3; int b = 4; int x = a*b + 1; int y = a*b + 2; a = 5; int z = a*b;',
+    'call': 'int g = 1; int f() { g = g + 1; return g; } int x = g*2 + f() + g*2; int y = g*2;',
+    'short_circuit': 'int a = 0; int b = 2; boolean c = a != 0 && b / a > 1; int d = 0; if (a != 0) { d = b / a; }',
+    'if': 'int a = 1; int b = 2; int r = 0; if (a + b > 2) { r = a + b; } else { a = 7; } r = r + (a + b);',
+    'loop': 'int a = 1; int s = 0; int x = a*3; for (int i = 0; i < 5; i = i + 1) { s = s + a*3; a = a + 1; } '
+            'int y = a*3;',
+    'multi': 'int a = 2; int b = 3; int p = a+b, q = a+b; a = 1; int r = a+b;',
+    'function': 'int f(int a, int b) { int x = a*b + a; int y = a*b - a; return x*y + a*b; } int r = f(3, 4);',
+    'nested': 'int a = 1; int b = 2; int c = 3; int x = (a+b)*c + (a+b); int y = (a+b)*c;',
+}
+
+
+def _verify_ssa(prog):
+    for function in cfg.build_module(prog, ssa=True).all():
+        assert ssa.verify(function) == []
+
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_sources(name):
+    prog = check(SOURCES[name])
+    result = cse.eliminate_common_subexpressions(prog)
+    assert same_result(prog, result)
+    _verify_ssa(result)
+
+
+@pytest.mark.parametrize('prog', programs(), ids=lambda prog: str(id(prog)))
+def test_generated_programs(prog):
+    result = cse.eliminate_common_subexpressions(prog)
+    assert same_result(prog, result)
+    _verify_ssa(result)
+
+
+def test_hoists_repeated_expression():
+    eliminator = cse.CommonSubexprEliminator()
+    eliminator.eliminate(check(SOURCES['basic']))
+    assert eliminator.temps == 1
+    assert eliminator.replaced == 2
+
+
+# выражение в виде текста со скобками вокруг каждой операции
+def _expr(node):
+    if isinstance(node, BinOpNode):
+        return '({} {} {})'.format(_expr(node.arg1), node, _expr(node.arg2))
+    return str(node)
+
+
+# операторы блока: объявление или присваивание одной переменной - "имя = выражение", if - "if условие"
+def _stmts(stmts):
+    r = []
+    for stmt in stmts:
+        if isinstance(stmt, VarsNode):
+            stmt, = stmt.vars
+        if isinstance(stmt, AssignNode):
+            r.append('{} = {}'.format(stmt.var, _expr(stmt.val)))
+        elif isinstance(stmt, IfNode):
+            r.append('if {}'.format(_expr(stmt.cond)))
+        else:
+            r.append(str(stmt))
+    return r
+
+
+def _eliminate(source):
+    prog = check(source)
+    result = cse.eliminate_common_subexpressions(prog)
+    assert same_result(prog, result)
+    return result
+
+
+# временная переменная объявляется перед оператором первого вхождения и заменяет вхождения
+# до присваивания операнду
+def test_temp_declared_before_first_occurrence():
+    result = _eliminate(SOURCES['basic'])
+    assert _stmts(result.exprs) == [
+        'a = 3', 'b = 4', '__cse1 = (a * b)', 'x = (__cse1 + 1)', 'y = (__cse1 + 2)', 'a = 5', 'z = (a * b)',
+    ]
+    temp = result.exprs[2].vars[0].var.node_ident
+    for stmt in result.exprs[3:5]:
+        use = stmt.vars[0].val.arg1
+        assert isinstance(use, IdentNode) and use.node_ident is temp
+
+
+# вычисление в ветви не выносится из нее: временная переменная объявляется после if,
+# перед первым вхождением на верхнем уровне
+def test_branch_occurrence_stays_in_branch():
+    result = _eliminate('int a = 1; int b = 2; int r = 0; if (a > 0) { r = a * b; } int s = a * b; int t = a * b;')
+    assert _stmts(result.exprs) == ['a = 1', 'b = 2', 'r = 0', 'if (a > 0)', '__cse1 = (a * b)', 's = __cse1',
+                                    't = __cse1']
+    assert _stmts(result.exprs[3].then_stmt.exprs) == ['r = (a * b)']
+
+
+# повторы внутри ветви выносятся во временную переменную, объявленную в этой же ветви
+def test_temp_declared_inside_branch():
+    result = _eliminate('int a = 1; int b = 2; int r = 0; if (a > 0) { r = a * b; r = r + a * b; } else { r = 1; } '
+                        'int s = a * b;')
+    assert _stmts(result.exprs) == ['a = 1', 'b = 2', 'r = 0', 'if (a > 0)', 's = (a * b)']
+    assert _stmts(result.exprs[3].then_stmt.exprs) == ['__cse1 = (a * b)', 'r = __cse1', 'r = (r + __cse1)']
+    assert _stmts(result.exprs[3].else_stmt.exprs) == ['r = 1']
+
+
+# второй операнд && и || вычисляется не всегда: он остается на месте, временная переменная
+# объявляется перед первым вычислением, которое выполняется всегда
+@pytest.mark.parametrize('op', ['&&', '||'])
+def test_short_circuit_operand_stays(op):
+    result = _eliminate('int a = 1; int b = 2; boolean c = a > 5 {} b / a > 1; int e = b / a; int f = b / a;'.format(op))
+    assert _stmts(result.exprs) == [
+        'a = 1', 'b = 2', 'c = ((a > 5) {} ((b / a) > 1))'.format(op), '__cse1 = (b / a)', 'e = __cse1', 'f = __cse1',
+    ]
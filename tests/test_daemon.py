@@ -0,0 +1,79 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import daemon
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _handle(message):
+    # проверка параметров не обращается к пулу рабочих процессов
+    return asyncio.run(daemon.CompileDaemon(workers=0).handle(message))
+
+
+@pytest.mark.parametrize('params', [[1], 'source', 5])
+def test_params_must_be_object(params):
+    response = _handle({'jsonrpc': '2.0', 'id': 7, 'method': 'compile', 'params': params})
+    assert response['id'] == 7
+    assert response['error']['code'] == daemon.INVALID_PARAMS
+
+
+@pytest.mark.parametrize('timeout', ['5', 0, -1, True, float('inf'), [1]])
+def test_invalid_timeout(timeout):
+    response = _handle({'jsonrpc': '2.0', 'id': 1, 'method': 'compile',
+                        'params': {'source': 'int a = 1;', 'timeout': timeout}})
+    assert response['error']['code'] == daemon.INVALID_PARAMS
+
+
+def test_internal_error_is_answered():
+    server = daemon.CompileDaemon(workers=0)
+
+    async def broken(params):
+        raise KeyError('source')
+
+    server._compile = broken
+    response = asyncio.run(server.handle({'jsonrpc': '2.0', 'id': 3, 'method': 'compile', 'params': {}}))
+    assert response['id'] == 3
+    assert response['error']['code'] == daemon.INTERNAL_ERROR
+    assert server.metrics.errors['compile'] == 1
+
+
+# shutdown через stdin/stdout завершает демон, хотя клиент не закрывает поток
+def test_stdio_shutdown():
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'daemon.py'), '--workers', '1'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=ROOT)
+    # демон, не ответивший на запрос, завершается, и чтение ответа возвращает пустую строку
+    watchdog = threading.Timer(30, process.kill)
+    watchdog.start()
+    try:
+        requests = [
+            {'jsonrpc': '2.0', 'id': 1, 'method': 'compile', 'params': [1]},
+            {'jsonrpc': '2.0', 'id': 2, 'method': 'compile', 'params': {'source': 'int a = 1;', 'timeout': '5'}},
+            {'jsonrpc': '2.0', 'id': 3, 'method': 'compile', 'params': {'source': 'int a = 1;', 'outputs': []}},
+        ]
+        for message in requests:
+            process.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+            process.stdin.flush()
+            response = json.loads(process.stdout.readline())
+            assert response['id'] == message['id']
+        assert response['result'] == {'ok': True}
+        process.stdin.write(b'{"jsonrpc": "2.0", "id": 4, "method": "shutdown"}\n')
+        process.stdin.flush()
+        assert json.loads(process.stdout.readline()) == {'jsonrpc': '2.0', 'id': 4, 'result': None}
+        start = time.monotonic()
+        assert process.wait(10) == 0
+        assert time.monotonic() - start < 10
+    finally:
+        watchdog.cancel()
+        if process.poll() is None:
+            process.kill()
+        process.stdin.close()
+        process.stdout.close()
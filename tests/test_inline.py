@@ -0,0 +1,63 @@
+import pytest
+
+import ast_utils
+import inline
+from ast_nodes import BinOpNode
+from interp import check, programs, same_result
+from semantic import BinaryOperation
+
+
+@pytest.mark.parametrize('prog', programs(), ids=lambda prog: str(id(prog)))
+def test_generated_programs(prog):
+    assert same_result(prog, inline.inline_functions(prog))
+
+
+def test_generated_programs_budget():
+    for prog in programs()[:10]:
+        assert same_result(prog, inline.inline_functions(prog, max_size=200, budget=50))
+
+
+def _multiplications(node):
+    return sum(1 for n in ast_utils.walk(node) if isinstance(n, BinOpNode) and n.op == BinaryOperation.MULT)
+
+
+# локальная переменная, используемая в нескольких начальных значениях, не подставляется в выражение
+@pytest.mark.parametrize('body', [
+    'int x = a * b; int y = x + x; return y;',
+    'int x = a * b; int y = x + 1; int z = x + 2; return y * z;',
+    'int x = a * b; int y = x; return y - y;',
+])
+def test_expression_form_does_not_duplicate_work(body):
+    prog = check('int f(int a, int b) {{ {} }} int a = 3; int b = 4; int r = 1 + f(a, b);'.format(body))
+    inliner = inline.Inliner()
+    result = inliner.inline(prog)
+    assert inliner.expression_sites == 0
+    assert _multiplications(result.exprs[-1]) <= _multiplications(prog.exprs[0].body)
+    assert same_result(prog, result)
+
+
+def test_expression_form_single_use():
+    prog = check('int f(int a, int b) { int x = a * b; int y = x + 1; return y * 2; } int r = 1 + f(3, 4);')
+    inliner = inline.Inliner()
+    result = inliner.inline(prog)
+    assert inliner.expression_sites == 1
+    assert same_result(prog, result)
+
+
+# переименованные переменные встроенной функции не совпадают с именами программы
+def test_renamed_locals_do_not_collide():
+    prog = check('''
+    int f(int a) { int s = 0; for (int i = 0; i < a; i = i + 1) { s = s + i; } return s; }
+    int f__s1 = 100;
+    int f__a1 = 7;
+    int r = f(4);
+    int q = f(5) + f__s1;
+    ''')
+    inliner = inline.Inliner()
+    result = inliner.inline(prog)
+    assert inliner.statement_sites >= 1
+    descs = {}
+    for node in ast_utils.walk(result):
+        if node.node_ident is not None:
+            assert descs.setdefault(node.node_ident.name, node.node_ident) is node.node_ident
+    assert same_result(prog, result)
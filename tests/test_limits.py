@@ -0,0 +1,106 @@
+import pytest
+
+import _parser
+import limits
+import semantic
+from ast_nodes import BinOpNode, LiteralNode
+from semantic import BinaryOperation
+
+
+SOURCE = '''
+int a = 1;
+int f(int x)
+{
+    return x * a;
+}
+int b = f(2) + a;
+'''
+
+
+def _parse_error(source, **kwargs):
+    with pytest.raises(limits.LimitException) as e:
+        limits.parse(source, limits.Limits(**kwargs))
+    return e.value
+
+
+def test_within_limits():
+    prog = limits.parse(SOURCE, limits.Limits(max_source_size=len(SOURCE), max_depth=10, max_nodes=100, timeout=60))
+    scope = limits.semantic_check(prog, limits.Limits(timeout=60))
+    assert scope.guard is None
+    assert scope.idents['b'] is not None
+
+
+def test_source_size():
+    e = _parse_error(SOURCE, max_source_size=len(SOURCE) - 1)
+    assert (e.limit, e.stage) == ('source_size', 'parse')
+    assert e.to_dict() == {'stage': 'parse', 'limit': 'source_size', 'message': e.message, 'row': None, 'col': None}
+
+
+def test_bracket_depth():
+    e = _parse_error('int a = 1;\nint b = (((a)));', max_depth=2)
+    assert (e.limit, e.stage, e.row, e.col) == ('depth', 'parse', 2, 11)
+
+
+# скобки в строках и комментариях не учитываются
+def test_bracket_depth_ignores_strings_and_comments():
+    source = 'int a = length("((((((") /* (((((( */ + 1; // ((((((\n'
+    prog = limits.parse(source, limits.Limits(max_depth=6))
+    assert len(prog.exprs) == 1
+
+
+# глубина AST без скобок: цепочка левоассоциативных операций
+def test_tree_depth():
+    e = _parse_error('int a = ' + ' + '.join(['1'] * 20) + ';', max_depth=10)
+    assert (e.limit, e.stage) == ('depth', 'parse')
+    assert e.message.startswith('Глубина AST')
+    assert e.row is not None and e.col is not None
+
+
+def test_nodes():
+    prog = _parser.parse(SOURCE)
+    e = _parse_error(SOURCE, max_nodes=10)
+    assert (e.limit, e.stage) == ('nodes', 'parse')
+    # без ограничения узлов разбор того же текста проходит
+    assert limits.parse(SOURCE, limits.Limits(max_nodes=None)).tree == prog.tree
+
+
+def test_parse_timeout():
+    lim = limits.Limits(timeout=60, max_depth=None)
+    guard = lim.guard()
+    guard.deadline -= 120
+    source = 'int a = ' + ' + '.join(['1'] * limits.Guard.TIME_CHECK_PERIOD) + ';'
+    with pytest.raises(limits.LimitException) as e:
+        limits.parse(source, lim, guard)
+    assert (e.value.limit, e.value.stage) == ('timeout', 'parse')
+
+
+# время проверяется перед каждым оператором списка, ошибка указывает на оператор
+def test_semantic_timeout():
+    prog = _parser.parse(SOURCE)
+    lim = limits.Limits(timeout=60)
+    guard = lim.guard()
+    guard.deadline -= 120
+    scope = semantic.prepare_global_scope()
+    with pytest.raises(limits.LimitException) as e:
+        limits.semantic_check(prog, lim, guard, scope)
+    assert scope.guard is None
+    first = prog.exprs[0]
+    assert (e.value.limit, e.value.stage, e.value.row, e.value.col) == ('timeout', 'semantic', first.row, first.col)
+
+
+def test_parse_recursion_error():
+    depth = 3000
+    e = _parse_error('int a = ' + '(' * depth + '1' + ')' * depth + ';', max_depth=None)
+    assert (e.limit, e.stage) == ('depth', 'parse')
+    assert e.__cause__ is None
+
+
+def test_semantic_recursion_error():
+    prog = _parser.parse('int a = 1;')
+    val = LiteralNode('1')
+    for _ in range(20000):
+        val = BinOpNode(BinaryOperation.ADD, val, LiteralNode('1'))
+    prog.exprs[0].vars[0].val = val
+    with pytest.raises(limits.LimitException) as e:
+        limits.semantic_check(prog, limits.Limits())
+    assert (e.value.limit, e.value.stage) == ('depth', 'semantic')
@@ -0,0 +1,62 @@
+import pytest
+
+import ast_utils
+import loop_opt
+from interp import check, programs, run, same_result
+from ast_nodes import IdentNode
+
+
+@pytest.mark.parametrize('prog', programs(), ids=lambda prog: str(id(prog)))
+def test_generated_programs(prog):
+    assert same_result(prog, loop_opt.optimize_loops(prog))
+
+
+@pytest.mark.parametrize('options', [dict(unroll_limit=0), dict(unroll_limit=100, max_unrolled_nodes=10000),
+                                     dict(unroll_limit=0, unroll_factor=2)])
+def test_generated_programs_options(options):
+    for prog in programs()[:10]:
+        assert same_result(prog, loop_opt.optimize_loops(prog, **options))
+
+
+# полная развертка выполняет и остальные операторы шага
+def test_unroll_keeps_step_statements():
+    prog = check('''
+    int s = 0;
+    int j = 0;
+    for (int i = 0; i < 3; i = i + 1, j = j + 2 + i) { s = s + i; }
+    int k = 0;
+    for (k = 0; k < 3; j = j * 2, k = k + 1, s = s + k) { s = s + 1; }
+    ''')
+    optimizer = loop_opt.LoopOptimizer()
+    result = optimizer.optimize(prog)
+    assert optimizer.unrolled == 2
+    assert run(result)['j'] == run(prog)['j'] == 96
+    assert same_result(prog, result)
+
+
+def test_partial_unroll():
+    prog = check('''
+    int s = 0;
+    int j = 0;
+    for (int i = 0; i < 23; i = i + 1, j = j + i) { s = s + i * j; }
+    ''')
+    optimizer = loop_opt.LoopOptimizer()
+    result = optimizer.optimize(prog)
+    assert optimizer.partially_unrolled == 1
+    assert same_result(prog, result)
+
+
+# имена временных переменных не совпадают с именами программы
+def test_temp_names_do_not_collide():
+    prog = check('''
+    int __t1 = 3;
+    int __t2 = 4;
+    int s = 0;
+    for (int i = 0; i < 100; i = i + 1) { s = s + i * __t1 + (__t1 + __t2); }
+    ''')
+    result = loop_opt.optimize_loops(prog)
+    descs = {}
+    for node in ast_utils.walk(result):
+        if isinstance(node, IdentNode):
+            assert descs.setdefault(node.name, node.node_ident) is node.node_ident
+    assert same_result(prog, result)
@@ -0,0 +1,107 @@
+import pytest
+
+import _parser
+import ast_utils
+import outline
+from ast_nodes import AssignNode, FuncNode, IdentNode, VarsNode
+
+
+SOURCE = '''// глобальные переменные
+int a = 1, b,   c = length("x; y, (z") + 2;
+double d·e = 2.5 /* ; */ ;
+int sum(int x,  /* второй */ int y)
+{
+    int s = x + y;
+    return s;
+}
+a = sum(a, 3);
+int   /* тип */ zero( )
+{
+    return 0;
+}
+int f = sum(zero(), a), g;
+'''
+
+
+def _ident(node):
+    return node.name, node.row, node.col, node.name_row, node.name_col
+
+
+def _var(node):
+    return _ident(node.var if isinstance(node, AssignNode) else node)
+
+
+# заголовок объявления: вид, позиция, тип, имя, параметры или имена переменных, позиция тела
+def _header(decl):
+    r = (type(decl).__name__, decl.row, decl.col, _ident(decl.type))
+    if isinstance(decl, FuncNode):
+        params = tuple((p.row, p.col, _ident(p.type), _ident(p.name)) for p in decl.params)
+        return r + (_ident(decl.name), params, decl.body.row, decl.body.col)
+    return r + tuple(_var(var) for var in decl.vars)
+
+
+def _positions(node):
+    return [(type(n).__name__, str(n), n.row, n.col) + ((n.name_row, n.name_col) if type(n) is IdentNode else ())
+            for n in ast_utils.walk(node)]
+
+
+def _declarations(source):
+    return [stmt for stmt in _parser.parse(source).exprs if isinstance(stmt, (FuncNode, VarsNode))]
+
+
+SOURCES = [SOURCE, SOURCE.replace('\n', '\r\n'), '  \n\n' + SOURCE]
+
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_headers_match_parser(source):
+    result = outline.parse_outline(source)
+    decls = _declarations(source)
+    assert [_header(decl) for decl in result.decls] == [_header(decl) for decl in decls]
+    # тела и инициализаторы не разбираются
+    assert all(not func.body.exprs for func in result.functions)
+    assert all(isinstance(var, IdentNode) for decl in result.variables for var in decl.vars)
+    assert [str(var) for decl in result.variables for var in decl.vars] == ['a', 'b', 'c', 'd·e', 'f', 'g']
+    assert [func.name.name for func in result.functions] == ['sum', 'zero']
+
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_expand_matches_parser(source):
+    result = outline.parse_outline(source.encode())
+    decls = _declarations(source)
+    assert len(result.decls) == len(decls)
+    for decl, full in zip(result.decls, decls):
+        expanded = result.expand(decl)
+        assert expanded.tree == full.tree
+        assert _positions(expanded) == _positions(full)
+        assert result.expand(decl) is expanded
+
+
+def test_expand_foreign_declaration():
+    result = outline.parse_outline(SOURCE)
+    with pytest.raises(ValueError):
+        result.expand(_declarations(SOURCE)[0])
+
+
+def test_find():
+    result = outline.parse_outline(SOURCE)
+    assert result.find('zero') is result.functions[1]
+    assert result.find('a') is None
+
+
+def test_outline_file(tmp_path):
+    path = tmp_path / 'prog.cs'
+    path.write_bytes(SOURCE.encode())
+    assert [_header(decl) for decl in outline.outline_file(str(path)).decls] == \
+        [_header(decl) for decl in _declarations(SOURCE)]
+
+
+# объявление, которое не разбирается регулярными выражениями, разбирается полностью
+def test_fallback_to_full_parse(monkeypatch):
+    monkeypatch.setattr(outline, '_func_header', lambda *args: None)
+    result = outline.parse_outline(SOURCE)
+    decls = _declarations(SOURCE)
+    assert [_header(decl) for decl in result.decls] == [_header(decl) for decl in decls]
+    for decl, full in zip(result.functions, [decl for decl in decls if isinstance(decl, FuncNode)]):
+        assert decl.body.exprs
+        assert result.expand(decl) is decl
+        assert _positions(decl) == _positions(full)
@@ -0,0 +1,69 @@
+import pytest
+
+import _parser
+import parallel_semantic
+import semantic
+import workload
+from interp import run
+
+
+def _sequential(source):
+    prog = _parser.parse(source)
+    try:
+        prog.semantic_check(semantic.prepare_global_scope())
+    except semantic.SemanticException as e:
+        return None, e.message
+    return prog, None
+
+
+def _parallel(source, workers=2):
+    prog = _parser.parse(source)
+    try:
+        parallel_semantic.check_program(prog, workers=workers)
+    except semantic.SemanticException as e:
+        return None, e.message
+    return prog, None
+
+
+def _same(source):
+    (seq, seq_error), (par, par_error) = _sequential(source), _parallel(source)
+    assert par_error == seq_error
+    if seq is not None:
+        assert par.tree == seq.tree
+
+
+@pytest.mark.parametrize('error', [None, *workload.ERROR_KINDS])
+@pytest.mark.parametrize('seed', range(3))
+def test_generated_programs(seed, error):
+    _same(workload.generate(size=30, depth=2, seed=seed, error=error, func_ratio=0.5).source)
+
+
+# при нескольких ошибках выбирается первая по порядку операторов, независимо от того,
+# в теле функции она или в операторе верхнего уровня
+@pytest.mark.parametrize('source', [
+    'int f() { return a; } int x = b; int g() { return c; }',
+    'int x = b; int f() { return a; } int g() { return c; }',
+    'int f() { return 1; } int g() { return c; } int x = b;',
+    'int f() { return 1; } int g() { return 2; } int x = f() + g(); int y = z;',
+])
+def test_first_error(source):
+    _same(source)
+    assert _parallel(source)[1] is not None
+
+
+# глобальная переменная доступна только после оператора объявления, функции - в любом месте
+@pytest.mark.parametrize('source, error', [
+    ('int x = y; int y = 5;', 'Идентификатор y не найден (строка: 1, позиция: 9)'),
+    ('int f() { return y; } int g() { return 1; } int y = 5;', 'Идентификатор y не найден (строка: 1, позиция: 18)'),
+    ('int y = 5; int f() { return y; } int g() { return f(); }', None),
+    ('int k = g(); int f() { return 1; } int g() { return f(); }', None),
+])
+def test_declaration_order(source, error):
+    assert _sequential(source)[1] == error
+    _same(source)
+
+
+def test_parallel_result_runs():
+    source = 'int y = 5; int f(int a) { return a + y; } int g(int a) { return f(a) * 2; } int r = g(1);'
+    prog, _ = _parallel(source)
+    assert run(prog)['r'] == 12
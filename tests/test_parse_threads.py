@@ -0,0 +1,105 @@
+import threading
+
+import _parser
+import ast_utils
+from ast_nodes import IdentNode
+
+
+FIRST = 'int x = 1;'
+REST = '''int f(int a)
+{
+    return a *  x;
+}
+int y = f(x) +   2;
+'''
+
+# позиции узлов программы FIRST + '\n' + REST в порядке обхода: вид, текст, строка, столбец
+# (у IdentNode - еще строка и столбец первого символа имени)
+POSITIONS = [
+    ('StmtListNode', '...', 1, 2),
+    ('VarsNode', 'int', 1, 2),
+    ('TypeNode', 'int', 1, 2),
+    ('AssignNode', '=', 1, 5),
+    ('IdentNode', 'x', 1, 5, 1, 5),
+    ('LiteralNode', '1', 1, 9),
+    ('FuncNode', 'function', 2, 2),
+    ('TypeNode', 'int', 2, 2),
+    ('IdentNode', 'f', 2, 5, 2, 5),
+    ('ParamNode', 'int', 2, 8),
+    ('TypeNode', 'int', 2, 8),
+    ('IdentNode', 'a', 2, 11, 2, 11),
+    ('StmtListNode', '...', 4, 1),
+    ('ReturnNode', 'return', 4, 6),
+    ('BinOpNode', '*', 4, 12),
+    ('IdentNode', 'a', 4, 12, 4, 12),
+    ('IdentNode', 'x', 4, 16, 4, 17),
+    ('VarsNode', 'int', 6, 2),
+    ('TypeNode', 'int', 6, 2),
+    ('AssignNode', '=', 6, 5),
+    ('IdentNode', 'y', 6, 5, 6, 5),
+    ('BinOpNode', '+', 6, 9),
+    ('CallNode', 'call', 6, 9),
+    ('IdentNode', 'f', 6, 9, 6, 9),
+    ('IdentNode', 'x', 6, 12, 6, 11),
+    ('LiteralNode', '2', 6, 16),
+]
+
+
+def _positions(prog):
+    return [(type(n).__name__, str(n), n.row, n.col) + ((n.name_row, n.name_col) if type(n) is IdentNode else ())
+            for n in ast_utils.walk(prog)]
+
+
+# программа с blank дополнительными пустыми строками после первой
+def _source(blank):
+    return FIRST + '\n' * (blank + 1) + REST
+
+
+# ожидаемые позиции, если программа разбирается как фрагмент с началом в строке row и столбце col (с 0):
+# смещение столбца действует только на первую строку
+def _expected(blank, row=0, col=0):
+    r = []
+    for item in POSITIONS:
+        item = list(item)
+        for i in range(2, len(item), 2):
+            if item[i] == 1:
+                item[i + 1] += col
+            else:
+                item[i] += blank
+            item[i] += row
+        r.append(tuple(item))
+    return r
+
+
+def test_sequential():
+    assert _positions(_parser.parse(_source(0))) == POSITIONS
+    assert _positions(_parser.parse(_source(3), 2, 5)) == _expected(3, 2, 5)
+
+
+def test_parse_many():
+    blanks = [i % 9 for i in range(64)]
+    for prog, blank in zip(_parser.parse_many([_source(blank) for blank in blanks], 8), blanks):
+        assert _positions(prog) == _expected(blank)
+
+
+# разбор из отдельных потоков с разными начальными строкой и столбцом фрагмента
+def test_raw_threads():
+    threads, rounds = 8, 6
+    barrier = threading.Barrier(threads)
+    results = [[] for _ in range(threads)]
+
+    def work(t):
+        barrier.wait()
+        for i in range(rounds):
+            blank, row, col = (t + i) % 5, t * 10 + i, t + 2 * i
+            results[t].append((_positions(_parser.parse(_source(blank), row, col)), _expected(blank, row, col)))
+
+    workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sum(len(r) for r in results) == threads * rounds
+    for r in results:
+        for positions, expected in r:
+            assert positions == expected
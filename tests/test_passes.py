@@ -0,0 +1,121 @@
+import pytest
+
+import ast_utils
+import passes
+from ast_nodes import FuncNode, VarsNode
+from callgraph import CallGraph
+from interp import check, programs, run, same_result
+
+
+PIPELINE = ['inline', 'const_eval', 'loops', 'cse', 'unused']
+
+
+@pytest.mark.parametrize('prog', programs(), ids=lambda prog: str(id(prog)))
+def test_pipeline(prog):
+    manager = passes.build_pipeline(PIPELINE, verify=True)
+    assert same_result(prog, manager.run(prog))
+
+
+def _function_nodes(graph):
+    return {id(func) for func in graph.functions.values()}
+
+
+# граф вызовов строится по узлам текущей программы после прохода, сохраняющего места вызова
+def test_call_graph_after_preserving_pass():
+    prog = check('''
+    int f(int a) { return a * 2 + a * 2; }
+    int g(int a) { return f(a) + 1; }
+    int r = g(3);
+    ''')
+    manager = passes.build_pipeline(['cse'])
+    manager.load(prog)
+    before = manager.call_graph()
+    result = manager.run(prog)
+    graph = manager.call_graph()
+    assert graph is not before
+    assert _function_nodes(graph) == {id(expr) for expr in result.exprs if isinstance(expr, FuncNode)}
+    assert graph.calls == CallGraph(result).calls
+    # места вызова сохранены проходом и берутся из кэша
+    assert manager.analysis_stats['callgraph'].hits > 0
+
+
+def test_call_graph_new_unit():
+    prog = check('int f(int a) { return a + 1; } int r = f(1);')
+    manager = passes.PassManager()
+    manager.load(prog)
+    manager.call_graph()
+    extended = check('int f(int a) { return a + 1; } int h(int a) { return f(a); } int r = h(1);')
+    manager.load(extended)
+    graph = manager.call_graph()
+    assert set(desc.name for desc in graph.functions) == {'f', 'h'}
+
+
+# одноименные переменные разных блоков функции - разные переменные
+def test_unused_locals_same_names():
+    prog = check('''
+    int f(int a)
+    {
+        if (a > 0) { int t = a * 2; }
+        else { int t = a * 3; a = a + t; }
+        return a;
+    }
+    int r = f(1) + f(-1);
+    ''')
+    manager = passes.PassManager([passes.UnusedLocalsPass()])
+    manager.load(prog)
+    scopes = manager.get('scopes', 'f')
+    assert len(scopes.declared) == 2
+    result = manager.run(prog)
+    declared = [var for node in ast_utils.walk(result.exprs[0]) if isinstance(node, VarsNode) for var in node.vars]
+    assert len(declared) == 1
+    assert manager.passes[0].removed == 1
+    assert same_result(prog, result)
+
+
+# проход не меняет исходное дерево
+def test_unused_locals_returns_copy():
+    prog = check('int f(int a) { int t = a * 2; return a; } int r = f(1);')
+    text = prog.tree
+    result = passes.PassManager([passes.UnusedLocalsPass()]).run(prog)
+    assert result is not prog
+    assert prog.tree == text
+    assert result.tree != text
+
+
+# значение, вычисление которого может завершиться ошибкой, не удаляется
+@pytest.mark.parametrize('value, outcome', [('10 / a', 'division'), ('10 % a', 'division'),
+                                            ('trunc(1.0 / a)', 'error'), ('parseInt("x") + a', 'error')])
+def test_unused_locals_keep_failing_values(value, outcome):
+    prog = check('int f(int a) {{ int t = {}; return 1; }} int r = f(0);'.format(value))
+    unused = passes.UnusedLocalsPass()
+    result = passes.PassManager([unused]).run(prog)
+    assert unused.removed == 0
+    assert run(prog) == run(result) == outcome
+
+
+def test_unused_locals_double_division_removed():
+    prog = check('int f(int a) { double t = 10.0 / a; return 1; } int r = f(0);')
+    unused = passes.UnusedLocalsPass()
+    result = passes.PassManager([unused]).run(prog)
+    assert unused.removed == 1
+    assert same_result(prog, result)
+
+
+# анализы функции, которую проход не изменил, остаются в кэше
+def test_unchanged_units_keep_analyses():
+    prog = check('''
+    int f(int a) { int t = a * 2; return a; }
+    int g(int a) { int s = a + 1; return s; }
+    int r = f(1) + g(2);
+    ''')
+    manager = passes.PassManager([passes.UnusedLocalsPass()])
+    manager.load(prog)
+    g_scopes = manager.get('scopes', 'g')
+    g_liveness = manager.get('liveness', 'g')
+    f_scopes = manager.get('scopes', 'f')
+    result = manager.run(prog)
+    assert manager.stats[0].changed == ['f']
+    assert manager.get('scopes', 'g') is g_scopes
+    assert manager.get('liveness', 'g') is g_liveness
+    assert manager.get('scopes', 'f') is not f_scopes
+    assert same_result(prog, result)
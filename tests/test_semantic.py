@@ -0,0 +1,39 @@
+import pytest
+
+import semantic
+from interp import check, run
+
+
+# объявления программы перекрывают встроенные функции
+def test_program_declarations_shadow_prelude():
+    prog = check('''
+    int length = 3;
+    double max(double a, double b) { return a; }
+    double r = max(1.0, 2.0) + length;
+    ''')
+    assert run(prog)['r'] == 4.0
+    assert not isinstance(prog.exprs[1].name.node_ident, semantic.NativeIdentDesc)
+    # встроенная функция в общей области видимости не меняется
+    assert isinstance(semantic.get_prelude().get_ident('max'), semantic.NativeIdentDesc)
+
+
+def test_redeclaration_in_program():
+    with pytest.raises(semantic.SemanticException):
+        check('int max = 1; int max = 2;')
+
+
+@pytest.mark.parametrize('text, value', [('42', 42), ('-7', -7), ('+3', 3), ('2147483647', 2147483647)])
+def test_parse_int(text, value):
+    assert semantic._parse_int(text) == value
+
+
+@pytest.mark.parametrize('text', ['1_000', ' 1', '1 ', '', '1.0', '0x10', '2147483648', '١٢'])
+def test_parse_int_rejects(text):
+    with pytest.raises(ValueError):
+        semantic._parse_int(text)
+
+
+@pytest.mark.parametrize('text', ['1_0', ' 1', 'nan', 'inf', '.', 'e5'])
+def test_parse_double_rejects(text):
+    with pytest.raises(ValueError):
+        semantic._parse_double(text)
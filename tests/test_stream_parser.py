@@ -0,0 +1,123 @@
+import mmap
+
+import pytest
+
+import _parser
+import ast_utils
+import semantic
+import stream_parser
+from ast_nodes import IdentNode
+
+
+SOURCE = '''// функции и "строки" со скобками: { ( }
+int a = length("}{;") + 1;;
+/* комментарий { с } скобками ; */
+int f(int x)
+{
+    // }
+    if (x > 0) { return x; }
+    else return length("{") /* } */ ;
+}
+  a = f(a)   ;
+int b = f(length("("));
+'''
+
+# текст каждой единицы и строка, столбец (с 0) ее начала: пробелы и комментарии перед единицей
+# отбрасываются, кроме первой единицы файла и единицы после лишней точки с запятой
+UNITS = [
+    ('// функции и "строки" со скобками: { ( }\nint a = length("}{;") + 1;', 0, 0),
+    ('\n/* комментарий { с } скобками ; */\nint f(int x)\n{\n    // }\n    if (x > 0) { return x; }\n'
+     '    else return length("{") /* } */ ;\n}', 1, 27),
+    ('a = f(a)   ;', 9, 2),
+    ('int b = f(length("("));', 10, 0),
+]
+
+
+def _positions(node):
+    return [(type(n).__name__, str(n), n.row, n.col) + ((n.name_row, n.name_col) if type(n) is IdentNode else ())
+            for n in ast_utils.walk(node)]
+
+
+def _units(data, bounds):
+    return [data[start:end] for start, end in bounds]
+
+
+def test_iter_units():
+    assert list(stream_parser.iter_units(SOURCE)) == UNITS
+
+
+def test_iter_unit_bounds_str_bytes_mmap(tmp_path):
+    # границы идут подряд и покрывают весь текст (пробелы и комментарии - в начале единиц)
+    bounds = list(stream_parser.iter_unit_bounds(SOURCE))
+    assert [start for start, _ in bounds] == [0] + [end for _, end in bounds[:-1]]
+    assert bounds[-1][1] == len(SOURCE)
+    data = SOURCE.encode()
+    # в байтах границы сдвигаются из-за многобайтовых символов, но делят текст так же
+    assert [unit.decode() for unit in _units(data, stream_parser.iter_unit_bounds(data))] == \
+        _units(SOURCE, stream_parser.iter_unit_bounds(SOURCE))
+    path = tmp_path / 'prog.cs'
+    path.write_bytes(data)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert list(stream_parser.iter_unit_bounds(mm)) == list(stream_parser.iter_unit_bounds(data))
+        assert list(stream_parser.iter_units(mm)) == UNITS
+
+
+# скобки в строках и комментариях не меняют границ единиц
+def test_braces_in_strings_and_comments():
+    source = 'int a = length("{(");\n/* } */ int b = 1; // )\nint c = length("\\"}");'
+    assert [text for text, _, _ in stream_parser.iter_units(source)] == [
+        'int a = length("{(");', 'int b = 1;', 'int c = length("\\"}");'
+    ]
+
+
+# if и else на верхнем уровне - одна единица, даже если else отделен комментарием
+def test_else_continues_unit():
+    source = 'int a = 1;\nif (a > 0) a = 2; /* ; */\nelse a = 3;\na = 4;'
+    assert [text for text, _, _ in stream_parser.iter_units(source)] == [
+        'int a = 1;', 'if (a > 0) a = 2; /* ; */\nelse a = 3;', 'a = 4;'
+    ]
+
+
+# лишние точки с запятой между единицами: парсер начинает следующий оператор сразу за последней из них
+EXTRA_SEMICOLONS = 'int a = 1;;\nint b = 2; ;  /* ; */\n  int c = 3;\n;\n// ;\nint f() { return 1; };\nint d = f();'
+
+
+@pytest.mark.parametrize('source', [SOURCE, SOURCE.replace('\n', '\r\n'), EXTRA_SEMICOLONS])
+def test_positions_match_full_parse(source):
+    full = _parser.parse(source).exprs
+    streamed = list(stream_parser.parse_string(source))
+    assert [_positions(stmt) for stmt in streamed] == [_positions(stmt) for stmt in full]
+
+
+def test_parse_file(tmp_path):
+    path = tmp_path / 'prog.cs'
+    path.write_bytes(SOURCE.encode())
+    full = _parser.parse(SOURCE).exprs
+    stmts = list(stream_parser.parse_file(str(path), check=True))
+    assert [_positions(stmt) for stmt in stmts] == [_positions(stmt) for stmt in full]
+    # операторы проверены в общей глобальной области видимости
+    assert all(stmt.node_type is not None for stmt in stmts)
+    assert stmts[-1].vars[0].var.node_ident.name == 'b'
+
+
+def test_parse_file_shared_scope(tmp_path):
+    path = tmp_path / 'prog.cs'
+    path.write_text('int a = 1;\nint b = a + 1;\n', encoding='utf-8')
+    scope = semantic.prepare_global_scope()
+    list(stream_parser.parse_file(str(path), check=True, scope=scope))
+    assert {'a', 'b'} <= set(scope.idents)
+
+
+def test_parse_file_empty(tmp_path):
+    path = tmp_path / 'empty.cs'
+    path.write_bytes(b'')
+    assert list(stream_parser.parse_file(str(path))) == []
+
+
+# без поднятия объявлений использование до объявления - ошибка
+def test_parse_file_no_hoisting(tmp_path):
+    path = tmp_path / 'prog.cs'
+    path.write_text('int a = b;\nint b = 1;\n', encoding='utf-8')
+    with pytest.raises(semantic.SemanticException) as e:
+        list(stream_parser.parse_file(str(path), check=True))
+    assert (e.value.row, e.value.col) == (1, 9)
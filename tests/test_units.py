@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+import ast_utils
+import units
+from ast_nodes import IdentNode
+
+
+A = '''
+double half(double v) { return v / 2; }
+int x = 1;
+double y = 2.5;
+int z = x + 1;
+'''
+
+B = '''
+double w = y + half(z);
+'''
+
+
+def _descs(prog):
+    return {node.name: node.node_ident for node in ast_utils.walk(prog) if isinstance(node, IdentNode)}
+
+
+# импортированные переменные адресуются индексами глобальной области определяющей единицы
+def test_imported_indices(tmp_path):
+    project = units.Project(str(tmp_path))
+    project.set_source('a', A)
+    project.set_source('b', B)
+    assert project.build() == ['a', 'b']
+    assert project.errors() == {}
+    own, imported = _descs(project.units['a'].prog), _descs(project.units['b'].prog)
+    for name in ('y', 'z'):
+        assert imported[name].index == own[name].index
+
+    # индексы сохраняются в интерфейсе
+    reloaded = units.Project(str(tmp_path))
+    assert reloaded.units['a'].interface.descs()['z'].index == own['z'].index
+
+
+# перестановка объявлений меняет индексы, и зависимая единица проверяется заново
+def test_index_change_rechecks_dependents(tmp_path):
+    project = units.Project(str(tmp_path))
+    project.set_source('a', A)
+    project.set_source('b', B)
+    project.build()
+    project.set_source('a', A.replace('int x = 1;\ndouble y = 2.5;', 'double y = 2.5;\nint x = 1;'))
+    assert project.build() == ['a', 'b']
+    assert _descs(project.units['b'].prog)['y'].index == _descs(project.units['a'].prog)['y'].index
+
+
+@pytest.mark.parametrize('name', ['', '.', '..', '../a', 'a/b', 'a\\b', '/tmp/a', 'a\0'])
+def test_unit_name_is_checked(tmp_path, name):
+    project = units.Project(str(tmp_path))
+    with pytest.raises(ValueError):
+        project.set_source(name, 'int a = 1;')
+    assert os.listdir(str(tmp_path)) == []
+
+
+C = '''
+int u = x * 2;
+'''
+
+
+def _project(tmp_path, **sources):
+    project = units.Project(str(tmp_path))
+    for name, source in sources.items():
+        project.set_source(name, source)
+    project.build()
+    assert project.errors() == {}
+    return project
+
+
+# изменение только тела функции не меняет интерфейс: зависимые единицы не проверяются
+def test_body_edit_rebuilds_only_unit(tmp_path):
+    project = _project(tmp_path, a=A, b=B, c=C)
+    project.set_source('a', A.replace('return v / 2;', 'double h = v * 0.5; return h;'))
+    assert project.build() == ['a']
+    assert project.build() == []
+    assert project.errors() == {}
+
+
+# изменение сигнатуры экспортируемой функции проверяет заново только единицы, импортирующие ее
+def test_signature_change_rebuilds_importers(tmp_path):
+    project = _project(tmp_path, a=A, b=B, c=C)
+    assert project.units['b'].interface.imports == {'a': ['half', 'y', 'z']}
+    assert project.units['c'].interface.imports == {'a': ['x']}
+    source = A.replace('double half(double v)', 'double half(int v)')
+    project.set_source('a', source)
+    assert project.build() == ['a', 'b']
+    # переменную x импортирует только c
+    project.set_source('a', source.replace('int x = 1;', 'double x = 1;').replace('int z = x + 1;', 'int z = 3;'))
+    assert project.build() == ['a', 'c']
+    assert project.errors() == {'c': project.units['c'].error}
+    assert project.units['b'].error is None
+
+
+# единица с ошибкой проверяется заново, когда отсутствовавшее имя появляется в другой единице
+def test_missing_name_appears(tmp_path):
+    project = _project(tmp_path, a=A)
+    project.set_source('c', 'int r = q + x;')
+    assert project.build() == ['c']
+    assert 'q' in project.errors()['c']
+    project.set_source('d', 'int q = 5;')
+    assert project.build() == ['c', 'd']
+    assert project.errors() == {}
+    assert project.units['c'].interface.imports == {'a': ['x'], 'd': ['q']}
+
+
+# удаление единицы проверяет заново единицы, которые импортировали ее имена
+def test_remove_rechecks_dependents(tmp_path):
+    project = _project(tmp_path, a=A, b=B, c=C)
+    project.remove('a')
+    assert not os.path.exists(os.path.join(str(tmp_path), 'a' + units.INTERFACE_SUFFIX))
+    assert project.build() == ['b', 'c']
+    assert set(project.errors()) == {'b', 'c'}
+    project.set_source('a', A)
+    assert project.build() == ['a', 'b', 'c']
+    assert project.errors() == {}
@@ -0,0 +1,117 @@
+import pytest
+
+import _parser
+import xref
+from semantic import SemanticException
+
+
+SOURCE = '''int g = 1;
+int sum(int a, int b)
+{
+    int s = a + /* c */ b;
+    return s + g;
+}
+int r = sum(g, 2);
+'''
+
+
+def _index(source=SOURCE):
+    prog = _parser.parse(source)
+    index, scope = xref.build_index(prog)
+    return prog, index, scope
+
+
+def _positions(occurrences):
+    return [(o.row, o.col) for o in occurrences]
+
+
+def test_definition_at():
+    _, index, _ = _index()
+    declaration = index.definition_at(4, 25)
+    assert (declaration.ident.name, declaration.kind, declaration.row, declaration.col) == \
+        ('b', xref.DECLARATION, 2, 20)
+    # каждый символ имени относится к вхождению
+    for col in range(9, 12):
+        assert index.at(7, col).kind == xref.CALL
+        assert (index.definition_at(7, col).row, index.definition_at(7, col).col) == (2, 5)
+    # пробелы и комментарии перед именем не относятся к нему
+    assert index.at(4, 24) is None
+    assert index.at(4, 18) is None
+    assert index.definition_at(1, 1) is None
+
+
+def test_usages_at():
+    _, index, _ = _index()
+    assert _positions(index.usages_at(1, 5)) == [(5, 16), (7, 13)]
+    assert _positions(index.usages_at(4, 9)) == [(5, 12)]
+    assert _positions(index.usages_at(2, 13)) == [(4, 13)]
+    assert [o.kind for o in index.usages_at(2, 6)] == [xref.CALL]
+    assert index.usages_at(3, 1) == []
+
+
+def test_owners():
+    _, index, scope = _index()
+    func = scope.idents['sum']
+    assert [o.owner for o in index.usages_at(1, 5)] == [func, None]
+    assert index.definition_at(2, 5).owner is None
+    assert index.definition_at(4, 9).owner is func
+
+
+# позиция имени отдельна от позиции узла, по которой сообщается об ошибках
+def test_name_position_does_not_move_node():
+    _, index, _ = _index('int a = 1;\nint b = a +   a;')
+    node = index.at(2, 15).node
+    assert (node.name_row, node.name_col) == (2, 15)
+    assert (node.row, node.col) == (2, 13)
+    assert index.at(2, 13) is None
+    with pytest.raises(SemanticException) as e:
+        _index('int a = 1;\nint b = a +   c;')
+    assert (e.value.row, e.value.col) == (2, 13)
+
+
+def test_remove_owner():
+    _, index, scope = _index()
+    func = scope.idents['sum']
+    locals_ = [index.at(2, 13).ident, index.at(2, 20).ident, index.at(4, 9).ident]
+    index.remove_owner(func)
+    # локальные переменные и параметры удалены вместе с их вхождениями
+    for ident in locals_:
+        assert ident not in index.symbols
+    for row, col in ((2, 13), (2, 20), (4, 9), (4, 13), (4, 25), (5, 12), (5, 16)):
+        assert index.at(row, col) is None
+    # вхождения верхнего уровня и объявление самой функции остаются
+    assert _positions(index.usages_at(1, 5)) == [(7, 13)]
+    assert index.definition_at(7, 9).ident is func
+    assert _positions(index.usages(func)) == [(7, 9)]
+    # повторное удаление ничего не меняет
+    index.remove_owner(func)
+    assert _positions(index.usages_at(1, 5)) == [(7, 13)]
+
+
+def test_recheck_function_same_node():
+    prog, index, scope = _index()
+    before = {pos: (o.ident.name, o.kind) for pos, o in index._positions.items()}
+    index.recheck_function(prog.exprs[1], scope)
+    assert {pos: (o.ident.name, o.kind) for pos, o in index._positions.items()} == before
+    assert _positions(index.usages_at(1, 5)) == [(7, 13), (5, 16)]
+
+
+def test_recheck_function_replacement():
+    prog, index, scope = _index()
+    func = scope.idents['sum']
+    # новое тело той же функции (с той же сигнатурой), начинающееся со строки 2
+    new_func = _parser.parse('int sum(int a, int b)\n{\n    return g * a * g;\n}', 1, 0).exprs[0]
+    index.recheck_function(new_func, scope)
+    assert index.functions[func] is new_func
+    assert index.definition_at(7, 9).node is new_func.name
+    assert _positions(index.usages_at(1, 5)) == [(7, 13), (4, 12), (4, 20)]
+    assert _positions(index.usages_at(4, 16)) == [(4, 16)]
+    assert _positions([index.definition_at(4, 16)]) == [(2, 13)]
+    assert index.at(5, 12) is None
+
+
+def test_recheck_function_signature_changed():
+    _, index, scope = _index()
+    new_func = _parser.parse('int sum(int a)\n{\n    return a;\n}', 1, 0).exprs[0]
+    with pytest.raises(SemanticException):
+        index.recheck_function(new_func, scope)
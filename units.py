@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import pyparsing as pp
+
+import _parser
+import ast_utils
+import semantic
+from ast_nodes import IdentNode, StmtListNode
+from semantic import DataType, IdentDesc, IdentScope, SemanticException, VariableScope
+
+
+INTERFACE_SUFFIX = '.csi'
+INTERFACE_VERSION = 2
+
+
+def _hash(data: str) -> str:
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+# имя единицы становится именем файла интерфейса, поэтому не может содержать путь
+def _check_unit_name(name: str) -> None:
+    if not isinstance(name, str) or name in ('', '.', '..') or any(ch in name for ch in '/\\\0') or \
+            os.path.basename(name) != name:
+        raise ValueError('Некорректное имя единицы {!r}'.format(name))
+
+
+# интерфейс единицы компиляции: экспортируемые глобальные функции и переменные с типами
+# и индексами переменных в глобальной области единицы.
+# Отпечаток (fingerprint) зависит только от экспорта, поэтому изменение тел функций его не меняет.
+# Вместе с интерфейсом хранится состояние последней проверки единицы: хэш исходного текста
+# и имена, импортированные из других единиц
+class Interface:
+
+    def __init__(self, unit: str, exports: Dict[str, DataType], source_hash: str = '',
+                 imports: Optional[Dict[str, List[str]]] = None, error: Optional[str] = None,
+                 indices: Optional[Dict[str, int]] = None) -> None:
+        self.unit = unit
+        self.exports = exports
+        # имя переменной -> индекс в глобальной области единицы (у функций индексов нет)
+        self.indices = indices or {}
+        self.source_hash = source_hash
+        self.imports = imports or {}
+        self.error = error
+        self._descs: Optional[Dict[str, IdentDesc]] = None
+
+    # экспорт в виде списков: [имя, 'var', тип, индекс] или [имя, 'func', тип возврата, типы параметров...]
+    def _export_list(self) -> List[list]:
+        return [[name, 'func', str(type_.return_type), *(str(p) for p in type_.params)] if type_.function
+                else [name, 'var', str(type_), self.indices[name]] for name, type_ in sorted(self.exports.items())]
+
+    @property
+    def fingerprint(self) -> str:
+        return _hash(json.dumps(self._export_list(), separators=(',', ':')))
+
+    # описания экспортируемых идентификаторов, которыми пользуются другие единицы при проверке
+    def descs(self) -> Dict[str, IdentDesc]:
+        if self._descs is None:
+            self._descs = {name: IdentDesc(name, type_, VariableScope.GLOBAL, self.indices.get(name, 0))
+                           for name, type_ in sorted(self.exports.items())}
+        return self._descs
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'version': INTERFACE_VERSION, 'unit': self.unit, 'fingerprint': self.fingerprint,
+            'source_hash': self.source_hash, 'exports': self._export_list(),
+            'imports': {unit: sorted(names) for unit, names in sorted(self.imports.items())}, 'error': self.error
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def from_json(data: str) -> 'Interface':
+        obj = json.loads(data)
+        if obj.get('version') != INTERFACE_VERSION:
+            raise ValueError('Неподдерживаемая версия интерфейса {}'.format(obj.get('version')))
+        _check_unit_name(obj['unit'])
+        exports, indices = {}, {}
+        for name, kind, type_, *rest in obj['exports']:
+            type_ = DataType.from_string(type_)
+            if kind == 'func':
+                exports[name] = DataType(None, type_, tuple(map(DataType.from_string, rest)))
+            else:
+                exports[name], indices[name] = type_, int(rest[0])
+        return Interface(obj['unit'], exports, obj['source_hash'], obj['imports'], obj['error'], indices)
+
+    def save(self, directory: str) -> None:
+        path = os.path.join(directory, self.unit + INTERFACE_SUFFIX)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_json())
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path: str) -> 'Interface':
+        with open(path, encoding='utf-8') as f:
+            return Interface.from_json(f.read())
+
+
+# единица компиляции: исходный текст, интерфейс последней проверки и результат проверки
+class Unit:
+
+    def __init__(self, name: str, source: Optional[str] = None, interface: Optional[Interface] = None) -> None:
+        self.name = name
+        self.source = source
+        self.interface = interface
+        # проверенное AST (только для единиц, проверенных в этом процессе)
+        self.prog: Optional[StmtListNode] = None
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.interface.error if self.interface else None
+
+    @property
+    def dirty(self) -> bool:
+        return self.interface is None or self.interface.source_hash != _hash(self.source)
+
+
+# проект из нескольких единиц компиляции с раздельной проверкой. Единица проверяется по интерфейсам
+# остальных единиц (их тела не разбираются); после изменения исходных текстов build проверяет
+# измененные единицы, а зависящие от них - только если они используют имена, экспорт которых изменился.
+# Интерфейсы сохраняются в interface_dir, поэтому при следующем запуске неизмененные единицы не проверяются
+class Project:
+
+    def __init__(self, interface_dir: Optional[str] = None) -> None:
+        self.interface_dir = interface_dir
+        self.units: Dict[str, Unit] = {}
+        # удаленные с последней сборки единицы -> их экспортированные имена
+        self._removed: Dict[str, Set[str]] = {}
+        if interface_dir is not None:
+            os.makedirs(interface_dir, exist_ok=True)
+            for file_name in sorted(os.listdir(interface_dir)):
+                if file_name.endswith(INTERFACE_SUFFIX):
+                    try:
+                        interface = Interface.load(os.path.join(interface_dir, file_name))
+                    except (ValueError, KeyError, TypeError):
+                        # интерфейс другой версии или поврежденный: единица будет проверена заново
+                        continue
+                    self.units[interface.unit] = Unit(interface.unit, interface=interface)
+
+    def set_source(self, name: str, source: str) -> None:
+        _check_unit_name(name)
+        unit = self.units.get(name)
+        if unit is None:
+            unit = self.units[name] = Unit(name)
+        unit.source = source
+
+    def remove(self, name: str) -> None:
+        unit = self.units.pop(name, None)
+        if unit is not None:
+            exports = set(unit.interface.exports) if unit.interface else set()
+            self._removed[name] = self._removed.get(name, set()) | exports
+            if self.interface_dir is not None:
+                path = os.path.join(self.interface_dir, name + INTERFACE_SUFFIX)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def errors(self) -> Dict[str, str]:
+        return {name: unit.error for name, unit in sorted(self.units.items()) if unit.error}
+
+    # проверяет измененные единицы и зависящие от них, возвращает имена проверенных единиц
+    def build(self) -> List[str]:
+        for name, unit in self.units.items():
+            if unit.source is None:
+                raise ValueError('Не задан исходный текст единицы {}'.format(name))
+        parsed: Dict[str, Tuple[Optional[StmtListNode], Optional[str]]] = {}
+        # единица -> имена, экспорт которых появился, исчез или изменил тип
+        changed: Dict[str, Set[str]] = dict(self._removed)
+        for name, unit in sorted(self.units.items()):
+            if not unit.dirty:
+                continue
+            prog, exports, indices, error = _declarations(unit.source)
+            parsed[name] = (prog, error)
+            old = unit.interface
+            interface = Interface(name, exports, _hash(unit.source), error=error, indices=indices)
+            if old is None or old.fingerprint != interface.fingerprint:
+                changed[name] = changed.get(name, set()) | _changed_names(old, interface)
+            unit.interface = interface
+
+        to_check = set(parsed)
+        if changed:
+            changed_names = set().union(*changed.values())
+            for name, unit in self.units.items():
+                interface = unit.interface
+                if name in to_check:
+                    continue
+                # зависимые единицы, единицы с ошибкой (могли использовать отсутствовавшие имена)
+                # и единицы, экспортирующие имена, которые могли начать конфликтовать
+                if interface.error or changed_names & set(interface.exports) or \
+                        any(changed.get(dep, set()).intersection(names) for dep, names in interface.imports.items()):
+                    to_check.add(name)
+
+        imports_scope = self._imports_scope() if to_check else None
+        for name in sorted(to_check):
+            unit = self.units[name]
+            if name in parsed:
+                prog, error = parsed[name]
+            else:
+                prog, _, _, error = _declarations(unit.source)
+            imports: Dict[str, List[str]] = {}
+            if error is None:
+                error, imports = self._check(unit, prog, *imports_scope)
+            unit.interface.imports = imports
+            unit.interface.error = error
+            unit.prog = prog if error is None else None
+            if self.interface_dir is not None:
+                unit.interface.save(self.interface_dir)
+        self._removed.clear()
+        return sorted(to_check)
+
+    # экспорт всех единиц (описания из интерфейсов), владельцы описаний и все единицы, экспортирующие каждое имя;
+    # строится один раз на сборку, области видимости проверяемых единиц получают его копию без своего экспорта
+    def _imports_scope(self) -> Tuple[Dict[str, IdentDesc], Dict[IdentDesc, str], Dict[str, List[str]]]:
+        idents: Dict[str, IdentDesc] = {}
+        owners: Dict[IdentDesc, str] = {}
+        exporters: Dict[str, List[str]] = {}
+        for name, unit in sorted(self.units.items()):
+            for ident_name, desc in unit.interface.descs().items():
+                exporters.setdefault(ident_name, []).append(name)
+                if ident_name not in idents:
+                    idents[ident_name] = desc
+                    owners[desc] = name
+        return idents, owners, exporters
+
+    def _check(self, unit: Unit, prog: StmtListNode, idents: Dict[str, IdentDesc], owners: Dict[IdentDesc, str],
+               exporters: Dict[str, List[str]]) -> Tuple[Optional[str], Dict[str, List[str]]]:
+        for ident_name in sorted(unit.interface.exports):
+            others = [name for name in exporters.get(ident_name, ()) if name != unit.name]
+            if others:
+                return 'Идентификатор {} уже объявлен в единице {}'.format(ident_name, others[0]), {}
+        imports_scope = IdentScope(base=semantic.get_prelude())
+        imports_scope.idents = dict(idents)
+        for ident_name in unit.interface.exports:
+            del imports_scope.idents[ident_name]
+        try:
+            prog.semantic_check(IdentScope(base=imports_scope.freeze()))
+        except SemanticException as e:
+            return e.message, {}
+        imports: Dict[str, Set[str]] = {}
+        for node in _idents(prog):
+            owner = owners.get(node.node_ident)
+            if owner is not None:
+                imports.setdefault(owner, set()).add(node.node_ident.name)
+        return None, {owner: sorted(names) for owner, names in imports.items()}
+
+
+# имена, которые появились, исчезли, изменили тип или индекс переменной
+def _changed_names(old: Optional[Interface], new: Interface) -> Set[str]:
+    old_exports = old.exports if old else {}
+    old_indices = old.indices if old else {}
+    return {name for name in old_exports.keys() | new.exports.keys()
+            if name not in old_exports or name not in new.exports or old_exports[name] != new.exports[name]
+            or old_indices.get(name) != new.indices.get(name)}
+
+
+def _idents(prog: StmtListNode) -> Iterator[IdentNode]:
+    for node in ast_utils.walk(prog):
+        if isinstance(node, IdentNode) and node.node_ident is not None:
+            yield node
+
+
+# разбор единицы и ее экспорт (функции и глобальные переменные верхнего уровня с индексами переменных)
+# без проверки тел функций
+def _declarations(source: str) -> Tuple[Optional[StmtListNode], Dict[str, DataType], Dict[str, int], Optional[str]]:
+    try:
+        prog = _parser.parse(source)
+    except pp.ParseBaseException as e:
+        return None, {}, {}, 'Ошибка разбора: {}'.format(e)
+    scope = IdentScope(base=semantic.get_prelude())
+    try:
+        prog.hoist(scope)
+    except SemanticException as e:
+        return None, {}, {}, e.message
+    # при проверке объявления поднимаются заново в области видимости проверки, в том же порядке,
+    # поэтому переменные получают те же индексы
+    return prog, {name: desc.type for name, desc in scope.idents.items()}, \
+        {name: desc.index for name, desc in scope.idents.items() if not desc.type.function}, None
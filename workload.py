@@ -0,0 +1,186 @@
+import random
+from typing import List, Optional, Tuple
+
+
+# виды ошибок, которые генератор может намеренно внести в программу
+ERROR_KINDS = ('unknown_type', 'unknown_ident', 'unknown_func', 'type_mismatch', 'redeclaration')
+
+NUMERIC_TYPES = ('int', 'double')
+
+
+# сгенерированная программа
+class Workload:
+
+    def __init__(self, source: str, error: Optional[str] = None, seed: int = 0,
+                 size: int = 0, depth: int = 0) -> None:
+        self.source = source
+        self.error = error
+        self.seed = seed
+        self.size = size
+        self.depth = depth
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+    def __str__(self) -> str:
+        return self.source
+
+
+# детерминированный генератор программ на поддерживаемом подмножестве C#
+class ProgramGenerator:
+    """Генерирует программы из объявлений переменных, арифметических цепочек,
+    вложенных if/for, функций и их вызовов. Одинаковые параметры и seed
+    всегда дают одинаковый текст программы.
+    """
+
+    def __init__(self, seed: int = 0, size: int = 100, depth: int = 3, block_size: int = 4,
+                 chain_length: int = 4, func_ratio: float = 0.3) -> None:
+        self.seed = seed
+        self.size = size
+        self.depth = depth
+        self.block_size = block_size
+        self.chain_length = chain_length
+        self.func_ratio = func_ratio
+
+    def generate(self, error: Optional[str] = None) -> Workload:
+        if error is not None and error not in ERROR_KINDS:
+            raise ValueError('Неизвестный вид ошибки {}'.format(error))
+        self._rnd = random.Random(self.seed)
+        self._counter = 0
+        # глобальные переменные и функции: имя -> тип / (тип возврата, типы параметров)
+        self._globals: List[Tuple[str, str]] = []
+        self._funcs: List[Tuple[str, str, Tuple[str, ...]]] = []
+        lines: List[str] = []
+
+        error_at = self._rnd.randrange(self.size) if error and self.size else 0
+        for i in range(self.size):
+            if i == error_at and error:
+                lines.extend(self._error_stmt(error))
+            r = self._rnd.random()
+            if r < self.func_ratio:
+                lines.extend(self._func())
+            elif r < self.func_ratio + (1 - self.func_ratio) / 2 or not self._globals:
+                lines.append(self._decl(self._globals, ''))
+            else:
+                lines.extend(self._stmt(list(self._globals), self.depth, '', None))
+        if error and not self.size:
+            lines.extend(self._error_stmt(error))
+        source = '\n'.join(lines) + '\n'
+        return Workload(source, error, self.seed, self.size, self.depth)
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return '{}{}'.format(prefix, self._counter)
+
+    def _literal(self, type_: str) -> str:
+        if type_ == 'int':
+            return str(self._rnd.randint(0, 100))
+        return '{}.{}'.format(self._rnd.randint(0, 100), self._rnd.randint(1, 9))
+
+    # операнд заданного типа: литерал, переменная или вызов функции
+    def _operand(self, scope: List[Tuple[str, str]], type_: str) -> str:
+        r = self._rnd.random()
+        vars_ = [name for name, t in scope if t == type_ or (type_ == 'double' and t == 'int')]
+        funcs = [f for f in self._funcs if f[1] == type_ or (type_ == 'double' and f[1] == 'int')]
+        if r < 0.15 and funcs:
+            name, _, params = self._rnd.choice(funcs)
+            args = ', '.join(self._chain(scope, p, 2) for p in params)
+            return '{}({})'.format(name, args)
+        if r < 0.6 and vars_:
+            return self._rnd.choice(vars_)
+        return self._literal(type_)
+
+    # арифметическая цепочка заданного типа
+    def _chain(self, scope: List[Tuple[str, str]], type_: str, length: Optional[int] = None) -> str:
+        length = self.chain_length if length is None else length
+        parts = [self._operand(scope, type_)]
+        for _ in range(self._rnd.randint(0, max(0, length - 1))):
+            op = self._rnd.choice(('+', '-', '*'))
+            operand = self._operand(scope, type_)
+            if self._rnd.random() < 0.2:
+                operand = '({} {} {})'.format(operand, self._rnd.choice(('+', '-')), self._operand(scope, type_))
+            parts.append(op)
+            parts.append(operand)
+        return ' '.join(parts)
+
+    def _cond(self, scope: List[Tuple[str, str]]) -> str:
+        cond = '{} {} {}'.format(self._chain(scope, 'double', 2), self._rnd.choice(('<', '>', '<=', '>=')),
+                                 self._chain(scope, 'double', 2))
+        if self._rnd.random() < 0.3:
+            cond += ' {} {} != {}'.format(self._rnd.choice(('&&', '||')), self._chain(scope, 'int', 2),
+                                          self._literal('int'))
+        return cond
+
+    def _decl(self, scope: List[Tuple[str, str]], indent: str) -> str:
+        type_ = self._rnd.choice(NUMERIC_TYPES)
+        name = self._name('v')
+        line = '{}{} {} = {};'.format(indent, type_, name, self._chain(scope, type_))
+        scope.append((name, type_))
+        return line
+
+    def _block(self, scope: List[Tuple[str, str]], depth: int, indent: str,
+               ret_type: Optional[str]) -> List[str]:
+        scope = list(scope)
+        lines = ['{}{{'.format(indent)]
+        for _ in range(self._rnd.randint(1, self.block_size)):
+            lines.extend(self._stmt(scope, depth, indent + '    ', ret_type))
+        lines.append('{}}}'.format(indent))
+        return lines
+
+    def _stmt(self, scope: List[Tuple[str, str]], depth: int, indent: str,
+              ret_type: Optional[str]) -> List[str]:
+        r = self._rnd.random()
+        if depth > 0 and r < 0.2:
+            lines = ['{}if ({})'.format(indent, self._cond(scope))]
+            lines.extend(self._block(scope, depth - 1, indent, ret_type))
+            if self._rnd.random() < 0.5:
+                lines.append('{}else'.format(indent))
+                lines.extend(self._block(scope, depth - 1, indent, ret_type))
+            return lines
+        if depth > 0 and r < 0.4:
+            var = self._name('i')
+            lines = ['{0}for (int {1} = 0; {1} < {2}; {1} = {1} + 1)'.format(indent, var, self._rnd.randint(1, 50))]
+            lines.extend(self._block(scope + [(var, 'int')], depth - 1, indent, ret_type))
+            return lines
+        if r < 0.7 or not scope:
+            return [self._decl(scope, indent)]
+        name, type_ = self._rnd.choice(scope)
+        return ['{}{} = {};'.format(indent, name, self._chain(scope, type_))]
+
+    def _func(self) -> List[str]:
+        ret_type = self._rnd.choice(NUMERIC_TYPES)
+        name = self._name('f')
+        params = tuple((self._name('p'), self._rnd.choice(NUMERIC_TYPES))
+                       for _ in range(self._rnd.randint(0, 3)))
+        scope = list(self._globals) + list(params)
+        lines = ['{} {}({})'.format(ret_type, name, ', '.join('{} {}'.format(t, n) for n, t in params)), '{']
+        for _ in range(self._rnd.randint(1, self.block_size)):
+            lines.extend(self._stmt(scope, self.depth, '    ', ret_type))
+        lines.append('    return {};'.format(self._chain(scope, ret_type)))
+        lines.append('}')
+        self._funcs.append((name, ret_type, tuple(t for _, t in params)))
+        return lines
+
+    def _error_stmt(self, error: str) -> List[str]:
+        if error == 'unknown_type':
+            return ['intt {} = 1;'.format(self._name('e'))]
+        if error == 'unknown_ident':
+            return ['int {} = {};'.format(self._name('e'), self._name('undefined'))]
+        if error == 'unknown_func':
+            return ['int {} = {}(1);'.format(self._name('e'), self._name('missing'))]
+        if error == 'type_mismatch':
+            return ['int {} = "text";'.format(self._name('e'))]
+        # redeclaration
+        if self._globals:
+            name, type_ = self._globals[0]
+        else:
+            name, type_ = self._name('e'), 'int'
+            self._globals.append((name, type_))
+            return ['int {0} = 1;'.format(name), 'int {0} = 2;'.format(name)]
+        return ['{} {} = {};'.format(type_, name, self._literal(type_))]
+
+
+# генерирует программу с заданными параметрами
+def generate(size: int = 100, depth: int = 3, seed: int = 0, error: Optional[str] = None, **kwargs) -> Workload:
+    return ProgramGenerator(seed=seed, size=size, depth=depth, **kwargs).generate(error)
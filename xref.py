@@ -0,0 +1,180 @@
+from typing import Dict, List, Optional, Tuple
+
+import semantic
+from ast_nodes import AstNode, IdentNode, FuncNode, StmtListNode
+from semantic import IdentDesc, IdentScope
+
+
+# виды вхождений идентификатора
+DECLARATION = 'declaration'
+REFERENCE = 'reference'
+CALL = 'call'
+
+
+# вхождение идентификатора в программу
+class Occurrence:
+
+    def __init__(self, ident: IdentDesc, node: IdentNode, kind: str, owner: Optional[IdentDesc]) -> None:
+        self.ident = ident
+        self.node = node
+        self.kind = kind
+        # функция, при проверке тела которой найдено вхождение (None - верхний уровень программы)
+        self.owner = owner
+
+    # позиция первого символа имени
+    @property
+    def row(self) -> Optional[int]:
+        return self.node.name_row
+
+    @property
+    def col(self) -> Optional[int]:
+        return self.node.name_col
+
+    def __str__(self) -> str:
+        return '{} {} ({}:{})'.format(self.kind, self.ident.name, self.row, self.col)
+
+
+# все известные сведения об идентификаторе
+class Symbol:
+
+    def __init__(self, ident: IdentDesc) -> None:
+        self.ident = ident
+        self.declaration: Optional[Occurrence] = None
+        self.references: List[Occurrence] = []
+
+
+# индекс перекрестных ссылок: объявление и все использования каждого идентификатора,
+# поиск вхождения по позиции в исходном коде за O(1)
+class XrefIndex:
+
+    def __init__(self) -> None:
+        self.symbols: Dict[IdentDesc, Symbol] = {}
+        self.functions: Dict[IdentDesc, FuncNode] = {}
+        # (строка, столбец) каждого символа имени -> вхождение
+        self._positions: Dict[Tuple[int, int], Occurrence] = {}
+        self._by_owner: Dict[Optional[IdentDesc], List[Occurrence]] = {}
+
+    @staticmethod
+    def _owner(scope: IdentScope) -> Optional[IdentDesc]:
+        func_scope = scope.curr_func
+        return func_scope.func if func_scope else None
+
+    def _add(self, occurrence: Occurrence) -> Occurrence:
+        self._by_owner.setdefault(occurrence.owner, []).append(occurrence)
+        row, col = occurrence.row, occurrence.col
+        if row is not None and col is not None:
+            for i in range(len(occurrence.ident.name)):
+                self._positions[(row, col + i)] = occurrence
+        return occurrence
+
+    def _remove(self, occurrence: Occurrence) -> None:
+        self._by_owner[occurrence.owner].remove(occurrence)
+        self._unmap(occurrence)
+
+    def _unmap(self, occurrence: Occurrence) -> None:
+        row, col = occurrence.row, occurrence.col
+        if row is not None and col is not None:
+            for i in range(len(occurrence.ident.name)):
+                if self._positions.get((row, col + i)) is occurrence:
+                    del self._positions[(row, col + i)]
+
+    def _symbol(self, ident: IdentDesc) -> Symbol:
+        symbol = self.symbols.get(ident)
+        if symbol is None:
+            symbol = self.symbols[ident] = Symbol(ident)
+        return symbol
+
+    def add_declaration(self, ident: IdentDesc, node: IdentNode, scope: IdentScope) -> None:
+        symbol = self._symbol(ident)
+        symbol.declaration = self._add(Occurrence(ident, node, DECLARATION, self._owner(scope)))
+
+    def add_function(self, ident: IdentDesc, func: FuncNode, scope: IdentScope) -> None:
+        self.functions[ident] = func
+        self.add_declaration(ident, func.name, scope)
+
+    def add_reference(self, ident: IdentDesc, node: IdentNode, scope: IdentScope, kind: str = REFERENCE) -> None:
+        symbol = self._symbol(ident)
+        # имя в объявлении переменной проверяется как обычный идентификатор
+        if symbol.declaration is not None and symbol.declaration.node is node:
+            return
+        symbol.references.append(self._add(Occurrence(ident, node, kind, self._owner(scope))))
+
+    def add_call(self, ident: IdentDesc, node: IdentNode, scope: IdentScope) -> None:
+        self.add_reference(ident, node, scope, CALL)
+
+    # вхождение идентификатора, которому принадлежит символ в позиции (строка, столбец)
+    def at(self, row: int, col: int) -> Optional[Occurrence]:
+        return self._positions.get((row, col))
+
+    # объявление идентификатора в позиции (переход к определению)
+    def definition_at(self, row: int, col: int) -> Optional[Occurrence]:
+        occurrence = self.at(row, col)
+        if occurrence is None:
+            return None
+        return self.symbols[occurrence.ident].declaration
+
+    # все использования идентификатора в позиции
+    def usages_at(self, row: int, col: int) -> List[Occurrence]:
+        occurrence = self.at(row, col)
+        if occurrence is None:
+            return []
+        return list(self.symbols[occurrence.ident].references)
+
+    def usages(self, ident: IdentDesc) -> List[Occurrence]:
+        symbol = self.symbols.get(ident)
+        return list(symbol.references) if symbol else []
+
+    # удаляет вхождения, найденные при проверке тела функции
+    def remove_owner(self, owner: IdentDesc) -> None:
+        removed = self._by_owner.pop(owner, [])
+        if not removed:
+            return
+        touched = set()
+        for occurrence in removed:
+            self._unmap(occurrence)
+            if occurrence.kind == DECLARATION:
+                # локальные переменные и параметры при повторной проверке объявляются заново
+                self.symbols.pop(occurrence.ident, None)
+            else:
+                touched.add(occurrence.ident)
+        for ident in touched:
+            symbol = self.symbols.get(ident)
+            if symbol is not None:
+                symbol.references = [r for r in symbol.references if r.owner is not owner]
+
+    # повторная проверка функции (например, после изменения ее тела) с обновлением только ее вхождений;
+    # func может быть новым узлом, заменяющим прежнее объявление функции с той же сигнатурой
+    def recheck_function(self, func: FuncNode, scope: IdentScope) -> None:
+        scope = scope.curr_global
+        ident = scope.idents.get(func.name.name)
+        if ident is None or ident not in self.functions:
+            func.semantic_check(scope)
+            return
+        if self.functions[ident] is not func:
+            if func.signature(scope) != ident.type:
+                func.name.semantic_error('Сигнатура функции {} изменилась, требуется полная проверка'.format(
+                    func.name.name
+                ))
+            func.name.node_type = ident.type
+            func.name.node_ident = ident
+            self.functions[ident] = func
+            symbol = self.symbols[ident]
+            self._remove(symbol.declaration)
+            symbol.declaration = self._add(Occurrence(ident, func.name, DECLARATION, None))
+        self.remove_owner(ident)
+        func.semantic_check(scope)
+
+
+# семантическая проверка программы с построением индекса перекрестных ссылок
+def build_index(prog: StmtListNode, scope: Optional[IdentScope] = None) -> Tuple[XrefIndex, IdentScope]:
+    if scope is None:
+        scope = semantic.prepare_global_scope()
+    index = XrefIndex()
+    scope.xref = index
+    prog.semantic_check(scope)
+    return index, scope
+
+
+def find_node(index: XrefIndex, row: int, col: int) -> Optional[AstNode]:
+    occurrence = index.at(row, col)
+    return occurrence.node if occurrence else None